@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Any
+from uuid import UUID
+from langchain_core.callbacks import AsyncCallbackHandler
+from logger import logger
+from chains import AnswerMode, CHAIN_DEFINITIONS, get_utility
+
+GRAPH_NODES = {"supervisor", "research", "post_processing"}
+
+
+class StageTimer(AsyncCallbackHandler):
+    """Records how long each graph node and named chain ran during one graph execution."""
+
+    def __init__(self):
+        self.timings = {}
+        self._started = {}
+
+    async def on_chain_start(self, serialized: dict, inputs: Any, *, run_id: UUID, name: str = None, **kwargs: Any):
+        if name in GRAPH_NODES or name in CHAIN_DEFINITIONS:
+            self._started[run_id] = (name, time.perf_counter())
+
+    async def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    async def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def _finish(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        if started:
+            name, start = started
+            # Summed, since map-reduce summarization runs the same chain several times
+            self.timings[name] = round(self.timings.get(name, 0.0) + time.perf_counter() - start, 4)
+
+
+def load_questions(path: str) -> list[str]:
+    """Reads questions from a .txt file (one per line) or a .jsonl file (question or user_input field).
+
+    Raises ValueError naming the line when a .jsonl row has no usable question.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("question") or record.get("user_input")
+                if not isinstance(line, str) or not line.strip():
+                    raise ValueError(f"{path}:{number}: row has no question or user_input text")
+            questions.append(line)
+    return questions
+
+
+async def run_batch(
+    questions: list[str],
+    output_path: str = "batch_results.jsonl",
+    concurrency: int = 8,
+    answer_mode: AnswerMode = AnswerMode.DOCUMENT,
+) -> list[dict]:
+    """Runs many questions through the research graph and writes one JSONL row per distinct question."""
+    from main import research_graph_executor  # imported lazily; main pulls in Chainlit
+
+    counts = {}
+    for question in questions:
+        question = question.strip()
+        counts[question] = counts.get(question, 0) + 1
+    unique = list(counts)
+    logger.info(f"Running {len(unique)} distinct questions ({len(questions)} total) with concurrency {concurrency}")
+
+    # One embedding call for the whole set; the graph runs then hit the query cache, which holds
+    # room for every question of the batch until it finishes
+    query_cache = get_utility().query_cache
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    with query_cache.reserve(len(unique)), open(output_path, "w", encoding="utf-8") as output:
+        await get_utility().aembed_queries(unique)
+        embed_seconds = time.perf_counter() - start
+
+        async def run_one(question: str):
+            async with semaphore:
+                timer = StageTimer()
+                state = {"user_query": question, "answer_mode": AnswerMode(answer_mode).value, "research_response": "", "final_response": ""}
+                started = time.perf_counter()
+                row = {"question": question, "occurrences": counts[question], "answer_mode": AnswerMode(answer_mode).value}
+                try:
+                    final_state = await research_graph_executor.ainvoke(state, config={"callbacks": [timer]})
+                    row.update(answer=final_state.get("final_response"), research_response=final_state.get("research_response"), error=None)
+                except Exception as e:
+                    logger.error(f"Question failed: {question}: {str(e)}")
+                    row.update(answer=None, research_response=None, error=str(e))
+                row["seconds"] = round(time.perf_counter() - started, 4)
+                row["timings"] = timer.timings
+                output.write(json.dumps(row, ensure_ascii=False) + "\n")
+                output.flush()
+                results.append(row)
+
+        await asyncio.gather(*(run_one(question) for question in unique))
+
+    total = time.perf_counter() - start
+    failed = sum(1 for row in results if row["error"])
+    logger.info(f"Batch finished in {total:.1f}s (query embedding {embed_seconds:.2f}s), {failed} failed, results in {output_path}")
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a batch of questions (e.g. a RAGAS eval set) through the research graph.")
+    parser.add_argument("questions", help=".txt with one question per line or .jsonl with a question/user_input field")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--answer-mode", choices=[mode.value for mode in AnswerMode], default=AnswerMode.DOCUMENT.value)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.questions):
+        raise SystemExit(f"Questions file not found: {args.questions}")
+    try:
+        questions = load_questions(args.questions)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    await run_batch(questions, args.output, args.concurrency, AnswerMode(args.answer_mode))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import time
+import asyncio
+import argparse
+import statistics
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.runnables import RunnableLambda
+from logger import logger
+from chains import AnswerMode, run_research_vector_store_node
+
+QUESTIONS = [
+    "What specific therapeutic activities and exercises have been shown to be most effective in treating chronic tennis elbow",
+    "Are eccentric exercises better than isometric exercises for lateral epicondylitis?",
+    "Does mobilization with movement reduce pain in tennis elbow?",
+]
+
+
+class UsageCollector(AsyncCallbackHandler):
+    """Sums LLM calls and token usage reported by the chat model."""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def on_llm_end(self, response, **kwargs):
+        self.llm_calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+
+
+async def measure(question: str, answer_mode: AnswerMode) -> dict:
+    usage = UsageCollector()
+    start = time.perf_counter()
+    async def run_node(q: str) -> str:
+        return await run_research_vector_store_node(q, answer_mode)
+
+    # Wrapping the node in a runnable lets the callbacks reach every chain it calls
+    await RunnableLambda(run_node).ainvoke(question, config={"callbacks": [usage]})
+    return {
+        "seconds": time.perf_counter() - start,
+        "llm_calls": usage.llm_calls,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare latency and token usage of the document and chunk answer modes.")
+    parser.add_argument("--offline", action="store_true", help="use fake backends instead of OpenAI and Qdrant Cloud")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.offline:
+        from fakes import use_offline_backends, seed_matching_chunk
+        use_offline_backends(chat_latency=0.3)
+        for question in QUESTIONS:
+            seed_matching_chunk(question)
+
+    for answer_mode in AnswerMode:
+        samples = [await measure(question, answer_mode) for _ in range(args.runs) for question in QUESTIONS]
+        logger.info(
+            f"{answer_mode.value}: "
+            f"median {statistics.median(s['seconds'] for s in samples):.2f}s, "
+            f"max {max(s['seconds'] for s in samples):.2f}s, "
+            f"llm calls/query {statistics.mean(s['llm_calls'] for s in samples):.1f}, "
+            f"input tokens/query {statistics.mean(s['input_tokens'] for s in samples):.0f}, "
+            f"output tokens/query {statistics.mean(s['output_tokens'] for s in samples):.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
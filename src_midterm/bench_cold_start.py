@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from logger import logger
+
+# Runs in a fresh interpreter so every sample is a true cold start
+PROBE = """
+import json, time, asyncio
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+ready = imported
+if {warm_up}:
+    from chains import warm_up
+    asyncio.run(warm_up())
+    ready = time.perf_counter()
+print(json.dumps({{"import_s": imported - start, "ready_s": ready - start}}))
+"""
+
+# Builds the lazy resources without configure(), from two threads at once; a factory that
+# fetches another resource (get_qdrant -> get_utility, chains -> models) must not deadlock
+RESOLVE_PROBE = """
+import json, time, threading
+import chains
+start = time.perf_counter()
+threads = [threading.Thread(target=chains.get_chain, args=("final_chain",)) for _ in range(2)]
+threads += [threading.Thread(target=chains.get_qdrant) for _ in range(2)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+chains.get_lexical_index()
+print(json.dumps({"resolve_s": time.perf_counter() - start}))
+"""
+
+
+def measure_cold_start(module: str = "main", warm_up: bool = False) -> dict:
+    """Measures import and import-to-ready time of a module in a fresh interpreter."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, warm_up=warm_up)],
+        cwd=current_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_resource_resolution(timeout: float = 20.0) -> dict:
+    """Resolves get_qdrant()/get_chain() cold in a fresh interpreter; raises if it hangs.
+
+    Uses the in-memory vector store and a placeholder API key, since nothing is sent.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "VECTOR_BACKEND": "memory", "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "sk-cold-start-check"}
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", RESOLVE_PROBE], cwd=current_dir, env=env, capture_output=True, text=True, check=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Resolving lazy resources hung for more than {timeout}s (lock held across a nested factory?)")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import-to-ready time of the app.")
+    parser.add_argument("--module", default="main", help="module to import (main or chains)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="also run warm_up() (needs API keys and network)")
+    parser.add_argument("--skip-resolve-check", action="store_true", help="skip the cold get_qdrant()/get_chain() check")
+    args = parser.parse_args()
+
+    if not args.skip_resolve_check:
+        logger.info(f"Cold resource resolution: {check_resource_resolution()['resolve_s']:.3f}s")
+
+    samples = [measure_cold_start(args.module, args.warm_up) for _ in range(args.runs)]
+    for key in ("import_s", "ready_s"):
+        values = [sample[key] for sample in samples]
+        logger.info(
+            f"{args.module} {key}: min={min(values):.3f}s median={statistics.median(values):.3f}s max={max(values):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
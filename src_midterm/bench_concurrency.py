@@ -0,0 +1,65 @@
+import time
+import asyncio
+import argparse
+from logger import logger
+from fakes import FakeChatModel, use_offline_backends, seed_matching_chunk
+import chains
+
+QUESTION = "What specific therapeutic activities and exercises have been shown to be most effective in treating chronic tennis elbow"
+
+
+async def run_session(executor, session: int) -> tuple[float, float]:
+    start = time.perf_counter()
+    await executor.ainvoke({"user_query": f"{QUESTION}", "research_response": "", "final_response": ""})
+    return start, time.perf_counter()
+
+
+def max_overlap(spans: list[tuple[float, float]]) -> int:
+    """Largest number of (start, end) intervals in progress at the same moment."""
+    events = sorted([(start, 1) for start, _ in spans] + [(end, -1) for _, end in spans])
+    current = best = 0
+    for _, delta in events:
+        current += delta
+        best = max(best, current)
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Show that concurrent sessions overlap instead of blocking each other.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--chat-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    use_offline_backends(chat_latency=args.chat_latency, embed_latency=args.embed_latency)
+    llm = FakeChatModel(latency=args.chat_latency)
+    chains.configure(llm=llm)
+    seed_matching_chunk(QUESTION)
+    from main import research_graph_executor  # imported after configure() so nothing real is built
+
+    # The first session summarizes the PDF and fills the caches; only warm sessions are compared
+    await run_session(research_graph_executor, 0)
+    single_start, single_end = await run_session(research_graph_executor, 0)
+    single = single_end - single_start
+
+    llm.calls.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(research_graph_executor, i) for i in range(args.sessions)))
+    total = time.perf_counter() - start
+
+    # Session start/end stamps overlap trivially under gather; the model calls show whether the
+    # sessions were really waiting on the backend at the same time
+    overlap = max_overlap(llm.calls)
+    speedup = (single * args.sessions) / total
+    logger.info(
+        f"warm single session: {single:.3f}s, {args.sessions} sessions: {total:.3f}s, speedup x{speedup:.1f}, "
+        f"max model calls in flight: {overlap} ({len(llm.calls)} calls)"
+    )
+
+    # A blocking call anywhere on the request path serializes the sessions and kills the speedup
+    if overlap < args.sessions / 2 or speedup < args.sessions / 2:
+        raise SystemExit("Sessions did not overlap: something on the request path blocks the event loop")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
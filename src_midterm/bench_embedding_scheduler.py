@@ -0,0 +1,113 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from langchain_openai import OpenAIEmbeddings
+from logger import logger
+from embedding_scheduler import EmbeddingScheduler
+from stub_openai_server import StubState, start_stub_server
+
+
+def build_texts(count: int, seed: int = 3) -> list[str]:
+    """Chunk-sized synthetic texts (~1000 characters each)."""
+    rng = random.Random(seed)
+    words = [f"term{i}" for i in range(5000)]
+    return [" ".join(rng.choice(words) for _ in range(110)) for _ in range(count)]
+
+
+def make_client(base_url: str) -> OpenAIEmbeddings:
+    # No SDK retries, like UtilityOpenAI; the ctx-length check would need tiktoken files offline
+    return OpenAIEmbeddings(
+        api_key="stub", base_url=base_url, max_retries=0, chunk_size=2048, check_embedding_ctx_length=False
+    )
+
+
+async def run_unscheduled(client: OpenAIEmbeddings, batches: list[list[str]]) -> dict:
+    """The old path: batches sent one after another, the first 429 aborts the ingest."""
+    start = time.perf_counter()
+    done = 0
+    error = None
+    for batch in batches:
+        try:
+            await client.aembed_documents(batch)
+        except Exception as e:
+            error = type(e).__name__
+            break
+        done += 1
+    return {"batches_done": done, "batches": len(batches), "aborted_by": error, "seconds": round(time.perf_counter() - start, 2)}
+
+
+async def run_scheduled(client: OpenAIEmbeddings, batches: list[list[str]], args) -> dict:
+    scheduler = EmbeddingScheduler(
+        client.embed_documents,
+        client.aembed_documents,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_concurrency=args.concurrency,
+        max_retries=args.max_retries,
+        base_delay=0.1,
+    )
+    start = time.perf_counter()
+    vectors = await scheduler.aembed_batches([(batch, sum(len(text) for text in batch) // 4) for batch in batches])
+    seconds = time.perf_counter() - start
+    return {
+        "vectors": len(vectors),
+        "seconds": round(seconds, 2),
+        "batches_per_s": round(len(batches) / seconds, 2),
+        "tokens_per_s": round(scheduler.tokens_sent / seconds, 1),
+        **scheduler.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding scheduler vs plain sequential requests against a stub that injects 429s and latency.")
+    parser.add_argument("--texts", type=int, default=4000)
+    parser.add_argument("--batch-items", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.15, help="share of requests the stub answers 429")
+    parser.add_argument("--retry-after", type=float, default=0.3)
+    parser.add_argument("--error-ratio", type=float, default=0.05, help="share of requests the stub answers 500")
+    parser.add_argument("--rpm", type=int, default=3000)
+    parser.add_argument("--tpm", type=int, default=1_000_000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=8)
+    args = parser.parse_args()
+
+    texts = build_texts(args.texts)
+    batches = [texts[start:start + args.batch_items] for start in range(0, len(texts), args.batch_items)]
+    report = {"config": vars(args)}
+
+    for mode in ("unscheduled", "scheduled"):
+        state = StubState(
+            dim=64,
+            latency=args.latency_ms / 1000,
+            jitter=args.latency_ms / 2500,
+            rate_limit_ratio=args.rate_limit_ratio,
+            retry_after=args.retry_after,
+            error_ratio=args.error_ratio,
+        )
+        server = start_stub_server(state)
+        client = make_client(f"http://127.0.0.1:{server.server_port}/v1")
+        try:
+            if mode == "unscheduled":
+                result = asyncio.run(run_unscheduled(client, batches))
+            else:
+                result = asyncio.run(run_scheduled(client, batches, args))
+        finally:
+            server.shutdown()
+        result["stub"] = state.stats()
+        report[mode] = result
+
+    scheduled = report["scheduled"]
+    # Every text embedded exactly once: failed batches were retried, successful ones never re-sent
+    scheduled["each_text_embedded_once"] = scheduled["stub"]["inputs_embedded"] == len(texts) == scheduled["vectors"]
+    print(json.dumps(report, indent=2))
+    logger.info(
+        f"Unscheduled stopped after {report['unscheduled']['batches_done']}/{len(batches)} batches; "
+        f"scheduled finished {len(batches)} batches in {scheduled['seconds']}s with {scheduled['retries']} retries"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from logger import logger
+from fakes import use_offline_backends
+from batch_query import StageTimer
+from metrics import record_spans
+import chains
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pdfs")
+FALLBACK_QUESTIONS = [
+    "How should a splint be fitted for carpal tunnel syndrome?",
+    "What home exercises help after a distal radius fracture?",
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p90/p99 and max of a list of latencies, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 2), "n": len(ordered)}
+
+
+def build_corpus(scale: int) -> str:
+    """Copies the bundled PDFs into a temp dir, scale times; each copy is a separate document under its own name."""
+    corpus_dir = tempfile.mkdtemp(prefix="offline_corpus_")
+    for pdf_file in sorted(f for f in os.listdir(PDF_DIR) if f.lower().endswith(".pdf")):
+        for copy in range(scale):
+            name = pdf_file if copy == 0 else f"{pdf_file[:-4]} (copy {copy}).pdf"
+            target = os.path.join(corpus_dir, name)
+            shutil.copyfile(os.path.join(PDF_DIR, pdf_file), target)
+    return corpus_dir
+
+
+def peak_rss_mb() -> dict:
+    if resource is None:
+        return {}
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    return {
+        "self_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def sample_chunk_questions(count: int) -> list[str]:
+    """Uses stored chunk texts as questions; with the hash-seeded embedder only exact text matches score highly."""
+    points, _ = chains.get_qdrant().client.scroll(collection_name=chains.COLLECTION_NAME, limit=500, with_payload=True)
+    texts = [point.payload["chunk_text"] for point in points if "chunk_text" in point.payload]
+    random.Random(42).shuffle(texts)
+    return texts[:count]
+
+
+async def timed(coroutine_fn, *args) -> tuple[float, dict, dict]:
+    """Latency, chain/node timings and per-stage span totals (embedding, qdrant, ...) of one call."""
+    timer = StageTimer()
+    with record_spans() as recorded:
+        start = time.perf_counter()
+        await coroutine_fn(*args, timer)
+        seconds = time.perf_counter() - start
+    return seconds, timer.timings, {stage: sum(values) for stage, values in recorded.items()}
+
+
+async def run_node(question: str, answer_mode: chains.AnswerMode, timer: StageTimer):
+    from langchain_core.runnables import RunnableLambda
+
+    async def node(q: str) -> str:
+        return await chains.run_research_vector_store_node(q, answer_mode)
+
+    await RunnableLambda(node).ainvoke(question, config={"callbacks": [timer]})
+
+
+async def run_graph(question: str, answer_mode: chains.AnswerMode, timer: StageTimer):
+    from main import research_graph_executor
+
+    state = {"user_query": question, "answer_mode": answer_mode.value, "research_response": "", "final_response": ""}
+    await research_graph_executor.ainvoke(state, config={"callbacks": [timer]})
+
+
+async def benchmark(args) -> dict:
+    use_offline_backends(chat_latency=args.chat_latency, embed_latency=args.embed_latency)
+    corpus_dir = build_corpus(args.scale)
+    report = {"config": vars(args)}
+    tracemalloc.start()
+
+    try:
+        # Ingest
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        ingest = await chains.load_documents(chains.COLLECTION_NAME, chains.get_utility(), args.summarize, corpus_dir)
+        ingest["seconds"] = round(time.perf_counter() - start, 3)
+        ingest["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        report["load_documents"] = ingest
+
+        questions = sample_chunk_questions(args.queries) + FALLBACK_QUESTIONS
+        for name, fn in (("run_research_vector_store_node", run_node), ("run_graph", run_graph)):
+            for answer_mode in chains.AnswerMode:
+                tracemalloc.reset_peak()
+                latencies, stages, spans = [], {}, {}
+                for question in questions:
+                    seconds, timings, span_totals = await timed(fn, question, answer_mode)
+                    latencies.append(seconds)
+                    for stage, stage_seconds in timings.items():
+                        stages.setdefault(stage, []).append(stage_seconds)
+                    for stage, stage_seconds in span_totals.items():
+                        spans.setdefault(stage, []).append(stage_seconds)
+                report[f"{name}[{answer_mode.value}]"] = {
+                    "latency": percentiles(latencies),
+                    "stages": {stage: percentiles(values) for stage, values in stages.items()},
+                    # Embedding, Qdrant and other spans below the chain level, summed per question
+                    "spans": {stage: percentiles(values) for stage, values in sorted(spans.items())},
+                    "peak_traced_mb": round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1),
+                }
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report["process"] = peak_rss_mb()
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lists p90 latencies and ingest throughput that regressed by more than tolerance."""
+    regressions = []
+    for key, section in report.items():
+        old = baseline.get(key)
+        if not isinstance(section, dict) or not isinstance(old, dict):
+            continue
+        if "latency" in section and old.get("latency"):
+            new_p90, old_p90 = section["latency"]["p90_ms"], old["latency"]["p90_ms"]
+            if new_p90 > old_p90 * (1 + tolerance):
+                regressions.append(f"{key} p90 {old_p90}ms -> {new_p90}ms")
+        for rate in ("pages_per_s", "chunks_per_s", "vectors_per_s"):
+            if rate in section and old.get(rate) and section[rate] < old[rate] * (1 - tolerance):
+                regressions.append(f"{key} {rate} {old[rate]} -> {section[rate]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with fake OpenAI backends and in-memory Qdrant.")
+    parser.add_argument("--scale", type=int, default=1, help="copies of each bundled PDF to ingest")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--summarize", action="store_true", help="precompute summaries during ingest")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import time
+import argparse
+from qdrant_client.models import PointStruct, SearchParams, CollectionStatus
+from logger import logger
+from qdrant import UtilityQdrant, Quantization
+from utils_openai import UtilityOpenAI
+from batch_query import load_questions
+from bench_offline import percentiles
+
+# Bytes per stored vector in RAM for each mode (binary packs 8 dimensions per byte)
+BYTES_PER_DIM = {Quantization.NONE: 4, Quantization.SCALAR: 1, Quantization.BINARY: 1 / 8}
+
+
+def copy_collection(source: UtilityQdrant, target: UtilityQdrant, batch_size: int = 256) -> int:
+    """Copies every point of source into target, then waits for target's quantized index to be built."""
+    copied, offset = 0, None
+    while True:
+        points, offset = source.client.scroll(
+            collection_name=source.COLLECTION_NAME, limit=batch_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        if points:
+            target.client.upsert(
+                collection_name=target.COLLECTION_NAME,
+                points=[PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points],
+            )
+            copied += len(points)
+        if offset is None:
+            break
+
+    while target.client.get_collection(target.COLLECTION_NAME).status != CollectionStatus.GREEN:
+        time.sleep(0.5)
+    return copied
+
+
+def query_ids(store: UtilityQdrant, vector: list[float], top_k: int, exact: bool = False) -> list:
+    params = SearchParams(exact=True) if exact else store.search_params
+    points = store.client.query_points(
+        collection_name=store.COLLECTION_NAME, query=vector, limit=top_k, search_params=params
+    ).points
+    return [point.id for point in points]
+
+
+def benchmark(args) -> dict:
+    utility = UtilityOpenAI()
+    dim = utility.get_embedding_dimension()
+    source = UtilityQdrant(args.collection, dim)
+    vectors = utility.embed_queries(load_questions(args.questions))
+    point_count = source.client.count(args.collection).count
+
+    # Ground truth is an exact (brute-force) search over the full-precision source collection
+    truth = [query_ids(source, vector, args.top_k, exact=True) for vector in vectors]
+    report = {"collection": args.collection, "points": point_count, "queries": len(vectors), "top_k": args.top_k, "modes": {}}
+
+    for mode in args.modes:
+        quantization = Quantization(mode)
+        name = f"{args.collection}_bench_{mode}"
+        store = UtilityQdrant(name, dim, quantization=quantization, oversampling=args.oversampling)
+        try:
+            copy_collection(source, store)
+            latencies, recalls, top1 = [], [], 0
+            for vector, expected in zip(vectors, truth):
+                start = time.perf_counter()
+                found = query_ids(store, vector, args.top_k)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(set(found) & set(expected)) / max(1, len(expected)))
+                top1 += bool(found and expected and found[0] == expected[0])
+
+            report["modes"][mode] = {
+                "oversampling": store.oversampling,
+                "recall_at_k": round(sum(recalls) / max(1, len(recalls)), 4),
+                "top1_agreement": round(top1 / max(1, len(vectors)), 4),
+                "latency": percentiles(latencies),
+                "vector_ram_mb": round(point_count * dim * BYTES_PER_DIM[quantization] / 1024 / 1024, 2),
+            }
+            logger.info(f"{mode}: {report['modes'][mode]}")
+        finally:
+            if not args.keep:
+                store.client.delete_collection(name)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of quantized Qdrant search against exact search.")
+    parser.add_argument("questions", nargs="?", help="questions to search with, .txt (one per line) or .jsonl")
+    parser.add_argument("--collection", default="qt_document_collection")
+    parser.add_argument("--modes", nargs="+", default=[mode.value for mode in Quantization], choices=[mode.value for mode in Quantization])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, help="override the per-mode default")
+    parser.add_argument("--keep", action="store_true", help="keep the copied bench collections")
+    parser.add_argument("--migrate", choices=[mode.value for mode in Quantization], help="migrate --collection in place to this mode and exit")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    if args.migrate:
+        UtilityQdrant(args.collection, UtilityOpenAI().get_embedding_dimension(), quantization=Quantization(args.migrate))
+        return
+    if not args.questions:
+        parser.error("a questions file is required unless --migrate is given")
+
+    report = benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from logger import logger
+from queries import SQLQueries
+from bench_offline import percentiles
+
+
+class SharedConnection:
+    """The old access pattern: one rollback-journal connection shared by every thread.
+
+    The lock is the least it takes to make that safe, which is what serializes readers
+    behind a writer's transaction.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        for query in (SQLQueries.CREATE_INGEST_STATE_TABLE, SQLQueries.CREATE_SUMMARY_TABLE):
+            self.connection.execute(query)
+        self.connection.commit()
+
+    def write_batch(self, rows: list[tuple], hold: float = 0.0):
+        with self.lock:
+            for row in rows:
+                self.connection.execute(SQLQueries.UPSERT_INGEST_STATE, row)
+            time.sleep(hold)
+            self.connection.commit()
+
+    def read(self, document_name: str):
+        with self.lock:
+            return self.connection.execute(SQLQueries.GET_INGEST_STATE, (document_name,)).fetchone()
+
+
+class PerThreadConnections:
+    """The new access layer: per-thread WAL connections with explicit transactions."""
+
+    def __init__(self, path: str):
+        from database import Database
+
+        self.db = Database(path)
+        if self.db.db_path != path:
+            raise RuntimeError("Database was already opened on another path in this process.")
+        with self.db.transaction():
+            self.db.execute(SQLQueries.CREATE_INGEST_STATE_TABLE)
+            self.db.execute(SQLQueries.CREATE_SUMMARY_TABLE)
+
+    def write_batch(self, rows: list[tuple], hold: float = 0.0):
+        with self.db.transaction():
+            for row in rows:
+                self.db.execute(SQLQueries.UPSERT_INGEST_STATE, row)
+            time.sleep(hold)
+
+    def read(self, document_name: str):
+        return self.db.fetchone(SQLQueries.GET_INGEST_STATE, (document_name,))
+
+
+def run(store, readers: int, seconds: float, write_batch: int, hold: float, interval: float) -> dict:
+    """One writer upserting ingest checkpoints in batches while readers look them up."""
+    stop = threading.Event()
+    read_latencies = [[] for _ in range(readers)]
+    writes = [0]
+
+    def writer():
+        batch_number = 0
+        while not stop.is_set():
+            rows = [(f"doc-{batch_number}-{i}.pdf", f"id-{batch_number}-{i}", "hash", 4) for i in range(write_batch)]
+            store.write_batch(rows, hold)
+            writes[0] += len(rows)
+            batch_number += 1
+
+    def reader(samples: list):
+        number = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            store.read(f"doc-{number}-0.pdf")
+            samples.append(time.perf_counter() - start)
+            number += 1
+            time.sleep(interval)  # a session does other work between catalog lookups
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(samples,)) for samples in read_latencies]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    reads = [sample for samples in read_latencies for sample in samples]
+    return {
+        "reads_per_s": round(len(reads) / seconds, 1),
+        "writes_per_s": round(writes[0] / seconds, 1),
+        "read_latency": percentiles(reads),
+        "reads_over_1ms": round(sum(sample > 0.001 for sample in reads) / max(1, len(reads)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reader latency under concurrent ingest writes, old shared connection vs per-thread WAL.")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--write-batch", type=int, default=500, help="checkpoint rows per write transaction")
+    parser.add_argument("--reader-interval-ms", type=float, default=1.0)
+    parser.add_argument("--hold-ms", type=float, default=5.0, help="extra time each write transaction stays open, standing in for fsync on a real disk")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="sqlite_contention_")
+    report = {"config": vars(args)}
+    timing = (args.readers, args.seconds, args.write_batch, args.hold_ms / 1000, args.reader_interval_ms / 1000)
+    report["shared_connection"] = run(SharedConnection(os.path.join(directory, "shared.db")), *timing)
+    report["per_thread_wal"] = run(PerThreadConnections(os.path.join(directory, "wal.db")), *timing)
+    print(json.dumps(report, indent=2))
+
+    old_p99 = report["shared_connection"]["read_latency"]["p99_ms"]
+    new_p99 = report["per_thread_wal"]["read_latency"]["p99_ms"]
+    logger.info(f"Reader p99: {old_p99}ms shared connection vs {new_p99}ms per-thread WAL")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,137 @@ from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI  # Might need to remove if we create our own model
 from logger import logger
-from qdrant import UtilityQdrant
+from metrics import span
+from qdrant import UtilityQdrant, merge_chunks, point_id, payload_matches, DOCUMENT_FIELDS, LINKED_POINTS
+from vector_index import create_vector_store
+from lexical_index import LexicalIndex, as_search_results, fuse_results
+from dedupe import NearDuplicateIndex
 from utils_openai import UtilityOpenAI
 from langchain_core.tools import tool
+from langchain_core.callbacks.manager import adispatch_custom_event
 from typing import Annotated, Dict, List, Tuple, Union
 import asyncio
-from document_loader import get_pdf_files, chunk_pdf_document, get_pdf_metadata, load_pdf
+import threading
+import time
+from document_loader import load_pdf, iter_pdf_pages
+from token_chunker import get_token_counter
+from summarizer import map_reduce_summarize, iter_text_batches
+from ingestion import IngestionPipeline
+from repository import DocumentRepository, AsyncDocumentRepository
 
 load_dotenv()
 
 COLLECTION_NAME = "qt_document_collection"
 SEARCH_SCORE = 0.5
+# Lexical confidence (idf share of the query the top chunk covers, with a clear lead over other
+# documents) above which retrieval skips the embedding call; set above 1 to always go hybrid
+LEXICAL_FAST_PATH_CONFIDENCE = float(os.getenv("LEXICAL_FAST_PATH_CONFIDENCE", "0.8"))
+# Skip embedding chunks that nearly repeat an already embedded chunk; set to 0 to embed every chunk
+DEDUPE_CHUNKS = os.getenv("DEDUPE_CHUNKS", "1") == "1"
 dir = "data/pdfs"
 
-# Initialize OpenAI Utility
-utility = UtilityOpenAI()
-embedding_dim = utility.get_embedding_dimension()
+# Clients are created on first use so importing this module never touches the network
+_resources = {}
+_resources_lock = threading.Lock()  # guards _resources and _resource_locks, never held while building
+_resource_locks = {}  # name -> lock held while that one resource is built
+
+
+def _get_resource(name: str, factory):
+    """Returns a shared resource, building it once on first use.
+
+    Each resource is built under its own lock, so a factory can fetch the resources it
+    depends on (get_qdrant needs the utility, chains need the models) without deadlocking.
+    """
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+    with _resources_lock:
+        lock = _resource_locks.setdefault(name, threading.Lock())
+    with lock:
+        resource = _resources.get(name)
+        if resource is None:
+            resource = factory()
+            with _resources_lock:
+                _resources[name] = resource
+    return resource
+
+
+def configure(
+    utility: UtilityOpenAI = None,
+    qdrant: UtilityQdrant = None,
+    llm=None,
+    summarization_llm=None,
+    repository=None,
+    lexical_index=None,
+    dedupe_index=None,
+):
+    """Swaps in specific clients (e.g. offline fakes for benchmarks) before first use."""
+    overrides = {
+        "utility": utility,
+        "qdrant": qdrant,
+        "llm_instance": llm,
+        "summarization_llm": summarization_llm or llm,
+        "repository": repository,
+        "lexical_index": lexical_index,
+        "dedupe_index": dedupe_index,
+    }
+    with _resources_lock:
+        for name, resource in overrides.items():
+            if resource is not None:
+                _resources[name] = resource
+        # Chains are rebuilt against the new models on next use
+        for name in CHAIN_DEFINITIONS:
+            _resources.pop(name, None)
+
+
+def get_utility() -> UtilityOpenAI:
+    """Returns the shared OpenAI embedding utility."""
+    return _get_resource("utility", UtilityOpenAI)
+
+
+def get_qdrant() -> UtilityQdrant:
+    """Returns the shared vector store (Qdrant or the local index, per VECTOR_BACKEND), created on first use."""
+    return _get_resource(
+        "qdrant", lambda: create_vector_store(COLLECTION_NAME, get_utility().get_embedding_dimension(), SEARCH_SCORE)
+    )
+
+
+async def aget_qdrant() -> UtilityQdrant:
+    """get_qdrant for async callers; the first call's collection check runs off the event loop."""
+    if "qdrant" in _resources:
+        return _resources["qdrant"]
+    return await asyncio.to_thread(get_qdrant)
+
+
+def _build_lexical_index() -> LexicalIndex:
+    index = LexicalIndex()
+    if not len(index):
+        # First run against an already ingested collection: index what the vector store holds
+        index.add_points((point, payload) for point, payload, _ in get_qdrant().scroll_points())
+        logger.info(f"Built lexical index from the vector store ({len(index)} chunks)")
+    return index
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Returns the shared BM25 index, backfilled from the vector store on first use."""
+    return _get_resource("lexical_index", _build_lexical_index)
+
+
+async def aget_lexical_index() -> LexicalIndex:
+    """get_lexical_index for async callers; a first-use backfill runs off the event loop."""
+    if "lexical_index" in _resources:
+        return _resources["lexical_index"]
+    return await asyncio.to_thread(get_lexical_index)
+
 
-# Initialize Qdrant
-qdrant = UtilityQdrant(COLLECTION_NAME, embedding_dim, SEARCH_SCORE)
+def get_dedupe_index() -> NearDuplicateIndex:
+    """Returns the shared near-duplicate chunk index used during ingestion."""
+    return _get_resource("dedupe_index", NearDuplicateIndex)
+
+
+def get_repository() -> DocumentRepository:
+    """Returns the shared document catalog repository."""
+    return _get_resource("repository", DocumentRepository)
 
 
 class LLMToUse(Enum):
@@ -34,6 +146,20 @@ class LLMToUse(Enum):
 # Initialize the LLM choice
 llm_to_use = LLMToUse.gpt_4o_mini
 
+class AnswerMode(Enum):
+    DOCUMENT = "document"  # summarize the best matching document, then answer
+    CHUNKS = "chunks"  # answer straight from the retrieved chunks in one LLM call
+
+
+CHUNK_TOP_K = 5
+CHUNK_NEIGHBORS = 1  # chunks on each side of a hit pulled in for context
+CHUNK_CONTEXT_TOKENS = 3000
+
+# Bump when the summarization prompt changes so stored summaries are regenerated
+SUMMARY_VERSION = f"v2:{llm_to_use.value}"
+SUMMARY_PAGES_PER_BATCH = 8
+SUMMARY_MAX_CONCURRENCY = 4
+
 
 ot_user_prompt = ChatPromptTemplate.from_messages(
     [
@@ -105,6 +231,34 @@ format_final_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
+chunk_answer_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """You are an occupational therapist providing accurate, evidence-based answers.
+            Answer the user's query using only the document excerpts below. Each excerpt is labelled with its document title and file name.
+            If the excerpts do not contain the answer, respond with: "I don't know."
+            Include the title and file name of the document(s) you used.
+
+            {context}
+            """,
+        ),
+        MessagesPlaceholder(variable_name="messages"),
+    ]
+)
+
+summary_reduce_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """The following are summaries of consecutive sections of one document. Combine them into a single summary
+            of the whole document while keeping all relevant details. Be concise but do not alter the meaning.
+            """,
+        ),
+        MessagesPlaceholder(variable_name="messages"),
+    ]
+)
+
 document_not_found_prompt = ChatPromptTemplate.from_messages(
     [
         (
@@ -120,15 +274,95 @@ document_not_found_prompt = ChatPromptTemplate.from_messages(
 @tool
 def search_qdrant(query: Annotated[str, "query to ask the retrieve information tool"]):
     """Search Qdrant for similar documents."""
-    query_vector = utility.create_embeddings_from_text([query])[0]
-    results = qdrant.search(COLLECTION_NAME, query_vector, 3)
+    query_vector = get_utility().embed_query(query)
+    results = get_qdrant().search(COLLECTION_NAME, query_vector, 3)
     return results  # Returns retrieved documents
 
+async def _document_links(document_id: str) -> dict:
+    """Chunk number -> canonical point id for the chunks of a document that were deduplicated."""
+    if not DEDUPE_CHUNKS or not document_id:
+        return {}
+    return await asyncio.to_thread(get_dedupe_index().document_links, document_id)
+
+
+async def _expand_document_filters(filters: dict = None) -> dict:
+    """Lets document_id/document_name filters match the canonical points of their deduplicated chunks."""
+    if not DEDUPE_CHUNKS or not filters or not any(key in filters for key in DOCUMENT_FIELDS):
+        return filters
+    linked = await asyncio.to_thread(get_dedupe_index().linked_points, filters.get("document_id"), filters.get("document_name"))
+    return {**filters, LINKED_POINTS: linked} if linked else filters
+
+
+async def _attribute_linked_hits(results: list, filters: dict = None) -> list:
+    """Presents hits on another document's canonical point as the filtered document's own linked chunk."""
+    if not filters or not filters.get(LINKED_POINTS):
+        return results
+    document_filters = {key: filters[key] for key in DOCUMENT_FIELDS if key in filters}
+    foreign = [
+        point_id(result["metadata"]["document_id"], result["metadata"]["chunk_number"])
+        for result in results
+        if isinstance(result["metadata"], dict) and not payload_matches(result["metadata"], document_filters)
+    ]
+    if not foreign:
+        return results
+    locations = await asyncio.to_thread(get_dedupe_index().linked_documents, foreign)
+
+    attributed = []
+    for result in results:
+        payload = result["metadata"]
+        if isinstance(payload, dict) and not payload_matches(payload, document_filters):
+            pid = point_id(payload["document_id"], payload["chunk_number"])
+            for document_id, document_name, chunk_number in locations.get(pid, ()):
+                if payload_matches({"document_id": document_id, "document_name": document_name}, document_filters):
+                    payload = {
+                        **payload, "document_id": document_id, "document_name": document_name,
+                        "chunk_number": chunk_number, "canonical_point_id": pid,
+                    }
+                    break
+        attributed.append({**result, "metadata": payload})
+    return attributed
+
+
+async def retrieve_documents(query: str, top_k: int = 3, filters: dict = None) -> list:
+    """Async retrieval used by the graph.
+
+    Queries the lexical index first and answers from it alone when it is confident, which
+    skips the embedding round trip; otherwise fuses lexical and dense results. Concurrent
+    questions share one embedding call. filters (see qdrant.build_filter) scope both searches
+    to indexed payload fields such as subject, tags or document_date; document_id and
+    document_name filters also match near-duplicate chunks stored under another document.
+    """
+    filters = await _expand_document_filters(filters)
+    lexical_index = await aget_lexical_index()
+    with span("lexical_search"):
+        lexical_hits = lexical_index.search(query, top_k * 2, filters)
+    confidence = LexicalIndex.confidence(lexical_hits)
+    if confidence >= LEXICAL_FAST_PATH_CONFIDENCE:
+        logger.debug("Lexical fast path (confidence %.2f)", confidence)
+        return await _attribute_linked_hits(as_search_results(lexical_hits[:top_k], confidence), filters)
+
+    with span("retrieval"):
+        query_vector = await get_utility().aembed_query(query)
+        qdrant = await aget_qdrant()
+        dense = await qdrant.asearch(COLLECTION_NAME, query_vector, top_k, filters)
+    return await _attribute_linked_hits(fuse_results(dense, lexical_hits, top_k), filters)
+
 async def get_document(document_name: Annotated[str, "retrieve the complete document tool"]):
     """Retrieve the complete document."""
     document = await load_pdf(dir, document_name)
     return document
 
+async def get_document_text(document_name: str, document_id: str = None) -> str:
+    """Returns the full text of a document, rebuilt from its stored chunks when possible."""
+    if document_id:
+        qdrant = await aget_qdrant()
+        text = await qdrant.areconstruct_document(document_id, await _document_links(document_id))
+        if text:
+            return text
+    # Points loaded before chunk text was stored (or with chunks missing) need the PDF re-parsed
+    document = await get_document(document_name)
+    return "".join(file.page_content for file in document)
+
 
 def init_model(llm_choice):
     if llm_choice == LLMToUse.gpt_4o_mini:
@@ -148,106 +382,313 @@ def use_llama_chain():
     pass
 
 
-# Initialize the LLM
-llm_instance = init_model(llm_to_use)
-summarization_llm = init_model(llm_to_use)
+def get_llm():
+    """Returns the shared chat model used for answering and formatting."""
+    return _get_resource("llm_instance", lambda: init_model(llm_to_use))
+
+
+def get_summarization_llm():
+    """Returns the chat model used for document summaries."""
+    return _get_resource("summarization_llm", lambda: init_model(llm_to_use))
+
+
+# Chain name -> (prompt, model getter); chains are composed on first use
+CHAIN_DEFINITIONS = {
+    "ot_user_chain": (ot_user_prompt, get_llm),
+    "summarization_chain": (summarization_prompt, get_summarization_llm),
+    "summary_reduce_chain": (summary_reduce_prompt, get_summarization_llm),
+    "final_chain": (final_prompt, get_llm),
+    "format_final_chain": (format_final_prompt, get_llm),
+    "document_not_found_chain": (document_not_found_prompt, get_llm),
+    "chunk_answer_chain": (chunk_answer_prompt, get_llm),
+}
+
+
+def get_chain(name: str):
+    """Returns one of the chains in CHAIN_DEFINITIONS."""
+    if name not in CHAIN_DEFINITIONS:
+        raise ValueError(f"Unknown chain: {name}")
+    prompt, get_model = CHAIN_DEFINITIONS[name]
+    # run_name makes each chain show up under its own name in callbacks and traces
+    return _get_resource(name, lambda: (prompt | get_model()).with_config(run_name=name))
+
+
+def __getattr__(name: str):
+    """Keeps the old module-level names working while building them lazily."""
+    if name in CHAIN_DEFINITIONS:
+        return get_chain(name)
+    if name == "utility":
+        return get_utility()
+    if name == "qdrant":
+        return get_qdrant()
+    if name == "embedding_dim":
+        return get_utility().get_embedding_dimension()
+    if name == "llm_instance":
+        return get_llm()
+    if name == "summarization_llm":
+        return get_summarization_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _warm_up_sync():
+    get_utility()
+    get_qdrant()  # lists/creates the collection
+    get_lexical_index()
+    for name in CHAIN_DEFINITIONS:
+        get_chain(name)
+
+
+async def warm_up():
+    """Builds every client up front; safe to call more than once."""
+    start = time.perf_counter()
+    await asyncio.to_thread(_warm_up_sync)
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+async def report_progress(stage: str, **data):
+    """Emits a progress event to whoever is streaming the graph; a no-op outside a graph run."""
+    try:
+        await adispatch_custom_event("progress", {"stage": stage, **data})
+    except RuntimeError:
+        pass  # not running inside a runnable, nobody is listening
+
+
+async def _summarize_section(text: str) -> str:
+    with span("summarization"):
+        summary = await get_chain("summarization_chain").ainvoke(
+            {"messages": [{"role": "system", "content": text}]}
+        )
+    return summary.content
+
+
+async def _combine_summaries(text: str) -> str:
+    with span("summarization"):
+        summary = await get_chain("summary_reduce_chain").ainvoke(
+            {"messages": [{"role": "system", "content": text}]}
+        )
+    return summary.content
+
+
+async def summarize_text(text: str) -> str:
+    """Summarizes a document's full text, map-reducing over sections when it is long."""
+    return await map_reduce_summarize(
+        iter_text_batches(text), _summarize_section, _combine_summaries, SUMMARY_MAX_CONCURRENCY
+    )
+
 
-# Define user chain with the LLM
-ot_user_chain = ot_user_prompt | llm_instance
-summarization_chain = summarization_prompt | summarization_llm
-final_chain = final_prompt | llm_instance
-format_final_chain = format_final_prompt | llm_instance
-document_not_found_chain = document_not_found_prompt | llm_instance
+async def summarize_pdf(document_name: str) -> str:
+    """Summarizes a PDF straight from the page stream; only a few page batches are in memory at once.
 
-async def run_research_vector_store_node(user_question: str) -> str:
+    iter_pdf_pages buffers pages for the parsed-document cache only up to its small cap.
+    """
+    page_batches = iter_pdf_pages(dir, document_name, SUMMARY_PAGES_PER_BATCH)
+
+    async def batch_texts():
+        async for pages in page_batches:
+            yield "".join(pages)
+
+    return await map_reduce_summarize(batch_texts(), _summarize_section, _combine_summaries, SUMMARY_MAX_CONCURRENCY)
+
+
+async def get_document_summary(document_name: str, document_id: str = None) -> str:
+    """Returns the stored summary of a document, generating and storing it on first use."""
+    repository = AsyncDocumentRepository(get_repository())
+    if document_id:
+        summary = await repository.get_summary(document_id, SUMMARY_VERSION)
+        if summary is not None:
+            return summary
+
+    await report_progress("summarization", document_name=document_name)
+    if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), dir, document_name)):
+        summary = await summarize_pdf(document_name)
+    else:
+        # e.g. a collection restored without its PDFs; rebuild the text from the stored chunks
+        summary = await summarize_text(await get_document_text(document_name, document_id))
+
+    if document_id:
+        state = await repository.get_ingest_state(document_name)
+        content_hash = state["content_hash"] if state and state["document_id"] == document_id else None
+        await repository.save_summary(document_id, document_name, content_hash, SUMMARY_VERSION, summary)
+    return summary
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens the way the answering model does (estimated if its encoding can't be loaded)."""
+    return get_token_counter("gpt-4o-mini").count(text)
+
+
+async def pack_chunk_context(search_results: list, token_budget: int = CHUNK_CONTEXT_TOKENS, neighbors: int = CHUNK_NEIGHBORS) -> str:
+    """Packs the retrieved chunks plus their neighbors into a context that fits the token budget.
+
+    Hits are taken in score order; each hit's own chunk is packed before its neighbors so a
+    tight budget keeps the most relevant text. Chunks are grouped per document in reading order.
+    """
+    qdrant = await aget_qdrant()
+    hits = [hit["metadata"] for hit in search_results if isinstance(hit["metadata"], dict) and "chunk_text" in hit["metadata"]]
+
+    # Fetch every hit's neighbors in one round trip per document
+    wanted = {}
+    for payload in hits:
+        numbers = wanted.setdefault(payload["document_id"], set())
+        for number in range(payload["chunk_number"] - neighbors, payload["chunk_number"] + neighbors + 1):
+            if number >= 1:
+                numbers.add(number)
+    links = await asyncio.gather(*(_document_links(doc_id) for doc_id in wanted))
+    fetched = await asyncio.gather(*(
+        qdrant.aget_chunks(doc_id, sorted(numbers), doc_links) for (doc_id, numbers), doc_links in zip(wanted.items(), links)
+    ))
+    by_key = {(p["document_id"], p["chunk_number"]): p for payloads in fetched for p in payloads}
+
+    # Priority order: every hit first, then the neighbors of each hit
+    order = [(p["document_id"], p["chunk_number"]) for p in hits]
+    for payload in hits:
+        for distance in range(1, neighbors + 1):
+            order += [(payload["document_id"], payload["chunk_number"] - distance), (payload["document_id"], payload["chunk_number"] + distance)]
+
+    selected = {}
+    used = 0
+    for key in order:
+        if key in selected or key not in by_key:
+            continue
+        tokens = count_tokens(by_key[key]["chunk_text"])
+        if used + tokens > token_budget:
+            continue
+        selected[key] = by_key[key]
+        used += tokens
+
+    sections = []
+    for document_id in dict.fromkeys(doc_id for doc_id, _ in selected):
+        chunks = sorted((p for (doc_id, _), p in selected.items() if doc_id == document_id), key=lambda p: p["chunk_number"])
+        # The hit names its document even when every chunk was filled in from another document's points
+        label = next((p for p in hits if p["document_id"] == document_id), chunks[0])
+        header = f"[DOCUMENT_TITLE: {label['title']} | DOCUMENT_FILE_NAME: {label['document_name']}]"
+        sections.append(header + "\n" + merge_chunks([p["chunk_text"] for p in chunks]))
+    logger.debug("Packed %d chunks (%d tokens) into the answer context", len(selected), used)
+    return "\n\n".join(sections)
+
+
+async def run_research_chunks_node(user_question: str) -> str:
+    """Answers from the top-k chunks and their neighbors with a single LLM call."""
+    await report_progress("retrieval")
+    search_results = await retrieve_documents(user_question, CHUNK_TOP_K)
+    if not search_results or search_results[0]["score"] <= SEARCH_SCORE:
+        return "NO DOCUMENT FOUND"
+
+    context = await pack_chunk_context(search_results)
+    if not context:
+        # Points stored without chunk text can only be answered through the document path
+        return await run_research_document_node(user_question, search_results)
+
+    await report_progress("answer")
+    with span("final"):
+        response = await get_chain("chunk_answer_chain").ainvoke(
+            {"context": context, "messages": [{"role": "user", "content": user_question}]}
+        )
+    return response.content
+
+
+async def run_research_vector_store_node(user_question: str, answer_mode: AnswerMode = AnswerMode.DOCUMENT) -> str:
     """Runs a research node through the pipeline"""
+    if AnswerMode(answer_mode) == AnswerMode.CHUNKS:
+        return await run_research_chunks_node(user_question)
+    return await run_research_document_node(user_question)
+
+
+async def run_research_document_node(user_question: str, search_results: list = None) -> str:
+    """Summarizes the best matching document and answers from that summary."""
     reconstructed_document_file_name = ""
     reconstructed_document_title = ""
     summary = None  # Default summary
     
-    search_results = search_qdrant(user_question)
+    if search_results is None:
+        await report_progress("retrieval")
+        search_results = await retrieve_documents(user_question)
 
     if search_results and search_results[0]["score"] > SEARCH_SCORE:
         pdf_file = search_results[0]["metadata"]["document_name"]
         reconstructed_document_title = search_results[0]["metadata"]["title"]
         reconstructed_document_file_name = pdf_file
-        document_text = await get_document(pdf_file)  
-        
-        # Reconstruct document from chunks
-        reconstructed_document = "".join(file.page_content for file in document_text)
-
-        # Step 2: Summarize the document
-        summary = summarization_chain.invoke(
-            {"messages": [{"role": "system", "content": reconstructed_document}]}
-        )
+        # Step 2: Summary of the document, precomputed at ingest or stored on first use
+        summary = await get_document_summary(pdf_file, search_results[0]["metadata"].get("document_id"))
         # Add the document title to the summary
         summary = f" DOCUMENT_TITLE: {reconstructed_document_title}: {summary}"
         summary = f" DOCUMENT_FILE_NAME: {reconstructed_document_file_name}: {summary}"
+        await report_progress("answer", document_title=reconstructed_document_title)
         # Step 3: Inject the results and user query as context
         context_messages = [{"role": "user", "content": user_question}]
 
         if summary:
             context_messages.insert(0, {"role": "system", "content": f"Summary of relevant document: {summary}"})
 
-        response = final_chain.invoke({"messages": context_messages})  # This is an AIMessage object    
+        with span("final"):
+            response = await get_chain("final_chain").ainvoke({"messages": context_messages})  # This is an AIMessage object
         return response.content
     else:
         return "NO DOCUMENT FOUND"
 
 async def run_research_llm_node(user_question: str) -> str:
-      response = document_not_found_chain.invoke(
-            {"messages": [{"role": "user", "content": user_question}]}
-        )
+      with span("fallback"):
+          response = await get_chain("document_not_found_chain").ainvoke(
+                {"messages": [{"role": "user", "content": user_question}]}
+            )
       return response.content
         
     
 
 
-async def run_test_query(user_question: str):
+async def run_test_query(user_question: str, answer_mode: AnswerMode = AnswerMode.DOCUMENT):
     """Runs a test query through the pipeline"""
 
     # Step 1: Try to retrieve a relevant document
-    research_response = await run_research_vector_store_node(user_question)
+    research_response = await run_research_vector_store_node(user_question, answer_mode)
 
     if research_response == "NO DOCUMENT FOUND":
         # Step 2: If no document is found, invoke the fallback response.  Next rev we will add a search tool and eval the answers
-        final_response = await run_research_llm_node()
+        final_response = await run_research_llm_node(user_question)
     else:
         # Use the retrieved research response
         final_response = research_response
 
     # Step 3: Format the final response
-    formatted_response = format_final_chain.invoke(
-        {"messages": [{"role": "system", "content": final_response}]}
-    )
+    with span("format"):
+        formatted_response = await get_chain("format_final_chain").ainvoke(
+            {"messages": [{"role": "system", "content": final_response}]}
+        )
 
     return formatted_response    
 
 
-async def load_documents(COLLECTION_NAME: str, utility: UtilityOpenAI):
-    dir = "data/pdfs"
-
-    pdf_files = await get_pdf_files(dir)
-    for pdf_file in pdf_files:
-        logger.debug(f"Processing PDF: {pdf_file}")
-
-        documents = await load_pdf(dir, pdf_file)  
-        if not documents:
-            logger.error(f"Failed to load {pdf_file}")
-            continue
-
-        chunks = await chunk_pdf_document(documents) 
-        metadata = await get_pdf_metadata(dir, pdf_file)        
-        vectors = utility.create_embeddings_from_text(chunks)
-         
-        qdrant.insert_documents(COLLECTION_NAME, vectors, metadata.to_dict())  
+async def sweep_expired_documents(batch_size: int = 256) -> int:
+    """Removes expired documents from the catalog along with their vectors, lexical postings and chunk signatures."""
+    def drop_search_data(document_ids: list[str]):
+        if DEDUPE_CHUNKS:
+            # Chunks other documents link to move over to one of those documents before the points go
+            promoted = get_qdrant().promote_chunks(get_dedupe_index().delete_documents(document_ids))
+            get_lexical_index().add_points(promoted)
+        get_qdrant().delete_documents(document_ids)
+        get_lexical_index().delete_documents(document_ids)
+
+    return await AsyncDocumentRepository(get_repository()).delete_expired_documents(drop_search_data, batch_size)
+
+
+async def load_documents(COLLECTION_NAME: str, utility: UtilityOpenAI, summarize: bool = True, directory: str = dir):
+    """Ingests every PDF in data/pdfs (or directory) through the concurrent ingestion pipeline."""
+    await sweep_expired_documents()
+    pipeline = IngestionPipeline(
+        utility,
+        get_qdrant(),
+        COLLECTION_NAME,
+        repository=get_repository(),
+        lexical_index=get_lexical_index(),
+        dedupe_index=get_dedupe_index() if DEDUPE_CHUNKS else None,
+        summarizer=summarize_text if summarize else None,
+        summary_version=SUMMARY_VERSION,
+    )
+    stats = await pipeline.run(directory)
+    return stats.report()
 
 
 async def doc_init():
-    # Initialize OpenAI Utility
-    utility = UtilityOpenAI()
-    embedding_dim = utility.get_embedding_dimension()
-    await load_documents(COLLECTION_NAME, utility) 
+    await load_documents(COLLECTION_NAME, get_utility()) 
 
 async def main():
     print("\n🚀 Ready player one!\n")  
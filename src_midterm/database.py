@@ -1,21 +1,105 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 
 class Database:
-    """Singleton for managing SQLite connection."""
-    
+    """Singleton for managing SQLite access.
+
+    Each thread gets its own connection (sqlite3 connections and cursors are not safe to
+    share), all opened in WAL mode so readers are never blocked by a writer. Statements
+    outside transaction() autocommit; transaction() groups writes atomically.
+    """
+
     _instance = None
+    _instance_lock = threading.Lock()
 
-    def __new__(cls, db_path="document_store.db"):
+    def __new__(cls, db_path="document_store.db", busy_timeout_ms: int = 5000):
         if cls._instance is None:
-            cls._instance = super(Database, cls).__new__(cls)
-            cls._instance.connection = sqlite3.connect(db_path, check_same_thread=False)
-            cls._instance.cursor = cls._instance.connection.cursor()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(Database, cls).__new__(cls)
+                    instance.db_path = db_path
+                    instance.busy_timeout_ms = busy_timeout_ms
+                    instance._local = threading.local()
+                    instance._connections = []
+                    instance._connections_lock = threading.Lock()
+                    cls._instance = instance
         return cls._instance
 
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # isolation_level=None: autocommit, transactions are begun explicitly in transaction()
+            # Only this thread uses it; check_same_thread=False just lets close() run from any thread
+            connection = sqlite3.connect(
+                self.db_path, timeout=self.busy_timeout_ms / 1000, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL;")
+            connection.execute("PRAGMA synchronous=NORMAL;")  # durable at checkpoints, safe with WAL
+            connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms};")
+            self._local.connection = connection
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """A cursor on this thread's connection, kept for callers of the old shared-cursor API."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+        return cursor
+
+    def execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Runs one statement on this thread's connection."""
+        return self.connection.execute(query, params)
+
+    def fetchone(self, query: str, params: tuple = ()):
+        return self.execute(query, params).fetchone()
+
+    def fetchall(self, query: str, params: tuple = ()):
+        return self.execute(query, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """Runs the block as one write transaction; nested uses join the outer transaction.
+
+        BEGIN IMMEDIATE takes the write lock up front, so a read-then-write block cannot
+        be interleaved with another writer.
+        """
+        connection = self.connection
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield connection
+            finally:
+                self._local.depth -= 1
+            return
+
+        connection.execute("BEGIN IMMEDIATE;")
+        self._local.depth = 1
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK;")
+            raise
+        else:
+            connection.execute("COMMIT;")
+        finally:
+            self._local.depth = 0
+
     def commit(self):
-        """Commit changes to the database."""
-        self.connection.commit()
+        """Commit changes to the database (a no-op outside an explicit transaction)."""
+        if self.connection.in_transaction and not self._local.depth:
+            self.connection.commit()
 
     def close(self):
-        """Close the database connection."""
-        self.connection.close()
+        """Close every connection opened by any thread."""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,405 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, NamedTuple, Optional
+import numpy as np
+from logger import logger
+from qdrant import point_id
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, "dedupe_index.db")
+# Estimated Jaccard similarity of word shingles at which a chunk counts as a near-duplicate
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.85"))
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_PRIME = (1 << 61) - 1  # Mersenne prime for the (a * x + b) mod p permutations
+
+
+def shingles(text: str, size: int = 5) -> list[int]:
+    """32-bit hashes of the text's overlapping word n-grams (a single shingle for short texts)."""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return []
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little") for gram in grams]
+
+
+@dataclass
+class DedupePlan:
+    """Which chunks of one document to embed and which are linked to an existing chunk instead."""
+    keep: list[int] = field(default_factory=list)  # chunk numbers to embed
+    signatures: dict = field(default_factory=dict)  # chunk number -> MinHash signature, for kept chunks
+    links: dict = field(default_factory=dict)  # chunk number -> (canonical point id, estimated similarity)
+
+
+class Promotion(NamedTuple):
+    """A linked chunk that becomes canonical because the chunk it linked to is being deleted."""
+    old_point_id: str
+    new_point_id: str
+    document_id: str
+    document_name: Optional[str]
+    chunk_number: int
+
+
+class NearDuplicateIndex:
+    """MinHash signatures of embedded chunks with an LSH band index, persisted in SQLite.
+
+    Chunks whose estimated Jaccard similarity to an already embedded chunk reaches the
+    threshold are not embedded again; they are recorded as links from (document, chunk)
+    to the canonical point, so repeated boilerplate (licence text, reference lists,
+    republished abstracts) costs one vector and one top-k slot.
+    """
+
+    CREATE_TABLES = """
+    CREATE TABLE IF NOT EXISTS dedupe_signature (
+        point_id TEXT PRIMARY KEY,
+        document_id TEXT NOT NULL,
+        document_name TEXT,
+        signature BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS dedupe_link (
+        document_id TEXT NOT NULL,
+        chunk_number INTEGER NOT NULL,
+        document_name TEXT,
+        canonical_point_id TEXT NOT NULL,
+        similarity REAL NOT NULL,
+        PRIMARY KEY (document_id, chunk_number)
+    );
+    CREATE INDEX IF NOT EXISTS idx_dedupe_signature_document_id ON dedupe_signature (document_id);
+    CREATE INDEX IF NOT EXISTS idx_dedupe_signature_document_name ON dedupe_signature (document_name);
+    CREATE INDEX IF NOT EXISTS idx_dedupe_link_canonical ON dedupe_link (canonical_point_id);
+    CREATE INDEX IF NOT EXISTS idx_dedupe_link_document_name ON dedupe_link (document_name);
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_INDEX_PATH,
+        num_perm: int = 128,
+        bands: int = 16,
+        threshold: float = DEDUPE_THRESHOLD,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands.")
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # a and b span the whole field; with both below 2**32 small shingle hashes never wrapped
+        # around p and won nearly every permutation, so unrelated chunks looked alike.
+        # a * x + b wraps in uint64, as in datasketch's MinHash.
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._signatures: dict[str, np.ndarray] = {}
+        self._owners: dict[str, tuple[str, str]] = {}  # point id -> (document_id, document_name)
+        self._buckets: dict[str, set] = {}  # "band:hash" -> point ids
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        self.connection.executescript(self.CREATE_TABLES)
+        self.connection.commit()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _load(self):
+        for pid, document_id, document_name, blob in self.connection.execute(
+            "SELECT point_id, document_id, document_name, signature FROM dedupe_signature;"
+        ):
+            signature = np.frombuffer(blob, dtype=np.uint32)
+            if len(signature) != self.num_perm:
+                continue  # written with other MinHash settings; the chunk is simply not a dedupe target
+            self._index(pid, document_id, document_name, signature)
+        if self._signatures:
+            logger.info(f"Loaded near-duplicate index with {len(self._signatures)} chunk signatures")
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of the text's word shingles, or None for text without words."""
+        hashes = shingles(text, self.shingle_size)
+        if not hashes:
+            return None
+        values = (np.asarray(hashes, dtype=np.uint64)[:, None] * self._a + self._b) % _PRIME
+        # The low 32 bits of each minimum are still uniform; halves the memory per signature
+        return values.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> list[str]:
+        return [
+            f"{band}:{hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.bands)
+        ]
+
+    def _index(self, pid: str, document_id: str, document_name: str, signature: np.ndarray):
+        """Adds a signature to the in-memory LSH tables; the caller holds the lock (or is loading)."""
+        self._remove(pid)
+        self._signatures[pid] = signature
+        self._owners[pid] = (document_id, document_name)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(pid)
+
+    def _remove(self, pid: str):
+        signature = self._signatures.pop(pid, None)
+        if signature is None:
+            return
+        self._owners.pop(pid, None)
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _best_match(self, signature, candidates, local_signatures) -> tuple[Optional[str], float]:
+        best, best_similarity = None, 0.0
+        for pid in candidates:
+            other = local_signatures.get(pid)
+            if other is None:
+                other = self._signatures[pid]
+            similarity = float(np.mean(other == signature))
+            if similarity > best_similarity:
+                best, best_similarity = pid, similarity
+        return best, best_similarity
+
+    def plan(self, vectored_metadata: dict, chunks: list[str], first_chunk_number: int = 1) -> DedupePlan:
+        """Splits a document's chunks into ones to embed and near-duplicates of chunks already embedded.
+
+        Matches are searched among the indexed chunks and the document's own earlier chunks.
+        Chunks of an older version of the same file are ignored because they are about to be
+        deleted, and a chunk that is already indexed under its own point id (a resumed ingest)
+        is kept so resuming plans the same batches.
+        """
+        document_id = vectored_metadata["document_id"]
+        document_name = vectored_metadata.get("document_name")
+        plan = DedupePlan()
+        local_signatures, local_buckets = {}, {}
+
+        with self._lock:
+            for offset, chunk in enumerate(chunks):
+                chunk_number = first_chunk_number + offset
+                pid = point_id(document_id, chunk_number)
+                signature = self.signature(chunk)
+                if signature is None or pid in self._signatures:
+                    plan.keep.append(chunk_number)
+                    if signature is not None:
+                        plan.signatures[chunk_number] = signature
+                    continue
+
+                keys = self._band_keys(signature)
+                candidates = set()
+                for key in keys:
+                    candidates.update(
+                        candidate for candidate in self._buckets.get(key, ())
+                        if self._owners[candidate][1] != document_name or self._owners[candidate][0] == document_id
+                    )
+                    candidates.update(local_buckets.get(key, ()))
+                best, similarity = self._best_match(signature, candidates, local_signatures)
+
+                if best is not None and similarity >= self.threshold:
+                    plan.links[chunk_number] = (best, similarity)
+                    continue
+                plan.keep.append(chunk_number)
+                plan.signatures[chunk_number] = signature
+                local_signatures[pid] = signature
+                for key in keys:
+                    local_buckets.setdefault(key, set()).add(pid)
+
+        if plan.links:
+            logger.debug("Near-duplicate chunks in %s: %d of %d", document_name, len(plan.links), len(chunks))
+        return plan
+
+    def add(self, vectored_metadata: dict, signatures: dict):
+        """Registers the signatures of chunks that now have points (chunk number -> signature)."""
+        document_id = vectored_metadata["document_id"]
+        document_name = vectored_metadata.get("document_name")
+        rows = []
+        with self._lock:
+            for chunk_number, signature in signatures.items():
+                pid = point_id(document_id, chunk_number)
+                self._index(pid, document_id, document_name, signature)
+                rows.append((pid, document_id, document_name, signature.tobytes()))
+            if rows:
+                self.connection.executemany("INSERT OR REPLACE INTO dedupe_signature VALUES (?, ?, ?, ?);", rows)
+                self.connection.commit()
+
+    def link(self, vectored_metadata: dict, links: dict):
+        """Records near-duplicate chunks of a document as links to their canonical points."""
+        document_id = vectored_metadata["document_id"]
+        document_name = vectored_metadata.get("document_name")
+        rows = [
+            (document_id, chunk_number, document_name, canonical, similarity)
+            for chunk_number, (canonical, similarity) in links.items()
+        ]
+        with self._lock:
+            self.connection.execute("DELETE FROM dedupe_link WHERE document_id = ?;", (document_id,))
+            self.connection.executemany("INSERT OR REPLACE INTO dedupe_link VALUES (?, ?, ?, ?, ?);", rows)
+            self.connection.commit()
+
+    def document_links(self, document_id: str) -> dict[int, str]:
+        """Chunk number -> canonical point id for a document's chunks that were linked instead of embedded."""
+        with self._lock:
+            return dict(self.connection.execute(
+                "SELECT chunk_number, canonical_point_id FROM dedupe_link WHERE document_id = ?;", (document_id,)
+            ))
+
+    def linked_points(self, document_ids=None, document_names=None) -> set[str]:
+        """Canonical point ids of the linked chunks of the documents matching both selections (str or list each)."""
+        where, params = [], []
+        for column, wanted in (("document_id", document_ids), ("document_name", document_names)):
+            if wanted is None:
+                continue
+            wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+            where.append(f"{column} IN ({','.join('?' for _ in wanted)})")
+            params.extend(wanted)
+        if not where:
+            return set()
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT DISTINCT canonical_point_id FROM dedupe_link WHERE {' AND '.join(where)};", params
+            )
+            return {canonical for canonical, in rows}
+
+    def linked_documents(self, point_ids: list[str]) -> dict[str, list[tuple]]:
+        """Maps canonical point ids to the (document_id, document_name, chunk_number) of every chunk linked to them."""
+        result = {pid: [] for pid in point_ids}
+        if not point_ids:
+            return result
+        placeholders = ",".join("?" for _ in point_ids)
+        with self._lock:
+            for canonical, document_id, document_name, chunk_number in self.connection.execute(
+                f"SELECT canonical_point_id, document_id, document_name, chunk_number FROM dedupe_link "
+                f"WHERE canonical_point_id IN ({placeholders}) ORDER BY document_id, chunk_number;",
+                list(point_ids),
+            ):
+                result[canonical].append((document_id, document_name, chunk_number))
+        return result
+
+    @property
+    def minhash_settings(self) -> dict:
+        """Settings a stored signature depends on; signatures are only comparable when these match."""
+        return {"num_perm": self.num_perm, "seed": self.seed, "shingle_size": self.shingle_size}
+
+    def _iter_rows(self, select: str, batch_size: int):
+        """Pages through a table by rowid so the lock is never held while the caller consumes rows."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self.connection.execute(f"{select} WHERE rowid > ? ORDER BY rowid LIMIT ?;", (last, batch_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def iter_signatures(self, batch_size: int = 1024):
+        """Yields (point id, document_id, document_name, signature bytes) of every stored signature, e.g. for snapshots."""
+        yield from self._iter_rows("SELECT rowid, point_id, document_id, document_name, signature FROM dedupe_signature", batch_size)
+
+    def iter_links(self, batch_size: int = 1024):
+        """Yields (document_id, chunk_number, document_name, canonical point id, similarity) of every link."""
+        yield from self._iter_rows(
+            "SELECT rowid, document_id, chunk_number, document_name, canonical_point_id, similarity FROM dedupe_link", batch_size
+        )
+
+    def restore(self, signatures: Iterable[tuple], links: Iterable[tuple]) -> tuple[int, int]:
+        """Loads rows shaped like iter_signatures and iter_links (e.g. from a snapshot); returns how many of each.
+
+        Signatures of another length than num_perm are skipped, as on load.
+        """
+        signature_rows, link_rows = [], [tuple(row) for row in links]
+        with self._lock:
+            for pid, document_id, document_name, blob in signatures:
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                if len(signature) != self.num_perm:
+                    continue
+                self._index(pid, document_id, document_name, signature)
+                signature_rows.append((pid, document_id, document_name, blob))
+            self.connection.executemany("INSERT OR REPLACE INTO dedupe_signature VALUES (?, ?, ?, ?);", signature_rows)
+            self.connection.executemany("INSERT OR REPLACE INTO dedupe_link VALUES (?, ?, ?, ?, ?);", link_rows)
+            self.connection.commit()
+        return len(signature_rows), len(link_rows)
+
+    def _delete_where(self, predicate, where: str, params: tuple) -> list[Promotion]:
+        """Drops matching signatures and links; a dropped chunk that others still link to hands over to one of them.
+
+        The first surviving linked chunk becomes canonical: it takes over the signature and the
+        remaining links. The caller copies the old point to the new id (promote_chunks of the
+        vector stores) before deleting the documents' points.
+        """
+        promotions = []
+        with self._lock:
+            # Links of the deleted documents go first, so only surviving documents take over
+            self.connection.execute(f"DELETE FROM dedupe_link WHERE {where};", params)
+            for pid, blob in self.connection.execute(
+                f"SELECT point_id, signature FROM dedupe_signature WHERE {where};", params
+            ).fetchall():
+                successor = self.connection.execute(
+                    "SELECT document_id, document_name, chunk_number FROM dedupe_link WHERE canonical_point_id = ? "
+                    "ORDER BY document_id, chunk_number LIMIT 1;",
+                    (pid,),
+                ).fetchone()
+                if successor is None:
+                    continue
+                document_id, document_name, chunk_number = successor
+                new_pid = point_id(document_id, chunk_number)
+                self.connection.execute(
+                    "DELETE FROM dedupe_link WHERE document_id = ? AND chunk_number = ?;", (document_id, chunk_number)
+                )
+                self.connection.execute("UPDATE dedupe_link SET canonical_point_id = ? WHERE canonical_point_id = ?;", (new_pid, pid))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO dedupe_signature VALUES (?, ?, ?, ?);", (new_pid, document_id, document_name, blob)
+                )
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                if len(signature) == self.num_perm:
+                    self._index(new_pid, document_id, document_name, signature)
+                promotions.append(Promotion(pid, new_pid, document_id, document_name, chunk_number))
+            self.connection.execute(f"DELETE FROM dedupe_signature WHERE {where};", params)
+            for pid in [pid for pid, (document_id, document_name) in self._owners.items() if predicate(document_id, document_name)]:
+                self._remove(pid)
+            self.connection.commit()
+        if promotions:
+            logger.info(f"Promoted {len(promotions)} linked chunks to canonical before deleting their canonical chunks")
+        return promotions
+
+    def delete_documents(self, document_ids: list[str]) -> list[Promotion]:
+        """Removes the signatures and links of several documents; returns the chunks promoted in their place."""
+        wanted = set(document_ids)
+        if not wanted:
+            return []
+        placeholders = ",".join("?" for _ in wanted)
+        return self._delete_where(lambda document_id, _: document_id in wanted, f"document_id IN ({placeholders})", tuple(wanted))
+
+    def delete_documents_by_name(self, document_name: str, keep_document_id: str = None) -> list[Promotion]:
+        """Removes signatures and links of a file's other versions (all versions if keep_document_id is None)."""
+        return self._delete_where(
+            lambda document_id, name: name == document_name and document_id != keep_document_id,
+            "document_name = ? AND document_id IS NOT ?",
+            (document_name, keep_document_id),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            links = self.connection.execute("SELECT COUNT(*) FROM dedupe_link;").fetchone()[0]
+        return {"signatures": len(self._signatures), "buckets": len(self._buckets), "links": links}
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    index = NearDuplicateIndex(":memory:")
+    boilerplate = "This article is distributed under the terms of the Creative Commons Attribution License, which permits unrestricted use and reproduction in any medium."
+    first = index.plan({"document_id": "a", "document_name": "a.pdf"}, [boilerplate, "Eccentric loading improved grip strength."])
+    index.add({"document_id": "a", "document_name": "a.pdf"}, first.signatures)
+    second = index.plan({"document_id": "b", "document_name": "b.pdf"}, ["Tendon pain and rest.", boilerplate + " 2021"])
+    logger.debug(f"Kept {second.keep}, linked {second.links}")
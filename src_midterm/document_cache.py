@@ -0,0 +1,150 @@
+import os
+import json
+import zlib
+import asyncio
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from logger import logger
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "parsed")
+# Compressed pages kept on disk; the least recently used entries go first beyond it
+PARSED_CACHE_MAX_BYTES = int(os.getenv("PARSED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Streaming readers only buffer a document for the cache up to these limits, so streaming stays bounded
+STREAM_CACHE_MAX_PAGES = int(os.getenv("PARSED_CACHE_STREAM_MAX_PAGES", "64"))
+STREAM_CACHE_MAX_CHARS = int(os.getenv("PARSED_CACHE_STREAM_MAX_CHARS", str(1024 * 1024)))
+
+
+class ParsedDocumentCache:
+    """Two-tier cache of parsed PDF pages: an in-memory LRU in front of zlib-compressed JSON on disk.
+
+    Entries are keyed by absolute path, size and mtime, so editing or replacing a
+    PDF naturally misses the cache. Old entries are pruned, least recently used first,
+    once the disk tier grows past max_disk_bytes. aget/aput keep the disk work off
+    the event loop.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_entries: int = 32, max_disk_bytes: int = PARSED_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.pruned = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_path: str) -> str:
+        """Builds the cache key from the file's path, size and modification time."""
+        stat = os.stat(file_path)
+        raw = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.z")
+
+    def get(self, file_path: str) -> Optional[list[dict]]:
+        """Returns the cached pages ({page_content, metadata} dicts) or None."""
+        key = self.make_key(file_path)
+        with self._lock:
+            pages = self._entries.get(key)
+            if pages is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return pages
+
+        disk_path = self._disk_path(key)
+        if not os.path.exists(disk_path):
+            self.misses += 1
+            return None
+        try:
+            with open(disk_path, "rb") as f:
+                pages = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error(f"Discarding unreadable parsed-document cache entry {disk_path}: {str(e)}")
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        try:
+            os.utime(disk_path)  # the mtime orders entries for pruning
+        except OSError:
+            pass
+        self._remember(key, pages)
+        return pages
+
+    async def aget(self, file_path: str) -> Optional[list[dict]]:
+        """get() in a worker thread, since a memory miss reads and inflates a file."""
+        return await asyncio.to_thread(self.get, file_path)
+
+    def put(self, file_path: str, pages: list[dict]) -> None:
+        """Stores parsed pages in memory and on disk."""
+        key = self.make_key(file_path)
+        self._remember(key, pages)
+
+        payload = zlib.compress(json.dumps(pages, ensure_ascii=False).encode("utf-8"), level=6)
+        if len(payload) > self.max_disk_bytes:
+            return  # would evict everything else and then itself
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file first so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            logger.error(f"Could not write parsed-document cache entry: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._prune(keep=self._disk_path(key))
+
+    async def aput(self, file_path: str, pages: list[dict]) -> None:
+        """put() in a worker thread; compressing and writing a large document takes a while."""
+        await asyncio.to_thread(self.put, file_path, pages)
+
+    def _prune(self, keep: str) -> None:
+        """Deletes the least recently used disk entries until the tier fits max_disk_bytes."""
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(".json.z"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # removed by another process meanwhile
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.pruned += 1
+
+    def _remember(self, key: str, pages: list[dict]) -> None:
+        with self._lock:
+            self._entries[key] = pages
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters for both tiers."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "pruned": self.pruned,
+            "memory_entries": len(self._entries),
+        }
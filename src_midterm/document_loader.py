@@ -1,14 +1,23 @@
 import os
 import asyncio
 import uuid
+import hashlib
+from functools import lru_cache
 from pypdf import PdfReader
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
 from langchain_text_splitters import CharacterTextSplitter
 from logger import logger
+from metrics import span
 from templates import MetaDataModel
 from utils_openai import UtilityOpenAI
 from qdrant import UtilityQdrant
+from document_cache import ParsedDocumentCache, STREAM_CACHE_MAX_PAGES, STREAM_CACHE_MAX_CHARS
+
+@lru_cache(maxsize=None)
+def get_parsed_document_cache() -> ParsedDocumentCache:
+    """The cache shared by every load_pdf and iter_pdf_pages call in this process, created on first use."""
+    return ParsedDocumentCache()
 
 
 
@@ -24,7 +33,26 @@ async def get_pdf_files(directory: str) -> list[str]:
 
     return [f for f in os.listdir(pdf_dir) if f.lower().endswith(".pdf")]
 
-async def get_pdf_metadata(directory: str, pdf_file: str) -> MetaDataModel:
+def get_file_hash(directory: str, pdf_file: str) -> str:
+    """Returns the SHA-256 of a PDF's bytes, used to detect changed files."""
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory, pdf_file)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_id_from_hash(content_hash: str, document_name: str) -> str:
+    """Derives a stable document_id from the file name and content hash.
+
+    The name is part of the id so identical files under different names stay separate
+    documents, with their own point ids and catalog rows.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{document_name}:sha256:{content_hash}"))
+
+
+async def get_pdf_metadata(directory: str, pdf_file: str, document_id: str = None) -> MetaDataModel:
     """Extracts metadata from a PDF file."""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     pdf_location = os.path.join(current_dir, directory, pdf_file)
@@ -35,7 +63,7 @@ async def get_pdf_metadata(directory: str, pdf_file: str) -> MetaDataModel:
 
         return MetaDataModel(
                 document_name = pdf_file,
-                document_id = str(uuid.uuid4()),
+                document_id = document_id or str(uuid.uuid4()),
                 title = metadata.get("/Title", "No title Found"),
                 author = metadata.get("/Author", "No author Found"),
                 description = metadata.get("/Description", "No description Found"),                
@@ -46,18 +74,66 @@ async def get_pdf_metadata(directory: str, pdf_file: str) -> MetaDataModel:
         return None        
 
 
-async def load_pdf(directory: str, pdf_file: str) -> list[Document]:
+async def load_pdf(directory: str, pdf_file: str, use_cache: bool = True) -> list[Document]:
     """Loads a single PDF file and returns a list of Document objects."""
     file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory, pdf_file)
 
+    if use_cache:
+        pages = await get_parsed_document_cache().aget(file_path)
+        if pages is not None:
+            # Fresh Document objects so callers can't mutate the cached pages
+            return [Document(page_content=page["page_content"], metadata=dict(page["metadata"])) for page in pages]
+
     loader = PyPDFLoader(file_path, extract_images=False)
     documents = []
 
-    async for page in loader.alazy_load():
-        documents.append(page)  # Store each page properly
+    with span("pdf_load"):
+        async for page in loader.alazy_load():
+            documents.append(page)  # Store each page properly
+
+    if use_cache and documents:
+        await get_parsed_document_cache().aput(
+            file_path, [{"page_content": page.page_content, "metadata": page.metadata} for page in documents]
+        )
 
     return documents
 
+async def iter_pdf_pages(directory: str, pdf_file: str, batch_size: int = 8, use_cache: bool = True):
+    """Yields a PDF's page texts in batches as they are parsed, without holding the parsed document.
+
+    Small documents are also buffered and put in the parsed-document cache once the whole
+    file has been streamed. The buffer is dropped as soon as it passes STREAM_CACHE_MAX_PAGES
+    or STREAM_CACHE_MAX_CHARS, so memory never grows with the document; larger files
+    are cached only by load_pdf.
+    """
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory, pdf_file)
+
+    if use_cache:
+        pages = await get_parsed_document_cache().aget(file_path)
+        if pages is not None:
+            for start in range(0, len(pages), batch_size):
+                yield [page["page_content"] for page in pages[start:start + batch_size]]
+            return
+
+    loader = PyPDFLoader(file_path, extract_images=False)
+    parsed, batch = [], []
+    buffered_chars = 0
+    async for page in loader.alazy_load():
+        if use_cache and parsed is not None:
+            buffered_chars += len(page.page_content)
+            if len(parsed) < STREAM_CACHE_MAX_PAGES and buffered_chars <= STREAM_CACHE_MAX_CHARS:
+                parsed.append({"page_content": page.page_content, "metadata": page.metadata})
+            else:
+                parsed = None  # too large to buffer; stop holding pages for the cache
+        batch.append(page.page_content)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    if parsed:
+        await get_parsed_document_cache().aput(file_path, parsed)
+
 async def chunk_pdf_document(documents: list[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
     """Chunks a list of Document objects into smaller text chunks."""
     splitter = CharacterTextSplitter(separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
@@ -67,8 +143,8 @@ async def chunk_pdf_document(documents: list[Document], chunk_size: int = 1000,
 
     chunks = [doc.page_content for doc in docs]
 
-    logger.debug(f"Pages in the original document: {len(documents)}")
-    logger.debug(f"Length of chunks after splitting pages: {len(chunks)}")
+    logger.debug("Pages in the original document: %d", len(documents))
+    logger.debug("Length of chunks after splitting pages: %d", len(chunks))
 
     return chunks
 
@@ -103,8 +179,7 @@ async def main():
         logger.debug(f"First chunk: {chunks[0] if chunks else 'No chunks generated'}")
         vectors = utility.create_embeddings_from_text(chunks)
         logger.debug(f"Number of vectors: {len(vectors)}")
-        logger.debug(f"First vector: {vectors[0]}")        
-        qdrant.insert_documents(COLLECTION_NAME, vectors, metadata.to_dict())  
+        qdrant.insert_documents(COLLECTION_NAME, vectors, metadata.to_dict(), chunks)
      
     query = " What specific therapeutic activities and exercises have been shown to be most effective in resolving symptoms and treating chronic tennis elbow"
     # Ensure the query is a list for compatibility
@@ -0,0 +1,188 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from logger import logger
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "embedding_cache.db")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB of float32 vectors
+SQLITE_MAX_VARS = 500  # stay well under SQLite's bound parameter limit
+
+
+class EmbeddingCache:
+    """Persistent content-addressed cache of embedding vectors.
+
+    Vectors are keyed by embedding model and a hash of the normalized chunk text
+    and stored as raw float32 blobs. When the cache grows past max_bytes the least
+    recently used entries are evicted. The total size is read once at open and kept up to
+    date on every insert and eviction, so writes never scan the table.
+    """
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        cache_key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        dim INTEGER NOT NULL,
+        vector BLOB NOT NULL,
+        last_access REAL NOT NULL
+    );
+    """
+
+    CREATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access ON embedding_cache (last_access);
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        self.connection.execute(self.CREATE_TABLE)
+        self.connection.execute(self.CREATE_INDEX)
+        self.connection.commit()
+        self._size_bytes = self._read_size()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalizes chunk text so that whitespace-only differences share an entry."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        """Builds the cache key for a chunk of text embedded with the given model."""
+        digest = hashlib.sha256(cls.normalize(text).encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def _read_size(self) -> int:
+        row = self.connection.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache;").fetchone()
+        return row[0]
+
+    def _stored_sizes(self, keys: list[str]) -> dict:
+        """Blob sizes of the given keys that are already cached; the caller holds the lock."""
+        sizes = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARS):
+            batch = keys[start:start + SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(batch))
+            sizes.update(
+                self.connection.execute(
+                    f"SELECT cache_key, LENGTH(vector) FROM embedding_cache WHERE cache_key IN ({placeholders});", batch
+                )
+            )
+        return sizes
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """Returns a list aligned with texts holding cached vectors, or None for misses."""
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), SQLITE_MAX_VARS):
+                batch = unique_keys[start:start + SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT cache_key, vector FROM embedding_cache WHERE cache_key IN ({placeholders});", batch
+                ).fetchall()
+                for cache_key, blob in rows:
+                    found[cache_key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                self.connection.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE cache_key = ?;",
+                    [(now, cache_key) for cache_key in found],
+                )
+                self.connection.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model: str, texts: list[str], vectors: list) -> None:
+        """Stores vectors for the given texts and evicts old entries if over budget."""
+        now = time.time()
+        rows = {}  # by key, so a text repeated in the batch is counted once
+        for text, vector in zip(texts, vectors):
+            array = np.asarray(vector, dtype=np.float32)
+            cache_key = self.make_key(model, text)
+            rows[cache_key] = (cache_key, model, array.shape[0], array.tobytes(), now)
+
+        with self._lock:
+            replaced = self._stored_sizes(list(rows))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (cache_key, model, dim, vector, last_access) VALUES (?, ?, ?, ?, ?);",
+                rows.values(),
+            )
+            self.connection.commit()
+            self._size_bytes += sum(len(row[3]) for row in rows.values()) - sum(replaced.values())
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drops least recently used entries until the cache is back to 90% of max_bytes."""
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        evict_keys = []
+        cursor = self.connection.execute(
+            "SELECT cache_key, LENGTH(vector) FROM embedding_cache ORDER BY last_access ASC;"
+        )
+        for cache_key, size in cursor:
+            if self._size_bytes - freed <= target:
+                break
+            evict_keys.append((cache_key,))
+            freed += size
+
+        self.connection.executemany("DELETE FROM embedding_cache WHERE cache_key = ?;", evict_keys)
+        self.connection.commit()
+        self._size_bytes -= freed
+        self.evictions += len(evict_keys)
+        logger.info(f"Embedding cache evicted {len(evict_keys)} entries ({freed} bytes)")
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock:
+            self.connection.execute("DELETE FROM embedding_cache;")
+            self.connection.commit()
+            self._size_bytes = 0
+
+    def close(self) -> None:
+        """Close the cache database connection."""
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    cache = EmbeddingCache(path=os.path.join(CACHE_DIR, "embedding_cache_demo.db"), max_bytes=16 * 1024)
+    texts = ["This is the first test chunk.", "This is   the second test chunk."]
+    vectors = [np.random.rand(1536).tolist() for _ in texts]
+    logger.debug(cache.get_many("demo", texts))
+    cache.put_many("demo", texts, vectors)
+    logger.debug([v is not None for v in cache.get_many("demo", ["This is the first test chunk.", "This is the second test chunk."])])
+    logger.debug(cache.stats())
+    cache.clear()
+    logger.debug("Done")
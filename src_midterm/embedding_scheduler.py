@@ -0,0 +1,264 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+import openai
+from logger import logger
+from metrics import metrics, span
+
+# Account limits of the embedding model; the defaults are OpenAI's tier-1 limits for text-embedding-3-*
+EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def retry_after(error: Exception, max_delay: float = 60.0) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms or retry-after), if it said."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return min(max_delay, max(0.0, float(headers["retry-after-ms"]) / 1000))
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return min(max_delay, max(0.0, float(value)))
+        except ValueError:
+            # HTTP-date form
+            return min(max_delay, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection drops and server errors are worth another try; bad requests are not."""
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    status = getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS or (status is not None and status >= 500)
+
+
+class TokenBucket:
+    """Continuously refilling budget of rate_per_minute units, holding at most one minute's worth.
+
+    reserve() always takes the units and returns how long the caller has to wait before
+    spending them, so waiters line up in the order they reserved.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            # A request larger than the whole bucket waits for a full bucket instead of forever
+            self._level -= min(amount, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount: float):
+        """Gives back units whose request the server rejected without counting it."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + min(amount, self.capacity))
+
+
+class EmbeddingScheduler:
+    """Runs embedding requests concurrently within requests- and tokens-per-minute budgets.
+
+    Every batch is its own request with its own retries: a 429, timeout or 5xx re-sends
+    only that batch, after the server's retry-after (which also pauses every other batch)
+    or an exponential backoff with jitter. Queue depth, in-flight requests, retries and
+    token throughput are published as gauges.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[list[str]], list[list[float]]],
+        aembed: Callable[[list[str]], Awaitable[list[list[float]]]],
+        requests_per_minute: int = EMBEDDING_RPM,
+        tokens_per_minute: int = EMBEDDING_TPM,
+        max_concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+    ):
+        self.embed = embed
+        self.aembed = aembed
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._thread_slots = threading.BoundedSemaphore(max_concurrency)
+        self._loop_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._resume_at = 0.0  # monotonic time before which no request is sent (after a 429)
+        self._recent = deque()  # (monotonic time, tokens) of requests finished in the last minute
+        self.queued = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.tokens_sent = 0
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._loop_slots.get(loop)
+        if slots is None:
+            slots = self._loop_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    def _wait_time(self, tokens: int) -> float:
+        """Reserves one request and the batch's tokens; returns the wait before sending."""
+        with self._lock:
+            paused = max(0.0, self._resume_at - time.monotonic())
+        return max(paused, self._requests.reserve(1), self._tokens.reserve(tokens))
+
+    def _update(self, queued: int = 0, in_flight: int = 0):
+        with self._lock:
+            self.queued += queued
+            self.in_flight += in_flight
+            queue_depth, in_flight_now = self.queued, self.in_flight
+        metrics.set_gauge("embedding_queue_depth", queue_depth)
+        metrics.set_gauge("embedding_in_flight", in_flight_now)
+
+    def _record_success(self, tokens: int):
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self.tokens_sent += tokens
+            self._recent.append((now, tokens))
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+            window = max(1.0, now - self._recent[0][0])
+            throughput = sum(sent for _, sent in self._recent) / window
+        metrics.set_gauge("embedding_requests_total", self.requests)
+        metrics.set_gauge("embedding_tokens_per_second", round(throughput, 1))
+
+    def _retry_delay(self, error: Exception, attempt: int, tokens: int) -> float:
+        """Delay before the next attempt; re-raises when the error is final."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._lock:
+                self.failed += 1
+            metrics.set_gauge("embedding_failed_total", self.failed)
+            raise error
+        delay = retry_after(error, self.max_delay)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        rate_limited = getattr(error, "status_code", None) == 429
+        with self._lock:
+            self.retries += 1
+            if rate_limited:
+                self.rate_limited += 1
+                # The whole account is over its limit, not just this batch
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        if rate_limited:
+            # A rejected request is not charged against the limits, so the retry shouldn't be either
+            self._requests.refund(1)
+            self._tokens.refund(tokens)
+        metrics.set_gauge("embedding_retries_total", self.retries)
+        metrics.set_gauge("embedding_rate_limited_total", self.rate_limited)
+        logger.warning("Embedding request failed (%s), retry %d in %.2fs", type(error).__name__, attempt + 1, delay)
+        return delay
+
+    async def _arun(self, texts: list[str], tokens: int) -> list[list[float]]:
+        self._update(queued=1)
+        queued = True
+        try:
+            async with self._slots():
+                for attempt in range(self.max_retries + 1):
+                    await asyncio.sleep(self._wait_time(tokens))
+                    if queued:
+                        self._update(queued=-1)
+                        queued = False
+                    self._update(in_flight=1)
+                    try:
+                        with span("embedding_request"):
+                            vectors = await self.aembed(texts)
+                    except Exception as error:
+                        delay = self._retry_delay(error, attempt, tokens)
+                    else:
+                        self._record_success(tokens)
+                        return vectors
+                    finally:
+                        self._update(in_flight=-1)
+                    await asyncio.sleep(delay)
+        finally:
+            if queued:
+                self._update(queued=-1)
+
+    def _run(self, texts: list[str], tokens: int) -> list[list[float]]:
+        self._update(queued=1)
+        queued = True
+        try:
+            with self._thread_slots:
+                for attempt in range(self.max_retries + 1):
+                    time.sleep(self._wait_time(tokens))
+                    if queued:
+                        self._update(queued=-1)
+                        queued = False
+                    self._update(in_flight=1)
+                    try:
+                        with span("embedding_request"):
+                            vectors = self.embed(texts)
+                    except Exception as error:
+                        delay = self._retry_delay(error, attempt, tokens)
+                    else:
+                        self._record_success(tokens)
+                        return vectors
+                    finally:
+                        self._update(in_flight=-1)
+                    time.sleep(delay)
+        finally:
+            if queued:
+                self._update(queued=-1)
+
+    async def aembed_batches(self, batches: list[tuple[list[str], int]]) -> list[list[float]]:
+        """Embeds (texts, tokens) batches concurrently and returns the vectors in input order."""
+        if len(batches) == 1:
+            return await self._arun(*batches[0])
+        tasks = [asyncio.create_task(self._arun(texts, tokens)) for texts, tokens in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [vector for vectors in results for vector in vectors]
+
+    def embed_batches(self, batches: list[tuple[list[str], int]]) -> list[list[float]]:
+        """Blocking version of aembed_batches; batches run on up to max_concurrency threads."""
+        if len(batches) == 1:
+            return self._run(*batches[0])
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            results = list(pool.map(lambda batch: self._run(*batch), batches))
+        return [vector for vectors in results for vector in vectors]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failed": self.failed,
+                "tokens_sent": self.tokens_sent,
+            }
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import numpy as np
+from pydantic import Field
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic offline embedder: every text maps to a hash-seeded unit vector."""
+
+    def __init__(self, dim: int = 1536, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency  # seconds per request
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model with configurable latency that reports token usage like the real one."""
+
+    latency: float = 0.05  # seconds before the first token
+    token_latency: float = 0.0  # seconds between streamed tokens
+    response: str = "This is a fake answer about eccentric exercises for lateral epicondylitis."
+    calls: list = Field(default_factory=list)  # (start, end) perf_counter times of every call, to measure real overlap
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        # Roughly 4 characters per token, close enough for relative comparisons
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(self.response) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        start = time.perf_counter()
+        time.sleep(self.latency + self.token_latency * len(self.response.split()))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        self.calls.append((start, time.perf_counter()))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency + self.token_latency * len(self.response.split()))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        self.calls.append((start, time.perf_counter()))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        for token in self.response.split(" "):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.calls.append((start, time.perf_counter()))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        for token in self.response.split(" "):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.calls.append((start, time.perf_counter()))
+
+
+def use_offline_backends(chat_latency: float = 0.05, embed_latency: float = 0.0, dim: int = 1536):
+    """Points chains at fake OpenAI backends, an in-memory Qdrant and a throwaway catalog database."""
+    # Imported here so the fakes themselves stay usable without the app modules
+    import chains
+    from database import Database
+    from repository import DocumentRepository
+    from utils_openai import UtilityOpenAI
+    from qdrant import UtilityQdrant
+    from lexical_index import LexicalIndex
+    from dedupe import NearDuplicateIndex
+    from token_chunker import get_token_counter
+
+    # Estimate token counts rather than download tiktoken encodings
+    os.environ["TOKEN_COUNT_ESTIMATE"] = "1"
+    get_token_counter.cache_clear()
+    Database(os.path.join(tempfile.mkdtemp(), "offline_document_store.db"))
+    utility = UtilityOpenAI(embedding=FakeEmbeddings(dim=dim, latency=embed_latency), use_cache=False)
+    qdrant = UtilityQdrant(chains.COLLECTION_NAME, dim, chains.SEARCH_SCORE, location=":memory:")
+    chains.configure(
+        utility=utility,
+        qdrant=qdrant,
+        llm=FakeChatModel(latency=chat_latency),
+        repository=DocumentRepository(),
+        lexical_index=LexicalIndex(":memory:"),
+        dedupe_index=NearDuplicateIndex(":memory:"),
+    )
+    return utility, qdrant
+
+
+def seed_matching_chunk(question: str, document_name: str = "Lit rev tennis elbow.pdf"):
+    """Stores a chunk whose text is the question itself, so the fake embedder returns a perfect match."""
+    import chains
+
+    utility, qdrant = chains.get_utility(), chains.get_qdrant()
+    metadata = {"document_name": document_name, "document_id": f"seed-{document_name}", "title": document_name, "subject": "offline"}
+    qdrant.insert_documents(chains.COLLECTION_NAME, utility.embed_queries([question]), metadata, [question])
+    chains.get_lexical_index().add_chunks(metadata, [question])
@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from logger import logger
+from utils_openai import UtilityOpenAI
+from qdrant import UtilityQdrant, merge_chunks, point_id
+from vector_index import create_vector_store
+from lexical_index import LexicalIndex
+from dedupe import NearDuplicateIndex
+from token_chunker import (
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    EMBEDDING_MAX_ITEMS,
+    EMBEDDING_BATCH_TOKENS,
+    TokenChunker,
+    get_token_counter,
+    pack_batches,
+)
+from repository import DocumentRepository, AsyncDocumentRepository
+from document_loader import (
+    get_pdf_files,
+    iter_pdf_pages,
+    get_pdf_metadata,
+    get_file_hash,
+    document_id_from_hash,
+)
+
+_DONE = object()  # queue sentinel
+
+
+@dataclass
+class StageStats:
+    """Item counts and the active window of one pipeline stage."""
+    items: int = 0
+    started: float = None
+    finished: float = None
+
+    def mark(self, items: int = 0):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        self.finished = now
+        self.items += items
+
+    @property
+    def seconds(self) -> float:
+        if self.started is None:
+            return 0.0
+        return self.finished - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class IngestionStats:
+    """Per-stage throughput of an ingestion run."""
+    files: int = 0
+    skipped_files: int = 0
+    resumed_files: int = 0
+    failed_files: int = 0
+    chunks: int = 0
+    duplicate_chunks: int = 0  # linked to an existing chunk instead of embedded
+    parse: StageStats = field(default_factory=StageStats)  # items are pages
+    embed: StageStats = field(default_factory=StageStats)  # items are vectors
+    upsert: StageStats = field(default_factory=StageStats)  # items are points
+    summarize: StageStats = field(default_factory=StageStats)  # items are documents
+    wall_seconds: float = 0.0
+
+    def report(self) -> dict:
+        return {
+            "files": self.files,
+            "skipped_files": self.skipped_files,
+            "resumed_files": self.resumed_files,
+            "failed_files": self.failed_files,
+            "pages": self.parse.items,
+            "chunks": self.chunks,
+            "duplicate_chunks": self.duplicate_chunks,
+            "vectors": self.embed.items,
+            "pages_per_s": round(self.parse.rate, 2),
+            "chunks_per_s": round(self.chunks / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "vectors_per_s": round(self.embed.rate, 2),
+            "upserts_per_s": round(self.upsert.rate, 2),
+            "summaries": self.summarize.items,
+            "summarize_seconds": round(self.summarize.seconds, 2),
+            "wall_seconds": round(self.wall_seconds, 2),
+        }
+
+
+def parse_and_chunk(
+    directory: str,
+    pdf_file: str,
+    document_id: str = None,
+    model_name: str = "text-embedding-3-small",
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> dict:
+    """Streams, chunks and reads metadata of one PDF. Runs inside a worker process.
+
+    Pages are chunked as they are parsed, so only the chunks (with their token counts)
+    are ever held, never the page list as well (beyond iter_pdf_pages' capped cache buffer).
+    """
+    async def _run():
+        chunker = TokenChunker(get_token_counter(model_name), chunk_tokens, overlap_tokens)
+        pages, chunks = 0, []
+        async for batch in iter_pdf_pages(directory, pdf_file):
+            pages += len(batch)
+            for page in batch:
+                chunks.extend(chunker.feed(page))
+        chunks.extend(chunker.flush())
+        if not pages:
+            return None
+        metadata = await get_pdf_metadata(directory, pdf_file, document_id)
+        if metadata is None:
+            return None
+        return {
+            "pdf_file": pdf_file,
+            "pages": pages,
+            "chunks": [chunk.text for chunk in chunks],
+            "chunk_tokens": [chunk.tokens for chunk in chunks],
+            "metadata": metadata.to_dict(),
+        }
+
+    return asyncio.run(_run())
+
+
+class IngestionPipeline:
+    """Parses PDFs in a process pool, embeds batches concurrently and overlaps Qdrant upserts.
+
+    Stages are connected by bounded queues, so a slow stage applies back-pressure
+    to the one before it instead of letting parsed documents pile up in memory.
+    Chunks are sized in embedding tokens and each document's chunks are packed into
+    as few embedding requests as the endpoint's item and token limits allow.
+
+    Each file is fingerprinted by content hash: unchanged files are skipped, changed
+    files replace their old vectors, and progress is checkpointed per embedding batch
+    in the ingest_state table so an interrupted run resumes where it stopped.
+
+    With a dedupe_index, near-duplicate chunks are dropped between chunking and embedding
+    and linked to the chunk that already has a vector.
+
+    With a summarizer, completed documents go through a last bounded queue to
+    summary_concurrency summarizer tasks, so a slow summary never holds up upserts.
+    """
+
+    def __init__(
+        self,
+        utility: UtilityOpenAI,
+        qdrant: UtilityQdrant,
+        collection_name: str,
+        parse_workers: int = None,
+        embed_concurrency: int = 4,
+        embed_batch_size: int = EMBEDDING_MAX_ITEMS,
+        embed_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        queue_size: int = 2,
+        repository: DocumentRepository = None,
+        lexical_index: LexicalIndex = None,
+        dedupe_index: NearDuplicateIndex = None,
+        summarizer=None,
+        summary_version: str = "v1",
+        summary_concurrency: int = 2,
+    ):
+        self.utility = utility
+        self.qdrant = qdrant
+        self.repository = AsyncDocumentRepository(repository or DocumentRepository())
+        # Optional BM25 index kept in step with the vector store
+        self.lexical_index = lexical_index
+        # Optional MinHash index; near-duplicate chunks are linked instead of embedded
+        self.dedupe_index = dedupe_index
+        # Optional async fn(text) -> summary, run once per new or changed document
+        self.summarizer = summarizer
+        self.summary_version = summary_version
+        self.summary_concurrency = summary_concurrency
+        self.collection_name = collection_name
+        self.parse_workers = parse_workers or max(1, min(4, os.cpu_count() or 1))
+        self.embed_concurrency = embed_concurrency
+        self.embed_batch_size = embed_batch_size  # max chunks per embedding request
+        self.embed_batch_tokens = embed_batch_tokens  # max tokens per embedding request
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.queue_size = queue_size
+        self.stats = IngestionStats()
+
+    async def run(self, directory: str, pdf_files: list[str] = None) -> IngestionStats:
+        """Ingests every PDF in the directory (or the given subset) and returns the stats."""
+        if pdf_files is None:
+            pdf_files = await get_pdf_files(directory)
+        self.stats = IngestionStats()
+        start = time.perf_counter()
+
+        parsed_queue = asyncio.Queue(maxsize=self.queue_size)
+        upsert_queue = asyncio.Queue(maxsize=self.queue_size)
+        summary_queue = asyncio.Queue(maxsize=self.queue_size)
+        embed_semaphore = asyncio.Semaphore(self.embed_concurrency)
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            parser = asyncio.create_task(self._parse_stage(pool, directory, pdf_files, parsed_queue))
+            embedders = [
+                asyncio.create_task(self._embed_stage(parsed_queue, upsert_queue, embed_semaphore))
+                for _ in range(2)
+            ]
+            upserter = asyncio.create_task(self._upsert_stage(upsert_queue, summary_queue))
+            summarizers = [
+                asyncio.create_task(self._summary_stage(summary_queue))
+                for _ in range(self.summary_concurrency if self.summarizer is not None else 0)
+            ]
+
+            await parser
+            for _ in embedders:
+                await parsed_queue.put(_DONE)
+            await asyncio.gather(*embedders)
+            await upsert_queue.put(_DONE)
+            await upserter
+            for _ in summarizers:
+                await summary_queue.put(_DONE)
+            await asyncio.gather(*summarizers)
+
+        self.stats.wall_seconds = time.perf_counter() - start
+        logger.info(f"Ingestion finished: {self.stats.report()}")
+        return self.stats
+
+    async def _parse_stage(self, pool, directory, pdf_files, parsed_queue):
+        loop = asyncio.get_running_loop()
+        # Bound in-flight parses so finished documents wait on the queue, not in memory
+        in_flight = asyncio.Semaphore(self.parse_workers + self.queue_size)
+
+        async def parse_one(pdf_file):
+            async with in_flight:
+                logger.debug(f"Processing PDF: {pdf_file}")
+                self.stats.parse.mark()
+                content_hash = await asyncio.to_thread(get_file_hash, directory, pdf_file)
+                state = await self.repository.get_ingest_state(pdf_file)
+                if state and state["status"] == "complete" and state["content_hash"] == content_hash:
+                    logger.debug(f"Skipping unchanged PDF: {pdf_file}")
+                    self.stats.skipped_files += 1
+                    return
+
+                document_id = document_id_from_hash(content_hash, pdf_file)
+                try:
+                    parsed = await loop.run_in_executor(
+                        pool,
+                        parse_and_chunk,
+                        directory,
+                        pdf_file,
+                        document_id,
+                        self.utility.model.value,
+                        self.chunk_tokens,
+                        self.overlap_tokens,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to parse {pdf_file}: {str(e)}")
+                    parsed = None
+                if parsed is None or not parsed["chunks"]:
+                    logger.error(f"Failed to load {pdf_file}")
+                    self.stats.failed_files += 1
+                    return
+
+                chunk_numbers = list(range(1, len(parsed["chunks"]) + 1))
+                plan = None
+                if self.dedupe_index is not None:
+                    plan = await asyncio.to_thread(self.dedupe_index.plan, parsed["metadata"], parsed["chunks"])
+                    chunk_numbers = plan.keep
+                    self.stats.duplicate_chunks += len(plan.links)
+
+                # Deterministic for the same chunks, so a resumed ingest packs the same batches
+                chunk_tokens = parsed["chunk_tokens"]
+                batches = list(
+                    pack_batches(
+                        chunk_numbers,
+                        token_count=lambda number: chunk_tokens[number - 1],
+                        max_items=self.embed_batch_size,
+                        max_tokens=self.embed_batch_tokens,
+                    )
+                )
+                total_batches = len(batches)
+                resume_from = 0
+                if (
+                    state
+                    and state["status"] in ("in_progress", "failed")
+                    and state["content_hash"] == content_hash
+                    and state["total_batches"] == total_batches
+                ):
+                    resume_from = state["batches_done"]
+                    self.stats.resumed_files += 1
+                    logger.info(f"Resuming {pdf_file} at batch {resume_from} of {total_batches}")
+                else:
+                    await self.repository.start_ingest(pdf_file, document_id, content_hash, total_batches)
+
+                parsed.update(
+                    document_id=document_id,
+                    content_hash=content_hash,
+                    batches=batches,
+                    dedupe_plan=plan,
+                    total_batches=total_batches,
+                    resume_from=resume_from,
+                )
+                self.stats.parse.mark(parsed["pages"])
+                self.stats.chunks += len(parsed["chunks"])
+                await parsed_queue.put(parsed)
+
+        await asyncio.gather(*(parse_one(pdf_file) for pdf_file in pdf_files))
+
+    async def _embed_batch(self, batch, embed_semaphore):
+        async with embed_semaphore:
+            self.stats.embed.mark()
+            vectors = await self.utility.acreate_embeddings_from_text(batch)
+            self.stats.embed.mark(len(vectors))
+            return vectors
+
+    async def _embed_stage(self, parsed_queue, upsert_queue, embed_semaphore):
+        while True:
+            parsed = await parsed_queue.get()
+            if parsed is _DONE:
+                return
+            batch_indexes = range(parsed["resume_from"], parsed["total_batches"])
+            tasks = [
+                asyncio.create_task(self._embed_batch(self._batch_chunks(parsed, i)[1], embed_semaphore))
+                for i in batch_indexes
+            ]
+            if not tasks:
+                # Every batch was upserted before an interruption; only the completion step is left
+                await upsert_queue.put((parsed, None, None))
+                continue
+
+            # Hand batches to the upsert stage in order so the checkpoint is a simple count
+            for batch_index, task in zip(batch_indexes, tasks):
+                try:
+                    vectors = await task
+                except Exception as e:
+                    logger.error(f"Failed to embed {parsed['pdf_file']} batch {batch_index}: {str(e)}")
+                    self.stats.failed_files += 1
+                    for pending in tasks:
+                        pending.cancel()
+                    # Retrieve every sibling's outcome so none is reported as never retrieved
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    await self._mark_failed(parsed["pdf_file"])
+                    break
+                await upsert_queue.put((parsed, batch_index, vectors))
+
+    async def _mark_failed(self, pdf_file: str):
+        """Records a failed file in ingest_state; the stage keeps going even if that write fails."""
+        try:
+            await self.repository.fail_ingest(pdf_file)
+        except Exception as e:
+            logger.error(f"Could not record the failed ingest of {pdf_file}: {str(e)}")
+
+    def _batch_chunks(self, parsed, batch_index) -> tuple[list[int], list[str]]:
+        """Chunk numbers and texts of one embedding batch."""
+        numbers = parsed["batches"][batch_index]
+        return numbers, [parsed["chunks"][number - 1] for number in numbers]
+
+    async def _upsert_stage(self, upsert_queue, summary_queue):
+        while True:
+            item = await upsert_queue.get()
+            if item is _DONE:
+                return
+            parsed, batch_index, vectors = item
+            pdf_file = parsed["pdf_file"]
+            if parsed.get("failed"):
+                continue  # keep the checkpoint at the last batch that actually landed
+            try:
+                if vectors is not None:
+                    self.stats.upsert.mark()
+                    numbers, chunks = self._batch_chunks(parsed, batch_index)
+                    # Same ids and payloads as insert_documents, but chunk numbers may skip linked duplicates
+                    metadata = parsed["metadata"]
+                    ids = [point_id(parsed["document_id"], number) for number in numbers]
+                    payloads = [
+                        {**metadata, "chunk_number": number, "chunk_text": chunk} for number, chunk in zip(numbers, chunks)
+                    ]
+                    await self.qdrant.aupsert_points(ids, vectors, payloads)
+                    if self.lexical_index is not None:
+                        await asyncio.to_thread(self.lexical_index.add_points, zip(ids, payloads))
+                    if parsed["dedupe_plan"] is not None:
+                        signatures = parsed["dedupe_plan"].signatures
+                        await asyncio.to_thread(
+                            self.dedupe_index.add, metadata, {number: signatures[number] for number in numbers if number in signatures}
+                        )
+                    self.stats.upsert.mark(len(vectors))
+                    await self.repository.mark_batches_done(pdf_file, batch_index + 1)
+                if vectors is None or batch_index + 1 == parsed["total_batches"]:
+                    await self._complete_document(parsed, summary_queue)
+            except Exception as e:
+                logger.error(f"Failed to upsert {pdf_file}: {str(e)}")
+                parsed["failed"] = True
+                self.stats.failed_files += 1
+                await self._mark_failed(pdf_file)
+
+    async def _complete_document(self, parsed, summary_queue):
+        """Drops vectors of earlier versions of the file, records it in the catalog and queues its summary."""
+        pdf_file = parsed["pdf_file"]
+        metadata = parsed["metadata"]
+        if self.dedupe_index is not None:
+            # Other documents' links to the old version's chunks move to one of those documents first
+            promotions = await asyncio.to_thread(self.dedupe_index.delete_documents_by_name, pdf_file, parsed["document_id"])
+            promoted = await asyncio.to_thread(self.qdrant.promote_chunks, promotions)
+            if self.lexical_index is not None and promoted:
+                await asyncio.to_thread(self.lexical_index.add_points, promoted)
+            await asyncio.to_thread(self.dedupe_index.link, metadata, parsed["dedupe_plan"].links)
+        await asyncio.to_thread(self.qdrant.delete_documents_by_name, pdf_file, parsed["document_id"])
+        if self.lexical_index is not None:
+            await asyncio.to_thread(self.lexical_index.delete_documents_by_name, pdf_file, parsed["document_id"])
+        await self.repository.delete_stale_documents(pdf_file, parsed["document_id"])
+        await self.repository.insert_document(
+            parsed["document_id"], pdf_file, metadata["title"], json.dumps(metadata), metadata["subject"]
+        )
+        await self.repository.complete_ingest(pdf_file)
+        self.stats.files += 1
+        logger.debug(f"Finished ingesting {pdf_file}")
+        if self.summarizer is not None:
+            # Blocks only when summary_concurrency summaries and a full queue are already waiting
+            await summary_queue.put(
+                (parsed["document_id"], pdf_file, parsed["content_hash"], merge_chunks(parsed["chunks"]))
+            )
+
+    async def _summary_stage(self, summary_queue):
+        """Precomputes document summaries so queries never summarize on the request path."""
+        while True:
+            item = await summary_queue.get()
+            if item is _DONE:
+                return
+            document_id, pdf_file, content_hash, text = item
+            self.stats.summarize.mark()
+            try:
+                summary = await self.summarizer(text)
+                await self.repository.save_summary(document_id, pdf_file, content_hash, self.summary_version, summary)
+            except Exception as e:
+                # The document is already searchable; queries will summarize it lazily instead
+                logger.error(f"Failed to summarize {pdf_file}: {str(e)}")
+                continue
+            self.stats.summarize.mark(1)
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    COLLECTION_NAME = "qt_document_collection"
+    utility = UtilityOpenAI()
+    qdrant = create_vector_store(COLLECTION_NAME, utility.get_embedding_dimension())
+    stats = asyncio.run(IngestionPipeline(utility, qdrant, COLLECTION_NAME).run("data/pdfs"))
+    logger.debug(stats.report())
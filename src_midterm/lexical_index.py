@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable
+from logger import logger
+from qdrant import point_id, payload_matches
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, "lexical_index.db")
+
+# Query words that carry no retrieval signal; clinical terms are never in here
+STOPWORDS = frozenset(
+    """a an and are as at be by can do does for from how i in is it of on or should that the this to was what
+    when which who why will with you your my me we our there their they after before about into than then""".split()
+)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased alphanumeric terms without stopwords."""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS and len(term) > 1]
+
+
+class LexicalIndex:
+    """Persistent BM25 inverted index over the same chunks (and point ids) as the vector store.
+
+    Postings are held in memory for sub-millisecond queries and mirrored to SQLite so the
+    index survives restarts. Chunks are added and deleted incrementally alongside the
+    vector store during ingestion. Writers commit to SQLite first and then update memory
+    under the lock searches share, so a search never waits on a commit and a failed write
+    leaves memory as it was.
+    """
+
+    CREATE_TABLES = """
+    CREATE TABLE IF NOT EXISTS lexical_chunk (
+        point_id TEXT PRIMARY KEY,
+        document_id TEXT NOT NULL,
+        document_name TEXT,
+        length INTEGER NOT NULL,
+        payload TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS lexical_posting (
+        term TEXT NOT NULL,
+        point_id TEXT NOT NULL,
+        tf INTEGER NOT NULL,
+        PRIMARY KEY (term, point_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_lexical_posting_point ON lexical_posting (point_id);
+    CREATE INDEX IF NOT EXISTS idx_lexical_chunk_document_id ON lexical_chunk (document_id);
+    CREATE INDEX IF NOT EXISTS idx_lexical_chunk_document_name ON lexical_chunk (document_name);
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()  # in-memory index
+        self._write_lock = threading.Lock()  # serializes writers so SQLite sees changes in memory order
+        self._postings: dict[str, dict[str, int]] = {}  # term -> point id -> term frequency
+        self._lengths: dict[str, int] = {}  # point id -> number of terms
+        self._terms: dict[str, list[str]] = {}  # point id -> distinct terms, for deletes
+        self._payloads: dict[str, dict] = {}
+        self._total_length = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        self.connection.executescript(self.CREATE_TABLES)
+        self.connection.commit()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _load(self):
+        for pid, length, payload in self.connection.execute("SELECT point_id, length, payload FROM lexical_chunk;"):
+            self._lengths[pid] = length
+            self._payloads[pid] = json.loads(payload)
+            self._terms[pid] = []
+            self._total_length += length
+        for term, pid, tf in self.connection.execute("SELECT term, point_id, tf FROM lexical_posting;"):
+            self._postings.setdefault(term, {})[pid] = tf
+            self._terms.setdefault(pid, []).append(term)
+        if self._lengths:
+            logger.info(f"Loaded lexical index with {len(self._lengths)} chunks and {len(self._postings)} terms")
+
+    def add_points(self, points: Iterable[tuple[str, dict]]):
+        """Indexes (point id, payload) pairs by their chunk_text, replacing earlier versions of the same ids."""
+        latest = {}  # point id -> payload; a repeated id keeps its last payload
+        for pid, payload in points:
+            if "chunk_text" in payload:
+                latest[pid] = payload
+        if not latest:
+            return
+        indexed = [(pid, payload, Counter(tokenize(payload["chunk_text"]))) for pid, payload in latest.items()]
+        rows = [
+            (pid, payload["document_id"], payload.get("document_name"), sum(counts.values()), json.dumps(payload))
+            for pid, payload, counts in indexed
+        ]
+        postings = [(term, pid, tf) for pid, _, counts in indexed for term, tf in counts.items()]
+
+        with self._write_lock:
+            try:
+                self._delete_rows(list(latest))
+                self.connection.executemany("INSERT INTO lexical_chunk VALUES (?, ?, ?, ?, ?);", rows)
+                self.connection.executemany("INSERT INTO lexical_posting VALUES (?, ?, ?);", postings)
+                self.connection.commit()
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+            with self._lock:
+                for pid, payload, counts in indexed:
+                    self._remove(pid)
+                    length = sum(counts.values())
+                    for term, tf in counts.items():
+                        self._postings.setdefault(term, {})[pid] = tf
+                    self._terms[pid] = list(counts)
+                    self._lengths[pid] = length
+                    self._payloads[pid] = payload
+                    self._total_length += length
+
+    def add_chunks(self, vectored_metadata: dict, chunks: list[str], first_chunk_number: int = 1):
+        """Indexes chunks with the same ids and payloads the vector store's insert_documents uses."""
+        document_id = vectored_metadata["document_id"]
+        self.add_points(
+            (point_id(document_id, first_chunk_number + offset), {**vectored_metadata, "chunk_number": first_chunk_number + offset, "chunk_text": chunk})
+            for offset, chunk in enumerate(chunks)
+        )
+
+    def _remove(self, pid: str):
+        """Drops a chunk from the in-memory index; the caller holds the lock."""
+        for term in self._terms.pop(pid, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(pid, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(pid, 0)
+        self._payloads.pop(pid, None)
+
+    def _delete_rows(self, pids: list[str]):
+        self.connection.executemany("DELETE FROM lexical_posting WHERE point_id = ?;", [(pid,) for pid in pids])
+        self.connection.executemany("DELETE FROM lexical_chunk WHERE point_id = ?;", [(pid,) for pid in pids])
+
+    def _delete_where(self, predicate):
+        with self._write_lock:
+            with self._lock:
+                pids = [pid for pid, payload in self._payloads.items() if predicate(payload)]
+            if pids:
+                try:
+                    self._delete_rows(pids)
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                with self._lock:
+                    for pid in pids:
+                        self._remove(pid)
+        return len(pids)
+
+    def delete_document(self, document_id: str):
+        """Removes every chunk of a document."""
+        self._delete_where(lambda payload: payload.get("document_id") == document_id)
+
+    def delete_documents(self, document_ids: list[str]):
+        """Removes every chunk of several documents."""
+        wanted = set(document_ids)
+        self._delete_where(lambda payload: payload.get("document_id") in wanted)
+
+    def delete_documents_by_name(self, document_name: str, keep_document_id: str = None):
+        """Removes every chunk loaded from the given file name, optionally keeping one document_id."""
+        self._delete_where(
+            lambda payload: payload.get("document_name") == document_name
+            and (keep_document_id is None or payload.get("document_id") != keep_document_id)
+        )
+
+    def search(self, query: str, top_k: int = 5, filters: dict = None) -> list[dict]:
+        """BM25 top-k; each hit has point_id, bm25, coverage (idf share of query terms it contains) and payload."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            count = len(self._lengths)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count
+            idf = {}
+            for term in terms:
+                frequency = len(self._postings.get(term, ()))
+                idf[term] = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            total_idf = sum(idf.values())
+
+            scores, matched = {}, {}
+            for term in terms:
+                for pid, tf in self._postings.get(term, {}).items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[pid] / average_length)
+                    scores[pid] = scores.get(pid, 0.0) + idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                    matched[pid] = matched.get(pid, 0.0) + idf[term]
+
+            if filters:
+                scores = {pid: score for pid, score in scores.items() if payload_matches(self._payloads[pid], filters)}
+            top = sorted(scores, key=scores.get, reverse=True)[:top_k]
+            return [
+                {"point_id": pid, "bm25": scores[pid], "coverage": matched[pid] / total_idf, "payload": self._payloads[pid]}
+                for pid in top
+            ]
+
+    @staticmethod
+    def confidence(hits: list[dict], margin: float = 1.5) -> float:
+        """How sure the lexical ranking is: the top hit's query coverage, or 0 when another document is close behind.
+
+        Only the best document matters for answering, so the margin is measured between the
+        top document's best chunk and the best chunk of any other document.
+        """
+        if not hits:
+            return 0.0
+        top = hits[0]
+        runner_up = next((hit for hit in hits[1:] if hit["payload"].get("document_id") != top["payload"].get("document_id")), None)
+        if runner_up is not None and top["bm25"] < margin * runner_up["bm25"]:
+            return 0.0
+        return top["coverage"]
+
+    def close(self):
+        with self._write_lock:
+            self.connection.close()
+
+
+def as_search_results(hits: list[dict], confidence: float) -> list[dict]:
+    """Shapes lexical hits like vector store results, scaling scores so the top hit carries the confidence."""
+    if not hits:
+        return []
+    top = hits[0]["bm25"]
+    return [{"score": confidence * hit["bm25"] / top, "metadata": hit["payload"]} for hit in hits]
+
+
+def fuse_results(dense: list[dict], lexical: list[dict], top_k: int, k: int = 60) -> list[dict]:
+    """Reciprocal rank fusion of vector store results and lexical hits, keyed by document_id and chunk_number.
+
+    Each fused result keeps the higher of its dense score and its scaled lexical score, so the
+    existing SEARCH_SCORE threshold still applies.
+    """
+    fused, results = {}, {}
+    lexical_results = as_search_results(lexical, lexical[0]["coverage"] if lexical else 0.0)
+    for ranked in (dense, lexical_results):
+        for rank, result in enumerate(ranked):
+            payload = result["metadata"]
+            if not isinstance(payload, dict):
+                continue  # "No relevant documents found." placeholder
+            key = (payload.get("document_id"), payload.get("chunk_number"))
+            fused[key] = fused.get(key, 0.0) + 1 / (k + rank + 1)
+            if key not in results or result["score"] > results[key]["score"]:
+                results[key] = {"score": result["score"], "metadata": payload}
+
+    ordered = [results[key] for key in sorted(fused, key=fused.get, reverse=True)[:top_k]]
+    return ordered or [{"score": 0, "metadata": "No relevant documents found."}]
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    index = LexicalIndex(":memory:")
+    metadata = {"document_id": "doc1", "document_name": "test1", "title": "Tennis elbow"}
+    index.add_chunks(metadata, ["Eccentric exercises reduce pain in lateral epicondylitis.", "Splinting is used for carpal tunnel."])
+    hits = index.search("eccentric exercises for lateral epicondylitis")
+    logger.info(hits)
+    logger.info(f"Confidence: {LexicalIndex.confidence(hits)}")
@@ -1,9 +1,21 @@
+import os
+import random
 import logging
 
+# INFO by default; set LOG_LEVEL=DEBUG to see per-call details
 logging.basicConfig(
-    level=logging.DEBUG, 
-    format="%(asctime)s - %(levelname)s - %(message)s",  
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
 # Create a global logger instance
 logger = logging.getLogger("app_logger")
+
+# Fraction of hot-path messages that are actually emitted
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+
+def log_sampled(level: int, msg: str, *args, rate: float = LOG_SAMPLE_RATE):
+    """Logs a hot-path message lazily and only for a sample of calls; free when the level is disabled."""
+    if logger.isEnabledFor(level) and random.random() < rate:
+        logger.log(level, msg, *args)
@@ -1,21 +1,31 @@
 import asyncio
 import chainlit as cl
+from chainlit.input_widget import Select
+from chainlit.server import app
+from fastapi import Request
+from fastapi.responses import PlainTextResponse, Response
 from langgraph.graph import StateGraph, END
 from chains import (
     run_research_vector_store_node,
     run_research_llm_node,
-    format_final_chain
+    report_progress,
+    AnswerMode,
+    get_chain,
+    warm_up
 )
+from metrics import metrics, timed, span, loop_lag_monitor, profile_request
 from typing import Dict, TypedDict
 
 
 # Define the state schema using TypedDict
 class QueryState(TypedDict):
     user_query: str
+    answer_mode: str
     research_response: str
     final_response: str
 
 
+@timed("node_supervisor")
 async def supervisor_node(state: QueryState) -> Dict:
     """Decides where to route the query."""
     if state.get("final_response"):
@@ -23,29 +33,49 @@ async def supervisor_node(state: QueryState) -> Dict:
     return {"next": "research"}
 
 
+@timed("node_research")
 async def research_node(state: QueryState) -> QueryState:
     """Calls vector store first, then falls back to LLM if needed."""
     user_query = state["user_query"]
 
-    research_response = await run_research_vector_store_node(user_query)
+    answer_mode = state.get("answer_mode") or AnswerMode.DOCUMENT.value
+    research_response = await run_research_vector_store_node(user_query, answer_mode)
 
     if research_response == "NO DOCUMENT FOUND":
+        await report_progress("fallback")
         research_response = await run_research_llm_node(user_query)
 
     state["research_response"] = research_response
     return state
 
 
+@timed("node_post_processing")
 async def post_processing_node(state: QueryState) -> QueryState:
     """Formats the final response before returning it."""
-    formatted_response = format_final_chain.invoke(
-        {"messages": [{"role": "system", "content": state["research_response"]}]}
-    )
+    await report_progress("format")
+    # ainvoke plus the tag lets run_graph stream this stage token by token
+    with span("format"):
+        formatted_response = await get_chain("format_final_chain").ainvoke(
+            {"messages": [{"role": "system", "content": state["research_response"]}]},
+            config={"tags": [FINAL_ANSWER_TAG]},
+        )
 
     state["final_response"] = formatted_response.content  # Update state
     return state  # Ensure state is returned correctly
 
 
+FINAL_ANSWER_TAG = "final_answer"
+
+# Status line shown to the user for each progress event from the pipeline
+PROGRESS_MESSAGES = {
+    "retrieval": "🔎 Searching the research library...",
+    "summarization": "📄 Summarizing the matching document...",
+    "answer": "🧠 Drafting an answer from the document...",
+    "fallback": "🧠 No matching document, drafting an answer...",
+    "format": "✍️ Formatting the answer...",
+}
+
+
 # Define LangGraph with state schema
 graph = StateGraph(QueryState)
 
@@ -64,24 +94,73 @@ graph.set_entry_point("supervisor")
 research_graph_executor = graph.compile()
 
 
-async def run_graph(user_query: str):
-    """Run the LangGraph pipeline."""
-    initial_state: QueryState = {"user_query": user_query, "research_response": "", "final_response": ""}
+async def run_graph(user_query: str, answer_message: cl.Message = None, answer_mode: str = AnswerMode.DOCUMENT.value):
+    """Run the LangGraph pipeline, streaming progress and the final answer's tokens to Chainlit."""
+    initial_state: QueryState = {
+        "user_query": user_query,
+        "answer_mode": answer_mode,
+        "research_response": "",
+        "final_response": "",
+    }
+    progress_message = None
+    final_response = None
+
+    async for event in research_graph_executor.astream_events(initial_state, version="v2"):
+        kind = event["event"]
+
+        if kind == "on_custom_event" and event["name"] == "progress":
+            status = PROGRESS_MESSAGES.get(event["data"]["stage"], event["data"]["stage"])
+            if progress_message is None:
+                progress_message = cl.Message(content=status)
+                await progress_message.send()
+            else:
+                progress_message.content = status
+                await progress_message.update()
 
-    async for output in research_graph_executor.astream(initial_state):
-        final_state = output  # Capture the last state
+        elif kind == "on_chat_model_stream" and FINAL_ANSWER_TAG in event.get("tags", []) and answer_message:
+            token = event["data"]["chunk"].content
+            if token:
+                if progress_message is not None:
+                    # The answer itself is now visible, the status line is no longer needed
+                    await progress_message.remove()
+                    progress_message = None
+                await answer_message.stream_token(token)
 
-        # If using Chainlit, yield intermediate state updates
-        if "research_response" in final_state:
-            await cl.Message(content=f"**Research Response:**\n{final_state['research_response']}").send()
+        elif kind == "on_chain_end" and event["name"] == "post_processing":
+            final_response = event["data"]["output"].get("final_response")
 
-    if "post_processing" in final_state and "final_response" in final_state["post_processing"]:
-        return final_state["post_processing"]["final_response"]
+    if progress_message is not None:
+        await progress_message.remove()
 
-    return "No response generated."
+    return final_response or "No response generated."
 
 
 # Chainlit App
+_warm_up_task = None
+
+
+@cl.on_chat_start
+async def on_chat_start():
+    """Starts building the API clients in the background while the user types."""
+    global _warm_up_task
+    # Warm up once per process; retry on a later session if the last attempt failed
+    if _warm_up_task is None or (_warm_up_task.done() and _warm_up_task.exception()):
+        _warm_up_task = asyncio.create_task(warm_up())
+    loop_lag_monitor.start()
+
+    await cl.ChatSettings(
+        [
+            Select(
+                id="answer_mode",
+                label="Answer mode",
+                values=[mode.value for mode in AnswerMode],
+                initial_index=0,
+                description="document: summarize the best document first. chunks: answer from the retrieved passages in one call.",
+            )
+        ]
+    ).send()
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
     """Handle incoming messages in Chainlit."""
@@ -90,10 +169,29 @@ async def on_message(message: cl.Message):
         return
 
     user_query = message.content
-    response = await run_graph(user_query)
+    header = "**Final Answer:**\n"
+    answer_message = cl.Message(content=header)
+    settings = cl.user_session.get("chat_settings") or {}
+    with profile_request("on_message"), span("request"):
+        response = await run_graph(user_query, answer_message, settings.get("answer_mode", AnswerMode.DOCUMENT.value))
+
+    if answer_message.content == header:
+        # Nothing was streamed (e.g. the model didn't stream), send the whole answer at once
+        answer_message.content += response
+    await answer_message.send()
+
+
+async def metrics_endpoint(request: Request):
+    """Per-stage latency histograms and event-loop lag, as Prometheus text or ?format=json."""
+    if request.query_params.get("format") == "json":
+        return Response(content=metrics.to_json(), media_type="application/json")
+    return PlainTextResponse(metrics.to_prometheus())
 
-    await cl.Message(content=f"**Final Answer:**\n{response}").send()
 
+# Chainlit has already registered its catch-all "/{full_path:path}" route when this module is
+# imported, so a route appended with @app.get would never match; put /metrics in front instead.
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+app.router.routes.insert(0, app.router.routes.pop())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+import os
+import io
+import time
+import json
+import bisect
+import pstats
+import asyncio
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from logger import logger
+
+# Seconds; covers everything from a cache hit to a long summarization
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "profiles")
+_profile_lock = threading.Lock()  # held by the one request being profiled
+_span_recorder = ContextVar("span_recorder", default=None)  # stage -> [seconds] while record_spans is active
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "sum": round(self.sum, 6), "count": self.count}
+
+
+class MetricsRegistry:
+    """Process-wide histograms and gauges, exportable as Prometheus text or JSON."""
+
+    def __init__(self):
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._gauges = {}  # (name, labels) -> float
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def to_json(self) -> str:
+        with self._lock:
+            data = {
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.snapshot()}
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._gauges.items()
+                ],
+            }
+        return json.dumps(data)
+
+    def to_prometheus(self) -> str:
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (hist_name, labels), histogram in self._histograms.items():
+                    if hist_name != name:
+                        continue
+                    snapshot = histogram.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {snapshot['sum']}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {snapshot['count']}")
+            for name in sorted({name for name, _ in self._gauges}):
+                lines.append(f"# TYPE {name} gauge")
+                for (gauge_name, labels), value in self._gauges.items():
+                    if gauge_name == name:
+                        lines.append(f"{name}{fmt_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def span(stage: str):
+    """Times a block into the stage_duration_seconds histogram; works inside async code too."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", seconds, stage=stage, status=status)
+        recorded = _span_recorder.get()
+        if recorded is not None:
+            recorded.setdefault(stage, []).append(seconds)
+
+
+@contextmanager
+def record_spans():
+    """Collects the raw seconds of every span that ends inside the block, by stage.
+
+    Tasks and to_thread calls started in the block inherit the recorder, so the spans of
+    one request can be told apart from those of requests running alongside it.
+    """
+    recorded = {}
+    token = _span_recorder.set(recorded)
+    try:
+        yield recorded
+    finally:
+        _span_recorder.reset(token)
+
+
+def timed(stage: str):
+    """Decorator version of span for async functions."""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task; high lag means something is blocking it."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        """Starts monitoring the running loop; calling it again is a no-op."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            metrics.set_gauge("event_loop_lag_seconds", round(lag, 6))
+            metrics.observe("event_loop_lag", lag)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+loop_lag_monitor = EventLoopLagMonitor()
+
+
+@contextmanager
+def profile_request(name: str, enabled: bool = None):
+    """Opt-in cProfile of one request, enabled per call or with PROFILE_REQUESTS=1.
+
+    The profile covers everything the thread runs meanwhile, including other sessions'
+    tasks on the same event loop, so it is meant for targeted debugging.
+    """
+    if enabled is None:
+        enabled = os.getenv("PROFILE_REQUESTS") == "1"
+    # Only one cProfile can be active at a time (enable() raises otherwise), so requests
+    # that arrive while another is being profiled simply run unprofiled
+    if not enabled or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{int(time.time() * 1000)}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        logger.info("Profile for %s written to %s\n%s", name, path, summary.getvalue())
@@ -1,53 +1,353 @@
 import uuid
-from qdrant_client import QdrantClient
+import asyncio
+from datetime import date, datetime, timezone
+from enum import Enum
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import ScoredPoint, Filter, FieldCondition, MatchValue, PointStruct, Distance, VectorParams, MatchValue
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    DatetimeRange,
+    Disabled,
+    HasIdCondition,
+    MatchAny,
+    PayloadSchemaType,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+)
 from utils_openai import UtilityOpenAI
 from templates import MetaDataModel
 from logger import logger
+from metrics import span
 from typing import List, Optional
 from dotenv import load_dotenv
 import os
-import hashlib
 
 load_dotenv()
 
+QDRANT_URL = os.getenv("QDRANT_URL", "https://40c458f2-24a9-4153-b15b-0addf6a6bbcf.us-east-1-0.aws.cloud.qdrant.io:6333")
+
+
+class Quantization(Enum):
+    NONE = "none"  # full-precision float32, about 6 KB per 1536-dim vector
+    SCALAR = "scalar"  # int8, 4x smaller, near-lossless after rescoring
+    BINARY = "binary"  # 1 bit per dimension, 32x smaller, needs more oversampling
+
+
+# How many extra candidates the quantized index returns for rescoring against the originals
+DEFAULT_OVERSAMPLING = {Quantization.NONE: None, Quantization.SCALAR: 2.0, Quantization.BINARY: 3.0}
+
+
+def quantization_config(quantization: Quantization):
+    """Qdrant quantization config for a mode; quantized vectors stay in RAM, originals may live on disk."""
+    if quantization == Quantization.SCALAR:
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == Quantization.BINARY:
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+# Payload fields that deletes and scoped searches filter on; each gets a Qdrant payload index
+PAYLOAD_INDEXES = {
+    "document_id": PayloadSchemaType.KEYWORD,
+    "document_name": PayloadSchemaType.KEYWORD,
+    "subject": PayloadSchemaType.KEYWORD,
+    "tags": PayloadSchemaType.KEYWORD,
+    "document_date": PayloadSchemaType.DATETIME,
+}
+DATE_BOUNDS = ("gt", "gte", "lt", "lte")
+DOCUMENT_FIELDS = ("document_id", "document_name")
+# Filter key holding the canonical point ids of near-duplicate chunks linked from the documents
+# the document_id/document_name conditions select (see dedupe); those points match them too
+LINKED_POINTS = "linked_point_ids"
+
+
+def parse_datetime(value) -> datetime:
+    """Reads an ISO date or datetime the way Qdrant's DATETIME index does: timezone-aware, naive values in UTC."""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    else:
+        text = str(value).strip()
+        if text[-1:] in ("Z", "z"):
+            text = text[:-1] + "+00:00"  # fromisoformat only reads "Z" from Python 3.11
+        parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _check_filters(filters: dict):
+    unknown = set(filters) - set(PAYLOAD_INDEXES) - {LINKED_POINTS}
+    if unknown:
+        # Filtering on a field without a payload index would make Qdrant scan the collection
+        raise ValueError(f"Cannot filter on {sorted(unknown)}; indexed fields are {sorted(PAYLOAD_INDEXES)}.")
+    date_range = filters.get("document_date")
+    if date_range is not None and (not isinstance(date_range, dict) or set(date_range) - set(DATE_BOUNDS)):
+        raise ValueError(f"document_date takes a dict with any of {DATE_BOUNDS}.")
+    for limit in (date_range or {}).values():
+        try:
+            parse_datetime(limit)
+        except (TypeError, ValueError):
+            raise ValueError(f"document_date bound {limit!r} is not an ISO date or datetime.")
+
+
+def build_filter(filters: dict = None) -> Optional[Filter]:
+    """Turns {"subject": "Tennis elbow", "tags": ["rehab"], "document_date": {"gte": "2020-01-01"}} into a Qdrant Filter.
+
+    A string matches the field exactly, a list matches any of its values (for tags: any
+    tag), and document_date takes gt/gte/lt/lte bounds. Only indexed fields are allowed.
+    With linked_point_ids, the document conditions also let those point ids through.
+    """
+    if not filters:
+        return None
+    _check_filters(filters)
+    linked = filters.get(LINKED_POINTS)
+    conditions, document_conditions = [], []
+    for key, value in filters.items():
+        if key == LINKED_POINTS:
+            continue
+        if key == "document_date":
+            condition = FieldCondition(key=key, range=DatetimeRange(**value))
+        elif isinstance(value, (list, tuple, set)):
+            condition = FieldCondition(key=key, match=MatchAny(any=list(value)))
+        else:
+            condition = FieldCondition(key=key, match=MatchValue(value=value))
+        (document_conditions if linked and key in DOCUMENT_FIELDS else conditions).append(condition)
+    if document_conditions:
+        conditions.append(Filter(should=[Filter(must=document_conditions), HasIdCondition(has_id=list(linked))]))
+    return Filter(must=conditions) if conditions else None
+
+
+def payload_matches(payload: dict, filters: dict = None) -> bool:
+    """Evaluates build_filter's semantics against a payload, for the in-process indexes."""
+    if not filters:
+        return True
+    _check_filters(filters)
+    linked = filters.get(LINKED_POINTS)
+    is_linked = bool(linked) and point_id(payload.get("document_id"), payload.get("chunk_number")) in linked
+    for key, value in filters.items():
+        if key == LINKED_POINTS or (is_linked and key in DOCUMENT_FIELDS):
+            continue
+        field = payload.get(key)
+        if key == "document_date":
+            # Compared as UTC instants like Qdrant's DatetimeRange, not as strings, so dates,
+            # datetimes and other offsets give the same answer on every backend
+            try:
+                field = parse_datetime(field)
+            except (TypeError, ValueError):
+                return False  # missing or not a date: Qdrant has nothing indexed for it either
+            for bound, limit in value.items():
+                limit = parse_datetime(limit)
+                if (
+                    (bound == "gt" and not field > limit) or (bound == "gte" and not field >= limit)
+                    or (bound == "lt" and not field < limit) or (bound == "lte" and not field <= limit)
+                ):
+                    return False
+            continue
+        wanted = set(value) if isinstance(value, (list, tuple, set)) else {value}
+        present = set(field) if isinstance(field, list) else {field}
+        if not wanted & present:
+            return False
+    return True
+
+
+def point_id(document_id: str, chunk_number: int) -> str:
+    """Deterministic point ID for a chunk, so re-ingesting a document overwrites its own points."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{document_id}/{chunk_number}"))
+
+
+def fill_linked_chunks(document_id: str, payloads: list[dict], links: dict, canonical_payloads: dict) -> list[dict]:
+    """Adds a document's near-duplicate chunks, stored once under another document's point, to its payloads.
+
+    links maps chunk numbers to canonical point ids (see NearDuplicateIndex.document_links) and
+    canonical_payloads maps those ids to their payloads; a link whose point is gone stays a hole.
+    """
+    if not links:
+        return payloads
+    template = payloads[0] if payloads else None
+    filled = list(payloads)
+    for chunk_number, canonical in links.items():
+        source = canonical_payloads.get(canonical)
+        if source is not None:
+            filled.append({**linked_payload(template, source, document_id, chunk_number), "canonical_point_id": canonical})
+    return sorted(filled, key=lambda payload: payload.get("chunk_number", 0))
+
+
+def linked_payload(template: Optional[dict], source: dict, document_id: str, chunk_number: int, document_name: str = None) -> dict:
+    """Payload of chunk_number of document_id whose text is the source chunk's; the metadata comes from template if given."""
+    payload = {**(template or source), "document_id": document_id, "chunk_number": chunk_number}
+    if template is None and document_name is not None:
+        payload["document_name"] = document_name
+    payload.pop("chunk_text", None)
+    if "chunk_text" in source:
+        payload["chunk_text"] = source["chunk_text"]
+    return payload
+
+
+def merge_payloads(payloads: list[dict]) -> Optional[str]:
+    """Merges a document's ordered chunk payloads into its text; None if any chunk lacks text or is missing."""
+    if not payloads or any("chunk_text" not in payload for payload in payloads):
+        return None
+    numbers = [payload.get("chunk_number") for payload in payloads]
+    if None not in numbers and numbers != list(range(1, len(numbers) + 1)):
+        # Joining across a hole would run two distant passages together
+        logger.debug("Chunks %s are not contiguous, not rebuilding the text", numbers)
+        return None
+    return merge_chunks([payload["chunk_text"] for payload in payloads])
+
+
+def merge_chunks(chunks: list[str], max_overlap: int = 400) -> str:
+    """Joins ordered chunks back into one text, dropping the overlap the splitter added."""
+    if not chunks:
+        return ""
+    merged = chunks[0]
+    for chunk in chunks[1:]:
+        overlap = 0
+        for size in range(min(max_overlap, len(merged), len(chunk)), 0, -1):
+            if merged.endswith(chunk[:size]):
+                overlap = size
+                break
+        merged += chunk[overlap:] if overlap else "\n" + chunk
+    return merged
+
+
 class UtilityQdrant:
-    def __init__(self, collection_name: str, embedding_dim: int = 1536, hit_score: float = 0.60):
-        self.local_store = False
+    def __init__(
+        self,
+        collection_name: str,
+        embedding_dim: int = 1536,
+        hit_score: float = 0.60,
+        location: str = None,
+        quantization: Quantization = None,
+        oversampling: float = None,
+    ):
+        # location=":memory:" (or a local path) keeps everything in-process, e.g. for benchmarks
+        self.local_store = location is not None
         self.api_key = os.getenv("QDRANT_CLOUD_API_KEY")
 
         if self.local_store:
-            self.client = QdrantClient(":memory:")
+            self.client = QdrantClient(location)
+            # A second in-memory client would be a separate store, so async calls use the sync client in a thread
+            self.async_client = None
         else:
-            self.client = QdrantClient("https://40c458f2-24a9-4153-b15b-0addf6a6bbcf.us-east-1-0.aws.cloud.qdrant.io:6333", api_key=self.api_key)  
+            self.client = QdrantClient(QDRANT_URL, api_key=self.api_key)
+            self.async_client = AsyncQdrantClient(QDRANT_URL, api_key=self.api_key)
             
 
+        # QDRANT_QUANTIZATION requests a mode when the caller doesn't; unset keeps whatever the collection has
+        requested = quantization or os.getenv("QDRANT_QUANTIZATION")
+        requested = Quantization(requested) if requested else None
+
         self.COLLECTION_NAME = collection_name  # "qt_document_collection"
-        self.create_collection(self.COLLECTION_NAME, embedding_dim)
+        self.create_collection(self.COLLECTION_NAME, embedding_dim, requested)
+        self.quantization = requested or self.get_quantization(self.COLLECTION_NAME)
+        self.oversampling = oversampling or float(os.getenv("QDRANT_OVERSAMPLING", 0)) or DEFAULT_OVERSAMPLING[self.quantization]
         self.hit_score = hit_score # used for tuning the search results
 
-    def create_collection(self, collection_name, embedding_dim):
-        """Creates a collection in Qdrant."""
+    @property
+    def search_params(self) -> Optional[SearchParams]:
+        """Oversample the quantized index, then rescore the candidates with the original vectors."""
+        if self.quantization == Quantization.NONE:
+            return None
+        return SearchParams(quantization=QuantizationSearchParams(ignore=False, rescore=True, oversampling=self.oversampling))
+
+    def create_collection(self, collection_name, embedding_dim, quantization: Quantization = None):
+        """Creates a collection in Qdrant, or migrates an existing one when a different quantization is requested."""
         # Check if the collection exists
         collections = self.client.get_collections().collections  # Extract collection objects
         collection_names = [col.name for col in collections]  # Extract collection names
 
         if collection_name in collection_names:
             logger.info(f"Collection '{collection_name}' already exists")
+            if quantization is not None and self.get_quantization(collection_name) != quantization:
+                self.set_quantization(collection_name, quantization)
+            self.create_payload_indexes(collection_name)
         else:
-            # Create the collection
+            quantization = quantization or Quantization.NONE
+            # Create the collection; with quantization the originals are only read for rescoring, so they can stay on disk
             self.client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+                vectors_config=VectorParams(
+                    size=embedding_dim, distance=Distance.COSINE, on_disk=quantization != Quantization.NONE
+                ),
+                quantization_config=quantization_config(quantization),
             )            
-            logger.info(f"Collection '{collection_name}' created")
+            logger.info(f"Collection '{collection_name}' created ({quantization.value} quantization)")
+            self.create_payload_indexes(collection_name)
+
+    def create_payload_indexes(self, collection_name):
+        """Creates any missing payload index from PAYLOAD_INDEXES; existing collections pick them up too."""
+        if self.local_store:
+            return  # local mode scans payloads anyway and only warns about indexes
+        existing = self.client.get_collection(collection_name).payload_schema or {}
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing:
+                self.client.create_payload_index(
+                    collection_name=collection_name, field_name=field_name, field_schema=schema, wait=True
+                )
+                logger.info(f"Created {schema.value} payload index on '{field_name}' in '{collection_name}'")
+
+    def get_quantization(self, collection_name) -> Quantization:
+        """Reads the quantization mode an existing collection was built with."""
+        config = self.client.get_collection(collection_name).config.quantization_config
+        if isinstance(config, ScalarQuantization):
+            return Quantization.SCALAR
+        if isinstance(config, BinaryQuantization):
+            return Quantization.BINARY
+        return Quantization.NONE
+
+    def set_quantization(self, collection_name, quantization: Quantization):
+        """Migrates a collection in place; Qdrant rebuilds the quantized vectors in the background, no re-upload."""
+        self.client.update_collection(
+            collection_name=collection_name,
+            quantization_config=quantization_config(quantization) or Disabled.DISABLED,
+        )
+        logger.info(f"Collection '{collection_name}' migrated to {quantization.value} quantization")
 
     def show_all_document_metadata(self):
         """Displays all metadata for documents in the collection."""
-        scroll_result, _ = self.client.scroll(collection_name=self.COLLECTION_NAME) 
-        for doc in scroll_result:  # Iterate through the list of documents
-            logger.info(doc.payload)  # Now doc has a `.payload` attribute
-
+        for _, payload, _ in self.scroll_points():  # every page, not just the first
+            logger.info(payload)
+
+    def count_points(self) -> int:
+        """Exact number of points in the collection."""
+        return self.client.count(collection_name=self.COLLECTION_NAME, exact=True).count
+
+    def upsert_points(self, ids: list[str], vectors, payloads: list[dict]):
+        """Writes raw points (e.g. from a snapshot) without rebuilding ids or payloads."""
+        points = [PointStruct(id=point, vector=vector, payload=payload) for point, vector, payload in zip(ids, vectors, payloads)]
+        with span("qdrant_upsert"):
+            self.client.upsert(collection_name=self.COLLECTION_NAME, points=points)
+
+    async def aupsert_points(self, ids: list[str], vectors, payloads: list[dict]):
+        """Async version of upsert_points."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.upsert_points, ids, vectors, payloads)
+        points = [PointStruct(id=point, vector=vector, payload=payload) for point, vector, payload in zip(ids, vectors, payloads)]
+        with span("qdrant_upsert"):
+            await self.async_client.upsert(collection_name=self.COLLECTION_NAME, points=points)
+
+
+    def scroll_points(self, batch_size: int = 256, with_vectors: bool = False):
+        """Yields (point id, payload, vector or None) for every point in the collection, one page at a time."""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.COLLECTION_NAME,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            for point in points:
+                yield str(point.id), point.payload, point.vector if with_vectors else None
+            if offset is None:
+                break
 
     def delete_document(self, document_id: str):
         """Deletes all vectors associated with a given document_id."""
@@ -70,13 +370,62 @@ class UtilityQdrant:
 
         logger.info(f"Deleted all vectors for document_id: {document_id}")
 
+    def delete_documents(self, document_ids: list[str]):
+        """Deletes the vectors of many documents in one request (uses the document_id payload index)."""
+        if not document_ids:
+            return
+        self.client.delete(
+            collection_name=self.COLLECTION_NAME,
+            points_selector=Filter(must=[FieldCondition(key="document_id", match=MatchAny(any=list(document_ids)))]),
+        )
+        logger.info(f"Deleted all vectors for {len(document_ids)} documents")
+
+    def delete_documents_by_name(self, document_name: str, keep_document_id: str = None):
+        """Deletes all vectors loaded from the given file name, optionally keeping one document_id."""
+        delete_filter = Filter(
+            must=[
+                FieldCondition(
+                    key="document_name",
+                    match=MatchValue(value=document_name)
+                )
+            ],
+            must_not=[
+                FieldCondition(
+                    key="document_id",
+                    match=MatchValue(value=keep_document_id)
+                )
+            ] if keep_document_id else None
+        )
+        self.client.delete(collection_name=self.COLLECTION_NAME, points_selector=delete_filter)
+        logger.info(f"Deleted stale vectors for document_name: {document_name}")
+
 
-    def insert_documents(self, collection_name, vectored_data, vectored_metadata):
-        """Inserts chunked documents into a Qdrant collection with metadata."""
+    def insert_documents(self, collection_name, vectored_data, vectored_metadata, chunks: list[str] = None, first_chunk_number: int = 1):
+        """Inserts chunked documents into a Qdrant collection with metadata.
 
-        logger.debug(f"Inserted metadata payload: {vectored_metadata}")
+        Point IDs are derived from (document_id, chunk_number) and each payload carries
+        its chunk_number and, when given, the chunk text.
+        """
 
+        points = self._build_points(vectored_data, vectored_metadata, chunks, first_chunk_number)
+
+        # Insert into Qdrant
+        with span("qdrant_upsert"):
+            self.client.upsert(collection_name=collection_name, points=points)
+        logger.debug("Inserted %d documents into '%s'", len(points), collection_name)
+
+    async def ainsert_documents(self, collection_name, vectored_data, vectored_metadata, chunks: list[str] = None, first_chunk_number: int = 1):
+        """Async version of insert_documents."""
+        if self.async_client is None:
+            return await asyncio.to_thread(
+                self.insert_documents, collection_name, vectored_data, vectored_metadata, chunks, first_chunk_number
+            )
+        points = self._build_points(vectored_data, vectored_metadata, chunks, first_chunk_number)
+        with span("qdrant_upsert"):
+            await self.async_client.upsert(collection_name=collection_name, points=points)
+        logger.debug("Inserted %d documents into '%s'", len(points), collection_name)
 
+    def _build_points(self, vectored_data, vectored_metadata, chunks, first_chunk_number) -> list[PointStruct]:
         # Ensure vectored_metadata is a dictionary (not a list)
         if not isinstance(vectored_metadata, dict):
             raise ValueError("Metadata must be a dictionary.")
@@ -84,34 +433,193 @@ class UtilityQdrant:
         # Ensure vectored_data is a list of embeddings
         if not isinstance(vectored_data, list) or not all(isinstance(v, list) for v in vectored_data):
             raise ValueError("vectored_data must be a list of vector lists.")
+
+        if chunks is not None and len(chunks) != len(vectored_data):
+            raise ValueError("chunks must line up with vectored_data.")
         
-        logger.debug(f"Embedding Count: {len(vectored_data)}")
+        logger.debug("Embedding Count: %d", len(vectored_data))
 
-        logger.debug("Metadata:", vectored_metadata)
+        document_id = vectored_metadata["document_id"]
 
         # Create the points
-        points = [
-            PointStruct(
-                id=hashlib.md5(str(vector).encode()).hexdigest(),  # Hash each individual vector
-                vector=vector,
-                payload=vectored_metadata
+        points = []
+        for offset, vector in enumerate(vectored_data):
+            chunk_number = first_chunk_number + offset
+            payload = {**vectored_metadata, "chunk_number": chunk_number}
+            if chunks is not None:
+                payload["chunk_text"] = chunks[offset]
+            points.append(PointStruct(id=point_id(document_id, chunk_number), vector=vector, payload=payload))
+        return points
+
+    def _retrieve_payloads(self, ids: list[str]) -> dict:
+        if not ids:
+            return {}
+        points = self.client.retrieve(collection_name=self.COLLECTION_NAME, ids=ids, with_payload=True, with_vectors=False)
+        return {str(point.id): point.payload for point in points}
+
+    async def _aretrieve_payloads(self, ids: list[str]) -> dict:
+        if not ids:
+            return {}
+        points = await self.async_client.retrieve(collection_name=self.COLLECTION_NAME, ids=ids, with_payload=True, with_vectors=False)
+        return {str(point.id): point.payload for point in points}
+
+    def get_chunks(self, document_id: str, chunk_numbers: list[int], links: dict = None) -> list[dict]:
+        """Fetches specific chunks of a document by their deterministic point IDs.
+
+        links (chunk number -> canonical point id) fills in near-duplicate chunks that were
+        stored once under another document.
+        """
+        links = {number: links[number] for number in chunk_numbers if number in links} if links else {}
+        wanted = [number for number in chunk_numbers if number not in links]
+        with span("qdrant_fetch"):
+            fetched = self._retrieve_payloads([point_id(document_id, number) for number in wanted] + list(links.values()))
+        payloads = [fetched[point_id(document_id, number)] for number in wanted if point_id(document_id, number) in fetched]
+        return fill_linked_chunks(document_id, sorted(payloads, key=lambda payload: payload.get("chunk_number", 0)), links, fetched)
+
+    async def aget_chunks(self, document_id: str, chunk_numbers: list[int], links: dict = None) -> list[dict]:
+        """Async version of get_chunks."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.get_chunks, document_id, chunk_numbers, links)
+        links = {number: links[number] for number in chunk_numbers if number in links} if links else {}
+        wanted = [number for number in chunk_numbers if number not in links]
+        with span("qdrant_fetch"):
+            fetched = await self._aretrieve_payloads([point_id(document_id, number) for number in wanted] + list(links.values()))
+        payloads = [fetched[point_id(document_id, number)] for number in wanted if point_id(document_id, number) in fetched]
+        return fill_linked_chunks(document_id, sorted(payloads, key=lambda payload: payload.get("chunk_number", 0)), links, fetched)
+
+    def promote_chunks(self, promotions) -> list[tuple[str, dict]]:
+        """Copies points to the linked chunks taking over from them (see NearDuplicateIndex.delete_documents).
+
+        Each copy keeps the vector and text under the new point id with its own document's
+        metadata, so the shared text survives deleting the original. Returns (id, payload) pairs.
+        """
+        if not promotions:
+            return []
+        sources = {
+            str(point.id): point
+            for point in self.client.retrieve(
+                collection_name=self.COLLECTION_NAME,
+                ids=[promotion.old_point_id for promotion in promotions],
+                with_payload=True,
+                with_vectors=True,
             )
-            for vector in vectored_data
+        }
+        templates, ids, vectors, payloads = {}, [], [], []
+        for promotion in promotions:
+            source = sources.get(promotion.old_point_id)
+            if source is None:
+                continue
+            if promotion.document_id not in templates:
+                points, _ = self.client.scroll(
+                    collection_name=self.COLLECTION_NAME,
+                    scroll_filter=self._document_filter(promotion.document_id),
+                    limit=1,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+                templates[promotion.document_id] = points[0].payload if points else None
+            ids.append(promotion.new_point_id)
+            vectors.append(source.vector)
+            payloads.append(linked_payload(
+                templates[promotion.document_id], source.payload, promotion.document_id, promotion.chunk_number, promotion.document_name
+            ))
+        if ids:
+            self.upsert_points(ids, vectors, payloads)
+        return list(zip(ids, payloads))
+
+    def _document_filter(self, document_id: str) -> Filter:
+        return Filter(
+            must=[
+                FieldCondition(
+                    key="document_id",
+                    match=MatchValue(value=document_id)
+                )
             ]
+        )
 
-        # Insert into Qdrant
-        self.client.upsert(collection_name=collection_name, points=points)
-        logger.debug(f"Inserted {len(points)} documents into '{collection_name}'")
+    def get_document_chunks(self, document_id: str, links: dict = None) -> list[dict]:
+        """Returns every chunk payload of a document, ordered by chunk_number, with linked chunks filled in."""
+        payloads = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.COLLECTION_NAME,
+                scroll_filter=self._document_filter(document_id),
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            payloads.extend(point.payload for point in points)
+            if offset is None:
+                break
+        payloads.sort(key=lambda payload: payload.get("chunk_number", 0))
+        if not links:
+            return payloads
+        return fill_linked_chunks(document_id, payloads, links, self._retrieve_payloads(list(set(links.values()))))
+
+    async def aget_document_chunks(self, document_id: str, links: dict = None) -> list[dict]:
+        """Async version of get_document_chunks."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.get_document_chunks, document_id, links)
+        payloads = []
+        offset = None
+        while True:
+            points, offset = await self.async_client.scroll(
+                collection_name=self.COLLECTION_NAME,
+                scroll_filter=self._document_filter(document_id),
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            payloads.extend(point.payload for point in points)
+            if offset is None:
+                break
+        payloads.sort(key=lambda payload: payload.get("chunk_number", 0))
+        if not links:
+            return payloads
+        return fill_linked_chunks(document_id, payloads, links, await self._aretrieve_payloads(list(set(links.values()))))
+
+    def reconstruct_document(self, document_id: str, links: dict = None) -> Optional[str]:
+        """Rebuilds a document's text from its stored (and linked) chunks, or None if that text would be incomplete."""
+        return merge_payloads(self.get_document_chunks(document_id, links))
+
+    async def areconstruct_document(self, document_id: str, links: dict = None) -> Optional[str]:
+        """Async version of reconstruct_document."""
+        with span("qdrant_fetch"):
+            payloads = await self.aget_document_chunks(document_id, links)
+        return merge_payloads(payloads)
 
     
-    def search(self, collection_name, query_vector, top_k=3)-> list:
-        """Search for documents in Qdrant using an embedding vector of the query."""
-        hits  = self.client.query_points(
-            collection_name=collection_name,
-            query=query_vector,
-            limit=top_k
-        ).points
-        logger.debug(f"Found {len(hits)} hits")   
+    def search(self, collection_name, query_vector, top_k=3, filters: dict = None)-> list:
+        """Search for documents in Qdrant using an embedding vector of the query, optionally scoped by build_filter filters."""
+        with span("qdrant_search"):
+            hits  = self.client.query_points(
+                collection_name=collection_name,
+                query=query_vector,
+                query_filter=build_filter(filters),
+                limit=top_k,
+                search_params=self.search_params,
+            ).points
+        return self._filter_hits(hits)
+
+    async def asearch(self, collection_name, query_vector, top_k=3, filters: dict = None) -> list:
+        """Async version of search."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.search, collection_name, query_vector, top_k, filters)
+        with span("qdrant_search"):
+            response = await self.async_client.query_points(
+                collection_name=collection_name,
+                query=query_vector,
+                query_filter=build_filter(filters),
+                limit=top_k,
+                search_params=self.search_params,
+            )
+        return self._filter_hits(response.points)
+
+    def _filter_hits(self, hits) -> list:
+        logger.debug("Found %d hits", len(hits))
         # Filter hits based on score
         return_hits = []
         for hit in hits:
@@ -129,11 +637,6 @@ class UtilityQdrant:
             })
 
         return return_hits
-        # extras for prototyping
-        # query_filter=models.Filter(
-        #must=[models.FieldCondition(key="year", range=models.Range(gte=2000))])
-        #for hit in hits:
-         #   logger.debug(hit.payload, "score:", hit.score)
 
 
 
@@ -183,7 +686,7 @@ if __name__ == '__main__':
 
     # Insert embeddings with metadata
     for i in range(3):        
-        qdrant.insert_documents(COLLECTION_NAME, [vectors[i]], metadata_list[i].to_dict())
+        qdrant.insert_documents(COLLECTION_NAME, [vectors[i]], metadata_list[i].to_dict(), [test_chunks[i]])
 
     #qdrant.insert_documents(COLLECTION_NAME, vectors, metadata_list)
 
@@ -242,7 +745,8 @@ if __name__ == '__main__':
 
     vectors = utility.create_embeddings_from_text(test_chunks)
     metadata = MetaDataModel(document_name="test6", document_id="doc5", title="Document number 5 Chunk", author="Seraphina", chunk_number=1)
-    qdrant.insert_documents(COLLECTION_NAME, vectors, metadata.to_dict())
+    qdrant.insert_documents(COLLECTION_NAME, vectors, metadata.to_dict(), test_chunks)
+    logger.debug(qdrant.reconstruct_document("doc5"))
 
     logger.debug("Embeddings and metadata inserted successfully.")
 
@@ -255,7 +759,7 @@ if __name__ == '__main__':
     logger.debug("--------------------")
     logger.debug("\n🔍 Search Results:")
     for result in search_results:
-        logger.debug(f"Score: {result['score']}, Metadata: {result['metadata']}")
+        logger.debug("Score: %s, Metadata: %s", result["score"], result["metadata"])
 
 
 
@@ -11,13 +11,32 @@ class SQLQueries:
         subject TEXT NOT NULL,
         ttl_days INTEGER NOT NULL DEFAULT 365,
         document_meta_data TEXT NOT NULL,
-        load_date DATETIME NOT NULL DEFAULT (datetime('now', '-7 hours'))
+        load_date DATETIME NOT NULL DEFAULT (datetime('now', '-7 hours')),
+        expires_at DATETIME
     );
     """
 
+    DOCUMENT_STORE_COLUMNS = """
+    PRAGMA table_info(document_store_ext);
+    """
+
+    # Catalogs created before expires_at existed; ttl_days held the days left as of the last TTL pass
+    ADD_EXPIRES_AT_COLUMN = """
+    ALTER TABLE document_store_ext ADD COLUMN expires_at DATETIME;
+    """
+
+    BACKFILL_EXPIRES_AT = """
+    UPDATE document_store_ext SET expires_at = datetime('now', printf('%+d days', ttl_days)) WHERE expires_at IS NULL;
+    """
+
+    CREATE_EXPIRES_AT_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_document_store_ext_expires_at ON document_store_ext (expires_at);
+    """
+
+    # Conflict-ignore on the unique title hash (and document_id) replaces the SELECT-then-INSERT
     INSERT_DOCUMENT = """
-    INSERT INTO document_store_ext (document_id, document_name, document_title, document_title_hash, ttl_days, document_meta_data, subject)
-    VALUES (?, ?, ?, ?, ?, ?, ?);
+    INSERT OR IGNORE INTO document_store_ext (document_id, document_name, document_title, document_title_hash, ttl_days, document_meta_data, subject, expires_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now', printf('%+d days', ?)));
     """
 
     GET_DOCUMENT_BY_HASH = """
@@ -28,11 +47,88 @@ class SQLQueries:
     SELECT * FROM document_store_ext;
     """
 
-    DECREMENT_TTL = """
-    UPDATE document_store_ext 
-    SET ttl_days = MAX(365 - (strftime('%s', 'now') - strftime('%s', load_date)) / 86400, 0);
+    # Range scan on idx_document_store_ext_expires_at; touches only expired rows
+    GET_EXPIRED_DOCUMENTS = """
+    SELECT document_id FROM document_store_ext WHERE expires_at <= datetime('now') ORDER BY expires_at LIMIT ?;
+    """
+
+    DELETE_INGEST_STATE_BY_DOCUMENT_ID = """
+    DELETE FROM ingest_state WHERE document_id = ?;
+    """
+
+    DELETE_SUMMARY_BY_DOCUMENT_ID = """
+    DELETE FROM document_summary WHERE document_id = ?;
+    """
+
+    DELETE_DOCUMENT_BY_ID = """
+    DELETE FROM document_store_ext WHERE document_id = ?;
+    """
+
+    DELETE_STALE_DOCUMENTS_BY_NAME = """
+    DELETE FROM document_store_ext WHERE document_name = ? AND document_id != ?;
+    """
+
+    CREATE_INGEST_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS ingest_state (
+        document_name TEXT PRIMARY KEY,
+        document_id TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        status TEXT NOT NULL,
+        batches_done INTEGER NOT NULL DEFAULT 0,
+        total_batches INTEGER NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT (datetime('now'))
+    );
+    """
+
+    GET_INGEST_STATE = """
+    SELECT document_name, document_id, content_hash, status, batches_done, total_batches
+    FROM ingest_state WHERE document_name = ?;
+    """
+
+    UPSERT_INGEST_STATE = """
+    INSERT INTO ingest_state (document_name, document_id, content_hash, status, batches_done, total_batches, updated_at)
+    VALUES (?, ?, ?, 'in_progress', 0, ?, datetime('now'))
+    ON CONFLICT(document_name) DO UPDATE SET
+        document_id = excluded.document_id,
+        content_hash = excluded.content_hash,
+        status = 'in_progress',
+        batches_done = 0,
+        total_batches = excluded.total_batches,
+        updated_at = excluded.updated_at;
+    """
+
+    UPDATE_INGEST_BATCHES_DONE = """
+    UPDATE ingest_state SET batches_done = ?, updated_at = datetime('now') WHERE document_name = ?;
+    """
+
+    COMPLETE_INGEST = """
+    UPDATE ingest_state SET status = 'complete', updated_at = datetime('now') WHERE document_name = ?;
+    """
+
+    FAIL_INGEST = """
+    UPDATE ingest_state SET status = 'failed', updated_at = datetime('now') WHERE document_name = ?;
+    """
+
+    CREATE_SUMMARY_TABLE = """
+    CREATE TABLE IF NOT EXISTS document_summary (
+        document_id TEXT PRIMARY KEY,
+        document_name TEXT NOT NULL,
+        content_hash TEXT,
+        summary_version TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT (datetime('now'))
+    );
+    """
+
+    GET_SUMMARY = """
+    SELECT summary FROM document_summary WHERE document_id = ? AND summary_version = ?;
+    """
+
+    UPSERT_SUMMARY = """
+    INSERT OR REPLACE INTO document_summary (document_id, document_name, content_hash, summary_version, summary, created_at)
+    VALUES (?, ?, ?, ?, ?, datetime('now'));
     """
 
-    DELETE_EXPIRED = """
-    DELETE FROM document_store_ext WHERE ttl_days <= 0;
+    DELETE_STALE_SUMMARIES_BY_NAME = """
+    DELETE FROM document_summary WHERE document_name = ? AND document_id != ?;
     """
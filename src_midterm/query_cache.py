@@ -0,0 +1,126 @@
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+from logger import logger
+from metrics import span
+
+
+class QueryEmbeddingCache:
+    """Bounded in-process LRU cache with a TTL for query vectors."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._reserved = 0  # extra entries held for batches in progress
+        self._entries = OrderedDict()  # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Folds case, whitespace and trailing punctuation so near-identical questions share a key."""
+        query = " ".join(query.lower().split())
+        return re.sub(r"[\s?.!]+$", "", query)
+
+    def get(self, query: str) -> Optional[list[float]]:
+        """Returns the cached vector for the query or None if missing or expired."""
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, query: str, vector: list[float]) -> None:
+        """Stores a query vector, evicting the least recently used entry when full."""
+        key = self.normalize(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries + self._reserved:
+                self._entries.popitem(last=False)
+
+    @contextmanager
+    def reserve(self, entries: int):
+        """Raises the capacity by entries while the block runs, so a pre-embedded batch is not evicted before use."""
+        with self._lock:
+            self._reserved += entries
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved -= entries
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current number of entries."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+class QueryEmbeddingBatcher:
+    """Collects queries arriving within a short window and embeds them in one API call."""
+
+    def __init__(self, embed_fn: Callable[[list[str]], Awaitable[list[list[float]]]], window_ms: float = 10, max_batch: int = 64):
+        self.embed_fn = embed_fn  # async function taking a list of texts
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches_sent = 0
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+
+    async def embed(self, query: str) -> list[float]:
+        """Queues a query and waits for the batch it lands in to be embedded."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._schedule_flush(loop, immediate=True)
+        elif self._flush_handle is None:
+            self._schedule_flush(loop)
+
+        return await future
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, immediate: bool = False) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        delay = 0 if immediate else self.window
+        self._flush_handle = loop.call_later(delay, lambda: loop.create_task(self._flush()))
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        self._flush_handle = None
+        if not batch:
+            return
+
+        texts = list(dict.fromkeys(query for query, _ in batch))
+        try:
+            with span("query_embedding"):
+                vectors = await self.embed_fn(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_sent += 1
+        logger.debug("Embedded %d queries in one batch", len(texts))
+        by_text = dict(zip(texts, vectors))
+        for query, future in batch:
+            if not future.done():
+                future.set_result(by_text[query])
@@ -1,4 +1,5 @@
 import uuid
+import asyncio
 import hashlib
 from database import Database
 from queries import SQLQueries
@@ -11,8 +12,15 @@ class DocumentRepository:
         self.db = Database()  # Singleton instance
 
         # Ensure table exists
-        self.db.cursor.execute(SQLQueries.CREATE_TABLE)
-        self.db.commit()
+        with self.db.transaction():
+            self.db.execute(SQLQueries.CREATE_TABLE)
+            self.db.execute(SQLQueries.CREATE_INGEST_STATE_TABLE)
+            self.db.execute(SQLQueries.CREATE_SUMMARY_TABLE)
+            columns = {row[1] for row in self.db.fetchall(SQLQueries.DOCUMENT_STORE_COLUMNS)}
+            if "expires_at" not in columns:
+                self.db.execute(SQLQueries.ADD_EXPIRES_AT_COLUMN)
+                self.db.execute(SQLQueries.BACKFILL_EXPIRES_AT)
+            self.db.execute(SQLQueries.CREATE_EXPIRES_AT_INDEX)
 
     def hash_title(self, title: str) -> str:
         """Generates SHA-256 hash for a document title."""
@@ -21,48 +29,126 @@ class DocumentRepository:
 
     def insert_document(self, document_id, document_name, title, metadata, subject, ttl_days=365):
         """Insert a document if the hashed title is unique."""
-        title_hash = self.hash_title(title)
-        # document_id = str(uuid.uuid4())
-
-        # Check if document already exists
-        self.db.cursor.execute(SQLQueries.GET_DOCUMENT_BY_HASH, (title_hash,))
-        exists = self.db.cursor.fetchone()
-
-        if exists:
+        inserted = self.insert_documents([(document_id, document_name, title, metadata, subject, ttl_days)])
+        if not inserted:
             logger.info(f"Document '{title}' already exists. Skipping insert.")
             return False  # Already exists
-
-        # Insert new document
-        self.db.cursor.execute(SQLQueries.INSERT_DOCUMENT, (document_id, document_name, title, title_hash, ttl_days, metadata, subject))
-        self.db.commit()
         logger.info(f"Inserted document: {title}")
         return True  # Successfully inserted
 
-    def decrement_ttl(self):
-        """Decrements ttl_days for all records."""
-        self.db.cursor.execute(SQLQueries.DECREMENT_TTL)
-        self.db.commit()
-        logger.info("TTL decremented for all documents.")
+    def insert_documents(self, documents: list[tuple]) -> int:
+        """Bulk-inserts (document_id, document_name, title, metadata, subject[, ttl_days]) rows in one transaction.
+
+        Rows whose title hash is already in the catalog are skipped; returns how many were inserted.
+        """
+        rows = []
+        for document in documents:
+            document_id, document_name, title, metadata, subject, *rest = document
+            ttl_days = rest[0] if rest else 365
+            rows.append((document_id, document_name, title, self.hash_title(title), ttl_days, metadata, subject, ttl_days))
+        if not rows:
+            return 0
+        with self.db.transaction():
+            return self.db.connection.executemany(SQLQueries.INSERT_DOCUMENT, rows).rowcount
+
+    def delete_expired_documents(self, on_expired=None, batch_size: int = 256) -> int:
+        """Deletes catalog rows whose expires_at has passed, batch by batch through the expiry index.
+
+        on_expired(document_ids) runs before each batch leaves the catalog, e.g. to delete the
+        documents' vectors; if it raises, the batch stays in the catalog for the next sweep.
+        Ingest checkpoints and summaries of expired documents go too, so a later ingest reloads them.
+        """
+        deleted = 0
+        while True:
+            document_ids = [row[0] for row in self.db.fetchall(SQLQueries.GET_EXPIRED_DOCUMENTS, (batch_size,))]
+            if not document_ids:
+                break
+            if on_expired is not None:
+                on_expired(document_ids)
+            params = [(document_id,) for document_id in document_ids]
+            with self.db.transaction() as connection:
+                connection.executemany(SQLQueries.DELETE_DOCUMENT_BY_ID, params)
+                connection.executemany(SQLQueries.DELETE_INGEST_STATE_BY_DOCUMENT_ID, params)
+                connection.executemany(SQLQueries.DELETE_SUMMARY_BY_DOCUMENT_ID, params)
+            deleted += len(document_ids)
+        logger.info(f"Deleted {deleted} expired documents.")
+        return deleted
+
+    def delete_document(self, document_id: str):
+        """Removes a document from the store by its document_id."""
+        self.db.execute(SQLQueries.DELETE_DOCUMENT_BY_ID, (document_id,))
+
+    def delete_stale_documents(self, document_name: str, current_document_id: str):
+        """Removes catalog rows and summaries for earlier versions of a file."""
+        with self.db.transaction():
+            self.db.execute(SQLQueries.DELETE_STALE_DOCUMENTS_BY_NAME, (document_name, current_document_id))
+            self.db.execute(SQLQueries.DELETE_STALE_SUMMARIES_BY_NAME, (document_name, current_document_id))
+
+    def get_ingest_state(self, document_name: str):
+        """Returns the ingestion checkpoint for a file as a dict, or None."""
+        row = self.db.fetchone(SQLQueries.GET_INGEST_STATE, (document_name,))
+        if row is None:
+            return None
+        keys = ("document_name", "document_id", "content_hash", "status", "batches_done", "total_batches")
+        return dict(zip(keys, row))
+
+    def start_ingest(self, document_name: str, document_id: str, content_hash: str, total_batches: int):
+        """Records that a (new or changed) file is being ingested from its first batch."""
+        self.db.execute(SQLQueries.UPSERT_INGEST_STATE, (document_name, document_id, content_hash, total_batches))
+
+    def mark_batches_done(self, document_name: str, batches_done: int):
+        """Checkpoints how many embedding batches of a file have been upserted."""
+        self.db.execute(SQLQueries.UPDATE_INGEST_BATCHES_DONE, (batches_done, document_name))
 
-    def delete_expired_documents(self):
-        """Deletes documents where ttl_days <= 0."""
-        self.db.cursor.execute(SQLQueries.DELETE_EXPIRED)
-        deleted_count = self.db.cursor.rowcount
-        self.db.commit()
-        logger.info(f"Deleted {deleted_count} expired documents.")
+    def complete_ingest(self, document_name: str):
+        """Marks a file as fully ingested."""
+        self.db.execute(SQLQueries.COMPLETE_INGEST, (document_name,))
+
+    def fail_ingest(self, document_name: str):
+        """Marks a file's ingest as failed; its checkpoint stays, so the next run resumes from it."""
+        self.db.execute(SQLQueries.FAIL_INGEST, (document_name,))
+
+    def get_summary(self, document_id: str, summary_version: str):
+        """Returns the stored summary of a document for the given summary version, or None."""
+        row = self.db.fetchone(SQLQueries.GET_SUMMARY, (document_id, summary_version))
+        return row[0] if row else None
+
+    def save_summary(self, document_id: str, document_name: str, content_hash: str, summary_version: str, summary: str):
+        """Stores (or replaces) the summary of a document."""
+        self.db.execute(SQLQueries.UPSERT_SUMMARY, (document_id, document_name, content_hash, summary_version, summary))
 
     def get_all_documents(self):
         """Retrieve all documents from the store."""
-        self.db.cursor.execute(SQLQueries.GET_ALL_DOCUMENTS)
-        documents = self.db.cursor.fetchall()
-        return documents
+        return self.db.fetchall(SQLQueries.GET_ALL_DOCUMENTS)
+
+
+class AsyncDocumentRepository:
+    """Awaitable view of a DocumentRepository for graph nodes and the ingest pipeline.
+
+    Every method of the wrapped repository is available as a coroutine that runs in a
+    worker thread, so a busy database never stalls the event loop.
+    """
+
+    def __init__(self, repository: DocumentRepository = None):
+        self.repository = repository or DocumentRepository()
+
+    def __getattr__(self, name):
+        method = getattr(self.repository, name)
+        if not callable(method):
+            return method
+
+        async def run(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        run.__name__ = name
+        run.__doc__ = method.__doc__
+        return run
 
 if __name__ == "__main__":
     print("Ready Player 1")
     repo = DocumentRepository()    
     repo.insert_document(str(uuid.uuid4()), "ready1.pdf", "Ready Player 1", "A book about virtual reality and gaming.", "Science Fiction")
     repo.insert_document(str(uuid.uuid4()), "ready2.pdf", "Ready Player 2", "A sequel to the first book.", "Science Fiction")
-    repo.decrement_ttl()
     repo.delete_expired_documents()
     documents = repo.get_all_documents()
     for doc in documents:
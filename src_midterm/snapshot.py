@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from logger import logger
+
+MANIFEST = "manifest.json"
+VECTORS = "vectors.npy"
+DEDUPE_SIGNATURES = "dedupe_signatures.jsonl"
+DEDUPE_LINKS = "dedupe_links.jsonl"
+
+
+def _write_payloads(path: str, payload_format: str, rows: list[dict]):
+    if payload_format == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet snapshots need pyarrow; install it or use --format jsonl.")
+        # Payloads vary per document, so they are stored as JSON text in one column
+        table = pa.table({"id": [row["id"] for row in rows], "payload": [json.dumps(row["payload"]) for row in rows]})
+        pq.write_table(table, path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def _read_payloads(path: str, payload_format: str) -> list[dict]:
+    if payload_format == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path).to_pydict()
+        return [{"id": point, "payload": json.loads(payload)} for point, payload in zip(table["id"], table["payload"])]
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _export_dedupe(dedupe_index, out_dir: str) -> dict:
+    """Writes the near-duplicate index's signatures and links as JSONL; returns the manifest entry."""
+    signatures = links = 0
+    with open(os.path.join(out_dir, DEDUPE_SIGNATURES), "w", encoding="utf-8") as f:
+        for pid, document_id, document_name, blob in dedupe_index.iter_signatures():
+            row = {"point_id": pid, "document_id": document_id, "document_name": document_name, "signature": blob.hex()}
+            f.write(json.dumps(row) + "\n")
+            signatures += 1
+    with open(os.path.join(out_dir, DEDUPE_LINKS), "w", encoding="utf-8") as f:
+        for document_id, chunk_number, document_name, canonical, similarity in dedupe_index.iter_links():
+            row = {
+                "document_id": document_id,
+                "chunk_number": chunk_number,
+                "document_name": document_name,
+                "canonical_point_id": canonical,
+                "similarity": similarity,
+            }
+            f.write(json.dumps(row) + "\n")
+            links += 1
+    return {
+        "signatures": signatures,
+        "links": links,
+        "signature_file": DEDUPE_SIGNATURES,
+        "link_file": DEDUPE_LINKS,
+        **dedupe_index.minhash_settings,
+    }
+
+
+def _import_dedupe(dedupe_index, in_dir: str, entry: dict) -> tuple[int, int]:
+    """Restores the signatures and links written by _export_dedupe."""
+    with open(os.path.join(in_dir, entry["link_file"]), encoding="utf-8") as f:
+        links = [
+            (row["document_id"], row["chunk_number"], row["document_name"], row["canonical_point_id"], row["similarity"])
+            for row in map(json.loads, f)
+        ]
+    signatures = []
+    if all(entry.get(key) == value for key, value in dedupe_index.minhash_settings.items()):
+        with open(os.path.join(in_dir, entry["signature_file"]), encoding="utf-8") as f:
+            signatures = [
+                (row["point_id"], row["document_id"], row["document_name"], bytes.fromhex(row["signature"]))
+                for row in map(json.loads, f)
+            ]
+    else:
+        # Links alone keep linked chunks readable; new ingests just won't dedupe against these chunks
+        logger.warning("Snapshot signatures were made with other MinHash settings; restoring links only")
+    return dedupe_index.restore(signatures, links)
+
+
+def export_collection(
+    store, out_dir: str, dtype: str = "float16", payload_format: str = "jsonl", batch_size: int = 512, dedupe_index=None
+) -> dict:
+    """Streams every point of a vector store into out_dir: vectors as one .npy, payloads as JSONL or Parquet.
+
+    Vectors are written straight into a memory-mapped .npy, so memory stays flat however
+    large the collection is. float16 halves the file; cosine ranking is unaffected in practice.
+    With a dedupe_index its signatures and links are exported too: linked chunks have no
+    points of their own, so a restore without the links could not rebuild those documents.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    expected = store.count_points()
+    vectors, rows = None, []
+
+    for point, payload, vector in store.scroll_points(batch_size, with_vectors=True):
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(out_dir, VECTORS), mode="w+", dtype=dtype, shape=(expected, len(vector))
+            )
+        if len(rows) == expected:
+            logger.warning("Collection grew during export; points added after the count are not included")
+            break
+        vectors[len(rows)] = vector
+        rows.append({"id": point, "payload": payload})
+
+    if vectors is None:
+        raise ValueError(f"Collection '{store.COLLECTION_NAME}' is empty, nothing to export.")
+    dim = vectors.shape[1]
+    vectors.flush()
+    del vectors
+    if len(rows) < expected:
+        # Points were deleted during export; shrink the matrix to what was written
+        written = np.load(os.path.join(out_dir, VECTORS), mmap_mode="r")[: len(rows)]
+        np.save(os.path.join(out_dir, VECTORS + ".tmp.npy"), written)
+        del written
+        os.replace(os.path.join(out_dir, VECTORS + ".tmp.npy"), os.path.join(out_dir, VECTORS))
+
+    payload_file = "payloads.parquet" if payload_format == "parquet" else "payloads.jsonl"
+    _write_payloads(os.path.join(out_dir, payload_file), payload_format, rows)
+    manifest = {
+        "collection": store.COLLECTION_NAME,
+        "points": len(rows),
+        "dim": dim,
+        "dtype": dtype,
+        "payload_format": payload_format,
+        "payload_file": payload_file,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if dedupe_index is not None:
+        manifest["dedupe"] = _export_dedupe(dedupe_index, out_dir)
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Exported {len(rows)} points to {out_dir} in {time.perf_counter() - start:.2f}s")
+    return manifest
+
+
+async def import_collection(
+    store, in_dir: str, batch_size: int = 512, concurrency: int = 4, lexical_index=None, dedupe_index=None
+) -> int:
+    """Bulk-loads a snapshot into a vector store with parallel batched upserts; no parsing or embedding.
+
+    A snapshot that carries near-duplicate links needs a dedupe_index to restore them into;
+    without one the import is refused, since the linked chunks would be missing.
+    """
+    with open(os.path.join(in_dir, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    dedupe = manifest.get("dedupe")
+    if dedupe and dedupe["links"] and dedupe_index is None:
+        raise ValueError(
+            f"Snapshot has {dedupe['links']} near-duplicate chunk links; pass a dedupe_index to restore them."
+        )
+    start = time.perf_counter()
+    vectors = np.load(os.path.join(in_dir, VECTORS), mmap_mode="r")
+    rows = _read_payloads(os.path.join(in_dir, manifest["payload_file"]), manifest["payload_format"])
+    if len(rows) != vectors.shape[0]:
+        raise ValueError(f"Snapshot is inconsistent: {len(rows)} payloads for {vectors.shape[0]} vectors.")
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def upsert(offset: int):
+        async with slots:
+            batch = rows[offset:offset + batch_size]
+            # Only this batch is materialized as float32 lists
+            batch_vectors = vectors[offset:offset + len(batch)].astype(np.float32).tolist()
+            await store.aupsert_points([row["id"] for row in batch], batch_vectors, [row["payload"] for row in batch])
+
+    await asyncio.gather(*(upsert(offset) for offset in range(0, len(rows), batch_size)))
+
+    if lexical_index is not None:
+        await asyncio.to_thread(lexical_index.add_points, ((row["id"], row["payload"]) for row in rows))
+    if dedupe and dedupe_index is not None:
+        signatures, links = await asyncio.to_thread(_import_dedupe, dedupe_index, in_dir, dedupe)
+        logger.info(f"Restored {signatures} chunk signatures and {links} near-duplicate links")
+
+    logger.info(f"Imported {len(rows)} points into '{store.COLLECTION_NAME}' in {time.perf_counter() - start:.2f}s")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or restore the vector collection without re-embedding.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write the collection to a snapshot directory")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    export_parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    import_parser = commands.add_parser("import", help="bulk-load a snapshot directory into the collection")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--batch-size", type=int, default=512)
+    import_parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    # Imported here so --help works without credentials; the backend follows VECTOR_BACKEND
+    import chains
+
+    store = chains.get_qdrant()
+    if args.command == "export":
+        manifest = export_collection(store, args.directory, args.dtype, args.format, dedupe_index=chains.get_dedupe_index())
+        print(json.dumps(manifest, indent=2))
+    else:
+        asyncio.run(
+            import_collection(
+                store,
+                args.directory,
+                args.batch_size,
+                args.concurrency,
+                chains.get_lexical_index(),
+                chains.get_dedupe_index(),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
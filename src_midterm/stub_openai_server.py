@@ -0,0 +1,160 @@
+import json
+import time
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger import logger
+
+
+class StubState:
+    """Fault settings and counters shared by the stub's request handlers."""
+
+    def __init__(self, dim: int = 64, latency: float = 0.05, jitter: float = 0.02, rate_limit_ratio: float = 0.0,
+                 retry_after: float = 0.5, requests_per_minute: int = None, error_ratio: float = 0.0, seed: int = 7):
+        self.dim = dim
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio  # share of requests answered 429 at random
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute  # enforced RPM, answered 429 beyond it
+        self.error_ratio = error_ratio  # share of requests answered 500
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = []  # accepted request times within the last minute
+        self.requests = 0
+        self.accepted = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.inputs_embedded = 0
+
+    def admit(self) -> int:
+        """Decides the status of the next request: 200, 429 or 500."""
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            self.window = [sent for sent in self.window if sent > now - 60]
+            over_limit = self.requests_per_minute is not None and len(self.window) >= self.requests_per_minute
+            if over_limit or self.random.random() < self.rate_limit_ratio:
+                self.rate_limited += 1
+                return 429
+            if self.random.random() < self.error_ratio:
+                self.errors += 1
+                return 500
+            self.window.append(now)
+            self.accepted += 1
+            return 200
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "accepted": self.accepted,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "inputs_embedded": self.inputs_embedded,
+            }
+
+
+def fake_vector(text, dim: int) -> list[float]:
+    """Deterministic unit-ish vector for any input (string or token list)."""
+    seed = hashlib.sha256(json.dumps(text).encode("utf-8")).digest()
+    return [(byte - 127.5) / 127.5 for byte in (seed * (dim // len(seed) + 1))[:dim]]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers POST .../embeddings like the OpenAI API, with injected latency, 429s and 500s."""
+
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        logger.debug("stub %s", format % args)
+
+    def _reply(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            return self._reply(200, self.state.stats())
+        self._reply(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            return self._reply(404, {"error": {"message": "not found"}})
+
+        state = self.state
+        time.sleep(max(0.0, state.latency + state.random.uniform(-state.jitter, state.jitter)))
+        status = state.admit()
+        if status == 429:
+            return self._reply(
+                429,
+                {"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after": f"{state.retry_after:g}", "retry-after-ms": str(int(state.retry_after * 1000))},
+            )
+        if status == 500:
+            return self._reply(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_vector(text, state.dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        with state.lock:
+            state.inputs_embedded += len(inputs)
+        tokens = sum(len(text) if isinstance(text, list) else max(1, len(text) // 4) for text in inputs)
+        self._reply(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+def start_stub_server(state: StubState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serves the stub on a background thread; the base URL is http://host:server.server_port/v1."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI embeddings endpoint with injected faults.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.1, help="share of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="seconds sent in retry-after")
+    parser.add_argument("--rpm", type=int, help="requests per minute to enforce")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="share of requests answered 500")
+    args = parser.parse_args()
+
+    state = StubState(args.dim, args.latency_ms / 1000, args.latency_ms / 2500, args.rate_limit_ratio, args.retry_after, args.rpm, args.error_ratio)
+    server = start_stub_server(state, port=args.port)
+    logger.info(f"Stub OpenAI embeddings at http://127.0.0.1:{server.server_port}/v1 (OPENAI_BASE_URL)")
+    try:
+        while True:
+            time.sleep(10)
+            logger.info(f"Stub stats: {state.stats()}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
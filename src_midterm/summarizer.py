@@ -0,0 +1,93 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+from logger import logger
+
+SummarizeFn = Callable[[str], Awaitable[str]]
+
+
+async def iter_text_batches(text: str, batch_chars: int = 24000) -> AsyncIterator[str]:
+    """Splits already-loaded text into map batches on paragraph boundaries where possible."""
+    start = 0
+    while start < len(text):
+        end = min(start + batch_chars, len(text))
+        if end < len(text):
+            boundary = text.rfind("\n", start + batch_chars // 2, end)
+            if boundary != -1:
+                end = boundary + 1
+        yield text[start:end]
+        start = end
+
+
+async def map_reduce_summarize(
+    batches: AsyncIterator[str],
+    map_fn: SummarizeFn,
+    reduce_fn: SummarizeFn,
+    max_concurrency: int = 4,
+    max_reduce_chars: int = 24000,
+) -> str:
+    """Summarizes a stream of text batches concurrently, then reduces the partial summaries.
+
+    At most max_concurrency batches are held in memory at once: the next batch is only
+    pulled from the generator when a map slot frees up, so memory is bounded by the
+    batch size rather than the document size.
+    """
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def run_map(text: str) -> str:
+        try:
+            return await map_fn(text)
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        while True:
+            # Take the slot first, so the source isn't read ahead while every map is busy
+            await slots.acquire()
+            try:
+                text = await anext(batches)
+            except StopAsyncIteration:
+                slots.release()
+                break
+            tasks.append(asyncio.create_task(run_map(text)))
+        partials = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    logger.debug("Map stage produced %d partial summaries", len(partials))
+    if not partials:
+        return ""
+    return await _reduce(list(partials), reduce_fn, max_concurrency, max_reduce_chars)
+
+
+async def _reduce(partials: list[str], reduce_fn: SummarizeFn, max_concurrency: int, max_reduce_chars: int) -> str:
+    """Combines partial summaries, in several concurrent rounds if they don't fit in one call."""
+    if len(partials) == 1:
+        return partials[0]
+
+    # Group consecutive partials so each reduce call stays under max_reduce_chars
+    groups, current, size = [], [], 0
+    for partial in partials:
+        if current and size + len(partial) > max_reduce_chars:
+            groups.append(current)
+            current, size = [], 0
+        current.append(partial)
+        size += len(partial)
+    groups.append(current)
+    if len(groups) == len(partials):
+        # Every partial is oversized on its own; pair them up so each round still shrinks the list
+        groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+
+    if len(groups) == 1:
+        return await reduce_fn("\n\n".join(groups[0]))
+
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def reduce_group(group: list[str]) -> str:
+        async with slots:
+            return await reduce_fn("\n\n".join(group))
+
+    reduced = await asyncio.gather(*(reduce_group(group) for group in groups))
+    return await _reduce(list(reduced), reduce_fn, max_concurrency, max_reduce_chars)
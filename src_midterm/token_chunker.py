@@ -0,0 +1,162 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator
+import tiktoken
+from logger import logger
+
+# Limits of the OpenAI embeddings endpoint
+EMBEDDING_MAX_ITEMS = 2048  # inputs per request
+EMBEDDING_MAX_INPUT_TOKENS = 8191  # tokens per input
+EMBEDDING_MAX_REQUEST_TOKENS = 300_000  # tokens summed over the inputs of one request
+# Batches are packed a little under the request limit since chunk counts are per-line sums
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "290000"))
+
+# About the 1000-character / 200-overlap chunks of the character splitter this replaces
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 50
+
+
+@dataclass
+class TokenChunk:
+    """A chunk of text and its size in embedding-model tokens."""
+    text: str
+    tokens: int
+
+
+class TokenCounter:
+    """Counts and splits text in the tokens of an embedding model.
+
+    If the tiktoken encoding cannot be loaded (no network and no tiktoken cache), or
+    TOKEN_COUNT_ESTIMATE=1 as in the offline benchmarks, it falls back to an estimate of
+    four characters per token.
+    """
+
+    def __init__(self, model_name: str = "text-embedding-3-small"):
+        self.model_name = model_name
+        if os.getenv("TOKEN_COUNT_ESTIMATE") == "1":
+            # Don't even try: loading an encoding that isn't cached downloads it
+            self.encoding = None
+            return
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name)
+        except Exception as e:
+            logger.warning(f"No tiktoken encoding for {model_name}, estimating token counts: {str(e)}")
+            self.encoding = None
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode_ordinary(text))
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        """Cuts text into consecutive pieces of at most max_tokens tokens."""
+        if self.encoding is None:
+            step = max_tokens * 4
+            return [text[start:start + step] for start in range(0, len(text), step)]
+        tokens = self.encoding.encode_ordinary(text)
+        return [self.encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str) -> TokenCounter:
+    """Shared TokenCounter per model; loading an encoding takes a moment."""
+    return TokenCounter(model_name)
+
+
+class TokenChunker:
+    """Incremental newline splitter measured in tokens: feed page texts as they are parsed, get chunks back.
+
+    Chunks hold whole lines up to chunk_tokens (a longer line is cut at token boundaries), and
+    each chunk starts with up to overlap_tokens worth of the previous chunk's trailing lines.
+    Only the lines of the chunk being built are held, however long the document is.
+    """
+
+    def __init__(self, counter: TokenCounter, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if not 0 < chunk_tokens <= EMBEDDING_MAX_INPUT_TOKENS:
+            raise ValueError(f"chunk_tokens must be between 1 and {EMBEDDING_MAX_INPUT_TOKENS}.")
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens.")
+        self.counter = counter
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._lines: list[tuple[str, int]] = []  # (line, tokens including its newline)
+        self._tokens = 0
+
+    def feed(self, text: str) -> list[TokenChunk]:
+        """Adds one page (or any span) of text and returns the chunks it completed."""
+        chunks = []
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            tokens = self.counter.count(line) + 1
+            if tokens <= self.chunk_tokens:
+                chunks.extend(self._add(line, tokens))
+                continue
+            for piece in self.counter.split(line, self.chunk_tokens - 1):
+                chunks.extend(self._add(piece, self.counter.count(piece) + 1))
+        return chunks
+
+    def flush(self) -> list[TokenChunk]:
+        """Returns the last, partly filled chunk once the document is done."""
+        if not self._lines:
+            return []
+        chunk = self._emit()
+        self._lines, self._tokens = [], 0
+        return [chunk]
+
+    def _add(self, line: str, tokens: int) -> list[TokenChunk]:
+        chunks = []
+        if self._lines and self._tokens + tokens > self.chunk_tokens:
+            chunks.append(self._emit())
+            # Carry the trailing lines that fit the overlap (and still leave room for this line)
+            kept, kept_tokens = [], 0
+            for previous, previous_tokens in reversed(self._lines):
+                if kept_tokens + previous_tokens > self.overlap_tokens or kept_tokens + previous_tokens + tokens > self.chunk_tokens:
+                    break
+                kept.append((previous, previous_tokens))
+                kept_tokens += previous_tokens
+            self._lines, self._tokens = kept[::-1], kept_tokens
+        self._lines.append((line, tokens))
+        self._tokens += tokens
+        return chunks
+
+    def _emit(self) -> TokenChunk:
+        return TokenChunk("\n".join(line for line, _ in self._lines), self._tokens)
+
+
+def iter_token_chunks(pages: Iterable[str], counter: TokenCounter, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[TokenChunk]:
+    """Yields token-sized chunks while consuming page texts lazily."""
+    chunker = TokenChunker(counter, chunk_tokens, overlap_tokens)
+    for page in pages:
+        yield from chunker.feed(page)
+    yield from chunker.flush()
+
+
+def pack_batches(
+    items: Iterable,
+    token_count: Callable = lambda item: item.tokens,
+    max_items: int = EMBEDDING_MAX_ITEMS,
+    max_tokens: int = EMBEDDING_BATCH_TOKENS,
+) -> Iterator[list]:
+    """Greedily groups items, in order, into batches within the per-request item and token limits."""
+    batch, batch_tokens = [], 0
+    for item in items:
+        tokens = token_count(item)
+        if batch and (len(batch) == max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    counter = get_token_counter("text-embedding-3-small")
+    pages = ["Lateral epicondylitis\n" + "Eccentric wrist extensor loading reduced pain. " * 40] * 3
+    chunks = list(iter_token_chunks(pages, counter))
+    batches = list(pack_batches(chunks, max_tokens=600))
+    logger.debug(f"{len(chunks)} chunks of {[chunk.tokens for chunk in chunks]} tokens in {len(batches)} batches")
@@ -1,8 +1,15 @@
 import os
+import asyncio
 from enum import Enum
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings
-from logger import logger
+import logging
+from logger import logger, log_sampled
+from metrics import span
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache, QueryEmbeddingBatcher
+from token_chunker import EMBEDDING_MAX_ITEMS, EMBEDDING_BATCH_TOKENS, get_token_counter, pack_batches
+from embedding_scheduler import EmbeddingScheduler
 
 load_dotenv()
 
@@ -10,27 +17,175 @@ class GptEmbeddingModel(Enum):
     SMALL3 = "text-embedding-3-small"
     LARGE3 = "text-embedding-3-large"
 
+# Known output sizes, so the dimension never needs a live API call
+EMBEDDING_DIMENSIONS = {
+    GptEmbeddingModel.SMALL3: 1536,
+    GptEmbeddingModel.LARGE3: 3072,
+}
+
 class UtilityOpenAI:
-    def __init__(self, api_key: str = None, model: GptEmbeddingModel = GptEmbeddingModel.SMALL3):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("API key is required.")    
-        self.embedding = OpenAIEmbeddings(api_key=api_key, model=model)
+    def __init__(
+        self,
+        api_key: str = None,
+        model: GptEmbeddingModel = GptEmbeddingModel.SMALL3,
+        cache: EmbeddingCache = None,
+        use_cache: bool = True,
+        embedding=None,
+        scheduler: EmbeddingScheduler = None,
+    ):
+        self.model = model
+        if embedding is not None:
+            # Any LangChain Embeddings implementation, e.g. the offline fakes used by the benchmarks
+            self.api_key = api_key
+            self.embedding = embedding
+        else:
+            self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+            if not self.api_key:
+                raise ValueError("API key is required.")    
+            # Requests are packed to the endpoint's limits in _pack_texts, so the client must not re-split them;
+            # retries belong to the scheduler, which re-sends only the failed batch
+            self.embedding = OpenAIEmbeddings(
+                api_key=self.api_key, model=model.value, chunk_size=EMBEDDING_MAX_ITEMS, max_retries=0
+            )
+        # Every embedding request (chunks and queries) goes through the rate limiter
+        self.scheduler = scheduler or EmbeddingScheduler(self.embedding.embed_documents, self.embedding.aembed_documents)
+        # On-disk vector cache so re-ingesting unchanged chunks costs no API calls
+        self.cache = cache if cache is not None else (EmbeddingCache() if use_cache else None)
+        # In-process LRU for user questions, in front of the embedding round trip
+        self.query_cache = QueryEmbeddingCache()
+        self._query_batcher = None
         
 
+    @property
+    def token_counter(self):
+        """Token counter of the embedding model, loaded on first use."""
+        return get_token_counter(self.model.value)
+
+    def _pack_texts(self, texts: list[str]) -> list[tuple[list[str], int]]:
+        """Splits texts into request-sized (batch, tokens) pairs: at most 2048 inputs and ~300k tokens each."""
+        # A token covers at least one byte, so under the limit in bytes means no counting needed;
+        # the rate limiter then gets an estimate of four bytes per token
+        size = sum(len(text.encode("utf-8")) for text in texts)
+        if len(texts) <= EMBEDDING_MAX_ITEMS and size <= EMBEDDING_BATCH_TOKENS:
+            return [(texts, (size + 3) // 4)]
+        counts = dict(zip(texts, map(self.token_counter.count, texts)))
+        return [
+            (batch, sum(counts[text] for text in batch))
+            for batch in pack_batches(texts, token_count=counts.__getitem__)
+        ]
+
+    def _embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds texts as packed requests through the rate-limited scheduler."""
+        with span("embedding"):
+            return self.scheduler.embed_batches(self._pack_texts(texts))
+
+    async def _aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Async version of _embed_documents; packed requests run concurrently."""
+        with span("embedding"):
+            return await self.scheduler.aembed_batches(self._pack_texts(texts))
+
     def create_embeddings_from_text(self, chunks: list[str]) -> list[str]:
         # check to see if the list is empty
         if not chunks:
             raise ValueError("List of text chunks cannot be empty.")
-        logger.debug("Chunks to embed:", chunks)
-        vectors = self.embedding.embed_documents(chunks)    
-        logger.debug(f"Number of vectors: {len(vectors)}")
-        logger.debug(f"First vector: {vectors[0]}")
-        logger.debug(f"Last vector: {vectors[-1]}")
+        if self.cache is None:
+            vectors = self._embed_documents(chunks)
+        else:
+            vectors = self._embed_with_cache(chunks)
+        logger.debug("Embedded %d chunks", len(vectors))
+        return vectors
+
+    def _embed_with_cache(self, chunks: list[str]) -> list[list[float]]:
+        """Returns cached vectors in bulk and only sends the misses to the API."""
+        cached = self.cache.get_many(self.model.value, chunks)
+        hits = sum(1 for vector in cached if vector is not None)
+
+        # Dedupe misses so repeated chunks in one call are embedded once
+        miss_texts = list(dict.fromkeys(chunk for chunk, vector in zip(chunks, cached) if vector is None))
+        fresh = {}
+        if miss_texts:
+            miss_vectors = self._embed_documents(miss_texts)
+            self.cache.put_many(self.model.value, miss_texts, miss_vectors)
+            fresh = dict(zip(miss_texts, miss_vectors))
+
+        log_sampled(logging.INFO, "Embedding cache: %d of %d chunks served from cache", hits, len(chunks))
+        return [vector.tolist() if vector is not None else fresh[chunk] for chunk, vector in zip(chunks, cached)]
+
+    async def acreate_embeddings_from_text(self, chunks: list[str]) -> list[list[float]]:
+        """Async version of create_embeddings_from_text; never blocks the event loop on the API call."""
+        if not chunks:
+            raise ValueError("List of text chunks cannot be empty.")
+        if self.cache is None:
+            return await self._aembed_documents(chunks)
+
+        cached = await asyncio.to_thread(self.cache.get_many, self.model.value, chunks)
+        hits = sum(1 for vector in cached if vector is not None)
+        miss_texts = list(dict.fromkeys(chunk for chunk, vector in zip(chunks, cached) if vector is None))
+        fresh = {}
+        if miss_texts:
+            miss_vectors = await self._aembed_documents(miss_texts)
+            await asyncio.to_thread(self.cache.put_many, self.model.value, miss_texts, miss_vectors)
+            fresh = dict(zip(miss_texts, miss_vectors))
+
+        log_sampled(logging.INFO, "Embedding cache: %d of %d chunks served from cache", hits, len(chunks))
+        return [vector.tolist() if vector is not None else fresh[chunk] for chunk, vector in zip(chunks, cached)]
+
+    def embed_query(self, query: str) -> list[float]:
+        """Embeds a single user question, serving repeats from the query cache."""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embeds many user questions, sending the cache misses in as few endpoint-sized requests as possible."""
+        if not queries:
+            raise ValueError("List of queries cannot be empty.")
+        vectors = [self.query_cache.get(query) for query in queries]
+        misses = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        if misses:
+            with span("query_embedding"):
+                fresh = dict(zip(misses, self.scheduler.embed_batches(self._pack_texts(misses))))
+            for query, vector in fresh.items():
+                self.query_cache.put(query, vector)
+            vectors = [vector if vector is not None else fresh[query] for query, vector in zip(queries, vectors)]
+        return vectors
+
+    async def aembed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Async version of embed_queries."""
+        if not queries:
+            raise ValueError("List of queries cannot be empty.")
+        vectors = [self.query_cache.get(query) for query in queries]
+        misses = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        if misses:
+            with span("query_embedding"):
+                fresh = dict(zip(misses, await self.scheduler.aembed_batches(self._pack_texts(misses))))
+            for query, vector in fresh.items():
+                self.query_cache.put(query, vector)
+            vectors = [vector if vector is not None else fresh[query] for query, vector in zip(queries, vectors)]
         return vectors
+
+    async def aembed_query(self, query: str) -> list[float]:
+        """Embeds a user question, batching it with others that arrive in the same window."""
+        vector = self.query_cache.get(query)
+        if vector is not None:
+            return vector
+        if self._query_batcher is None:
+            self._query_batcher = QueryEmbeddingBatcher(
+                lambda queries: self.scheduler.aembed_batches(self._pack_texts(queries))
+            )
+        vector = await self._query_batcher.embed(query)
+        self.query_cache.put(query, vector)
+        return vector
+
+    def get_cache_stats(self) -> dict:
+        """Returns the hit/miss counters of the embedding and query caches."""
+        stats = {"query_cache": self.query_cache.stats()}
+        if self.cache is not None:
+            stats["embedding_cache"] = self.cache.stats()
+        return stats
     
     def get_embedding_dimension(self) -> int:
         """Retrieve the dimensionality of the embedding model."""
+        if self.model in EMBEDDING_DIMENSIONS:
+            return EMBEDDING_DIMENSIONS[self.model]
         embedding_dim = len(self.embedding.embed_query("test"))
         return embedding_dim
         
@@ -44,4 +199,6 @@ if __name__ == "__main__":
     ]
 
     utility = UtilityOpenAI()
-    vectors = utility.create_embeddings_from_text(test_chunks)
\ No newline at end of file
+    vectors = utility.create_embeddings_from_text(test_chunks)
+    vectors = utility.create_embeddings_from_text(test_chunks)  # second pass is served from the cache
+    logger.debug(utility.get_cache_stats())
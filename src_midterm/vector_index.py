@@ -0,0 +1,378 @@
+import os
+import json
+import asyncio
+import threading
+import numpy as np
+from typing import Optional
+from logger import logger
+from metrics import span
+from qdrant import UtilityQdrant, point_id, merge_payloads, fill_linked_chunks, linked_payload, payload_matches
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "vector_index")
+
+
+class LocalVectorIndex:
+    """In-process vector store with the UtilityQdrant API, for corpora that fit in RAM.
+
+    Vectors live in a memory-mapped float32 matrix (normalized on insert, so cosine
+    similarity is a single matrix-vector product). Point ids and payloads are side
+    tables kept in memory and persisted as an append-only JSONL log next to the matrix.
+    """
+
+    def __init__(self, collection_name: str, embedding_dim: int = 1536, hit_score: float = 0.60, path: str = None):
+        self.COLLECTION_NAME = collection_name
+        self.hit_score = hit_score  # used for tuning the search results
+        self.dim = embedding_dim
+        # path=None keeps everything in memory, e.g. for benchmarks
+        self.path = path
+        self._lock = threading.RLock()
+        self._ids: list[Optional[str]] = []  # row -> point id, None once deleted
+        self._payloads: list[Optional[dict]] = []
+        self._rows: dict[str, int] = {}  # point id -> row
+        self._free: list[int] = []  # rows of deleted points, reused by later inserts
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._log = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+            self._log = open(self._log_path, "a", encoding="utf-8")
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "points.jsonl")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        """Replays the point log and maps the vector matrix from disk."""
+        if not os.path.exists(self._log_path):
+            return
+        rows = 0
+        with open(self._log_path, encoding="utf-8") as log:
+            for line in log:
+                entry = json.loads(line)
+                row = entry["row"]
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._payloads.append(None)
+                if entry.get("deleted"):
+                    self._ids[row] = self._payloads[row] = None
+                else:
+                    self._ids[row], self._payloads[row] = entry["id"], entry["payload"]
+                rows = max(rows, row + 1)
+
+        self._vectors = self._open_matrix(max(rows, 1))
+        self._alive = np.array([point is not None for point in self._ids], dtype=bool)
+        self._rows = {point: row for row, point in enumerate(self._ids) if point is not None}
+        self._free = [row for row, point in enumerate(self._ids) if point is None]
+        logger.info(f"Loaded {len(self._rows)} vectors for '{self.COLLECTION_NAME}' from {self.path}")
+
+    def _open_matrix(self, capacity: int) -> np.ndarray:
+        """Maps the on-disk matrix with room for at least capacity rows, growing the file if needed."""
+        size = capacity * self.dim * 4
+        mode = "r+" if os.path.exists(self._matrix_path) else "w+"
+        if mode == "r+" and os.path.getsize(self._matrix_path) < size:
+            with open(self._matrix_path, "r+b") as matrix:
+                matrix.truncate(size)
+        return np.memmap(self._matrix_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def _reserve(self, rows: int):
+        """Grows the matrix (doubling) so it holds at least rows rows."""
+        capacity = self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        if self.path is None:
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[: self._vectors.shape[0]] = self._vectors
+            self._vectors = grown
+        else:
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            self._vectors = self._open_matrix(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _write_log(self, entries: list[dict]):
+        if self._log is not None:
+            self._log.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self._log.flush()
+
+    def create_collection(self, collection_name, embedding_dim, quantization=None):
+        """Kept for API compatibility; a local index holds a single collection."""
+        if embedding_dim != self.dim:
+            raise ValueError(f"Index '{self.COLLECTION_NAME}' holds {self.dim}-dim vectors, not {embedding_dim}.")
+
+    def show_all_document_metadata(self):
+        """Displays all metadata for documents in the collection."""
+        for payload in self._payloads:
+            if payload is not None:
+                logger.info(payload)
+
+    def scroll_points(self, batch_size: int = 256, with_vectors: bool = False):
+        """Yields (point id, payload, vector or None) for every stored point, like UtilityQdrant.scroll_points."""
+        with self._lock:
+            rows = [row for row, point in enumerate(self._ids) if point is not None]
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = [
+                    (self._ids[row], self._payloads[row], self._vectors[row].tolist() if with_vectors else None)
+                    for row in rows[start:start + batch_size]
+                    if self._ids[row] is not None
+                ]
+            yield from batch
+
+    def count_points(self) -> int:
+        """Number of live points in the index."""
+        return len(self._rows)
+
+    async def aupsert_points(self, ids: list[str], vectors, payloads: list[dict]):
+        """Async version of upsert_points."""
+        await asyncio.to_thread(self.upsert_points, ids, vectors, payloads)
+
+    def upsert_points(self, ids: list[str], vectors, payloads: list[dict]):
+        """Inserts or overwrites points by id; vectors are normalized for cosine search."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            rows, assigned = [], {}
+            for point in ids:
+                row = self._rows.get(point, assigned.get(point))
+                if row is None:
+                    row = self._free.pop() if self._free else len(self._ids)
+                    if row == len(self._ids):
+                        self._ids.append(None)
+                        self._payloads.append(None)
+                    assigned[point] = row
+                rows.append(row)
+            self._reserve(len(self._ids))
+
+            self._vectors[rows] = vectors
+            self._alive[rows] = True
+            for row, point, payload in zip(rows, ids, payloads):
+                self._ids[row], self._payloads[row] = point, payload
+                self._rows[point] = row
+            self._write_log([{"row": row, "id": point, "payload": payload} for row, point, payload in zip(rows, ids, payloads)])
+            if self.path is not None:
+                self._vectors.flush()
+
+    def _delete_where(self, predicate) -> int:
+        with self._lock:
+            rows = [row for row, payload in enumerate(self._payloads) if payload is not None and predicate(payload)]
+            for row in rows:
+                del self._rows[self._ids[row]]
+                self._ids[row] = self._payloads[row] = None
+                self._alive[row] = False
+            self._free.extend(rows)
+            self._write_log([{"row": row, "deleted": True} for row in rows])
+        return len(rows)
+
+    def delete_document(self, document_id: str):
+        """Deletes all vectors associated with a given document_id."""
+        self._delete_where(lambda payload: payload.get("document_id") == document_id)
+        logger.info(f"Deleted all vectors for document_id: {document_id}")
+
+    def delete_documents(self, document_ids: list[str]):
+        """Deletes the vectors of many documents at once."""
+        wanted = set(document_ids)
+        self._delete_where(lambda payload: payload.get("document_id") in wanted)
+        logger.info(f"Deleted all vectors for {len(wanted)} documents")
+
+    def delete_documents_by_name(self, document_name: str, keep_document_id: str = None):
+        """Deletes all vectors loaded from the given file name, optionally keeping one document_id."""
+        self._delete_where(
+            lambda payload: payload.get("document_name") == document_name
+            and (keep_document_id is None or payload.get("document_id") != keep_document_id)
+        )
+        logger.info(f"Deleted stale vectors for document_name: {document_name}")
+
+    def insert_documents(self, collection_name, vectored_data, vectored_metadata, chunks: list[str] = None, first_chunk_number: int = 1):
+        """Inserts chunked documents with the same ids and payloads UtilityQdrant would store."""
+        if not isinstance(vectored_metadata, dict):
+            raise ValueError("Metadata must be a dictionary.")
+        if chunks is not None and len(chunks) != len(vectored_data):
+            raise ValueError("chunks must line up with vectored_data.")
+
+        document_id = vectored_metadata["document_id"]
+        ids, payloads = [], []
+        for offset in range(len(vectored_data)):
+            chunk_number = first_chunk_number + offset
+            payload = {**vectored_metadata, "chunk_number": chunk_number}
+            if chunks is not None:
+                payload["chunk_text"] = chunks[offset]
+            ids.append(point_id(document_id, chunk_number))
+            payloads.append(payload)
+
+        with span("vector_index_upsert"):
+            self.upsert_points(ids, vectored_data, payloads)
+        logger.debug("Inserted %d documents into local index '%s'", len(ids), collection_name)
+
+    async def ainsert_documents(self, collection_name, vectored_data, vectored_metadata, chunks: list[str] = None, first_chunk_number: int = 1):
+        """Async version of insert_documents; the disk writes run off the event loop."""
+        await asyncio.to_thread(
+            self.insert_documents, collection_name, vectored_data, vectored_metadata, chunks, first_chunk_number
+        )
+
+    def _payloads_by_id(self, ids) -> dict:
+        """Payloads of the given point ids that exist; the caller holds the lock."""
+        return {pid: self._payloads[self._rows[pid]] for pid in ids if pid in self._rows}
+
+    def get_chunks(self, document_id: str, chunk_numbers: list[int], links: dict = None) -> list[dict]:
+        """Fetches specific chunks of a document by their deterministic point IDs, filling linked ones like UtilityQdrant."""
+        links = {number: links[number] for number in chunk_numbers if number in links} if links else {}
+        with self._lock:
+            rows = [self._rows.get(point_id(document_id, number)) for number in chunk_numbers if number not in links]
+            payloads = [self._payloads[row] for row in rows if row is not None]
+            canonical = self._payloads_by_id(links.values())
+        return fill_linked_chunks(document_id, sorted(payloads, key=lambda payload: payload.get("chunk_number", 0)), links, canonical)
+
+    async def aget_chunks(self, document_id: str, chunk_numbers: list[int], links: dict = None) -> list[dict]:
+        """Async version of get_chunks; a dictionary lookup, so it runs inline."""
+        return self.get_chunks(document_id, chunk_numbers, links)
+
+    def promote_chunks(self, promotions) -> list[tuple[str, dict]]:
+        """Copies points to the linked chunks taking over from them, like UtilityQdrant.promote_chunks."""
+        templates, ids, vectors, payloads = {}, [], [], []
+        with self._lock:
+            for promotion in promotions:
+                row = self._rows.get(promotion.old_point_id)
+                if row is None:
+                    continue
+                if promotion.document_id not in templates:
+                    templates[promotion.document_id] = next(
+                        (payload for payload in self._payloads if payload is not None and payload.get("document_id") == promotion.document_id),
+                        None,
+                    )
+                ids.append(promotion.new_point_id)
+                vectors.append(self._vectors[row].copy())
+                payloads.append(linked_payload(
+                    templates[promotion.document_id], self._payloads[row], promotion.document_id, promotion.chunk_number, promotion.document_name
+                ))
+            if ids:
+                self.upsert_points(ids, vectors, payloads)
+        return list(zip(ids, payloads))
+
+    def get_document_chunks(self, document_id: str, links: dict = None) -> list[dict]:
+        """Returns every chunk payload of a document, ordered by chunk_number, with linked chunks filled in."""
+        with self._lock:
+            payloads = [payload for payload in self._payloads if payload is not None and payload.get("document_id") == document_id]
+            canonical = self._payloads_by_id(links.values()) if links else {}
+        return fill_linked_chunks(document_id, sorted(payloads, key=lambda payload: payload.get("chunk_number", 0)), links, canonical)
+
+    async def aget_document_chunks(self, document_id: str, links: dict = None) -> list[dict]:
+        """Async version of get_document_chunks."""
+        return self.get_document_chunks(document_id, links)
+
+    def reconstruct_document(self, document_id: str, links: dict = None) -> Optional[str]:
+        """Rebuilds a document's text from its stored (and linked) chunks, or None if that text would be incomplete."""
+        return merge_payloads(self.get_document_chunks(document_id, links))
+
+    async def areconstruct_document(self, document_id: str, links: dict = None) -> Optional[str]:
+        """Async version of reconstruct_document."""
+        return self.reconstruct_document(document_id, links)
+
+    def search(self, collection_name, query_vector, top_k=3, filters: dict = None) -> list:
+        """Exact cosine top-k over every stored vector, filtered by hit_score (and filters) like UtilityQdrant."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+
+        with span("vector_index_search"), self._lock:
+            count = len(self._ids)
+            return_hits = []
+            if self._rows:
+                scores = self._vectors[:count] @ query
+                scores[~self._alive[:count]] = -np.inf
+                candidates = len(self._rows)
+                if filters:
+                    excluded = [row for row, payload in enumerate(self._payloads) if payload is None or not payload_matches(payload, filters)]
+                    scores[excluded] = -np.inf
+                    candidates = count - len(excluded)
+                k = min(top_k, candidates)
+                top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+                for row in top[np.argsort(-scores[top])]:
+                    if scores[row] > self.hit_score:
+                        return_hits.append({"score": float(scores[row]), "metadata": self._payloads[row]})
+
+        if not return_hits:
+            logger.debug("No relevant documents found.")
+            return_hits.append({"score": 0, "metadata": "No relevant documents found."})
+        return return_hits
+
+    async def asearch(self, collection_name, query_vector, top_k=3, filters: dict = None) -> list:
+        """Async version of search; sub-millisecond, so it runs inline instead of in a thread."""
+        return self.search(collection_name, query_vector, top_k, filters)
+
+    def hydrate_from_qdrant(self, qdrant: UtilityQdrant, batch_size: int = 256) -> int:
+        """Copies every point (vector and payload) from a Qdrant collection into this index."""
+        copied, batch = 0, []
+        for point in qdrant.scroll_points(batch_size, with_vectors=True):
+            batch.append(point)
+            if len(batch) == batch_size:
+                self.upsert_points(*map(list, zip(*batch)))
+                copied, batch = copied + len(batch), []
+        if batch:
+            self.upsert_points(*map(list, zip(*batch)))
+            copied += len(batch)
+        logger.info(f"Hydrated {copied} vectors into '{self.COLLECTION_NAME}' from Qdrant")
+        return copied
+
+    def compact(self):
+        """Rewrites the point log without deleted rows; the matrix keeps its rows so ids stay put."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._log.close()
+            temp_path = self._log_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as log:
+                for row, (point, payload) in enumerate(zip(self._ids, self._payloads)):
+                    if point is not None:
+                        log.write(json.dumps({"row": row, "id": point, "payload": payload}) + "\n")
+            os.replace(temp_path, self._log_path)
+            self._log = open(self._log_path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+
+
+def create_vector_store(collection_name: str, embedding_dim: int = 1536, hit_score: float = 0.60):
+    """Builds the vector store selected by VECTOR_BACKEND: "qdrant" (default), "local" or "memory".
+
+    The local index is hydrated from Qdrant on first use when it is empty and
+    VECTOR_INDEX_HYDRATE=1, otherwise it fills up from ingestion.
+    """
+    backend = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+    if backend == "qdrant":
+        return UtilityQdrant(collection_name, embedding_dim, hit_score)
+    if backend == "memory":
+        return LocalVectorIndex(collection_name, embedding_dim, hit_score)
+    if backend != "local":
+        raise ValueError(f"Unknown VECTOR_BACKEND '{backend}', expected qdrant, local or memory.")
+
+    index = LocalVectorIndex(collection_name, embedding_dim, hit_score, path=os.path.join(INDEX_DIR, collection_name))
+    if not len(index) and os.getenv("VECTOR_INDEX_HYDRATE") == "1":
+        index.hydrate_from_qdrant(UtilityQdrant(collection_name, embedding_dim, hit_score))
+    return index
+
+
+if __name__ == "__main__":
+    print("Ready Player 1")
+    rng = np.random.default_rng(0)
+    index = LocalVectorIndex("qt_document_collection", embedding_dim=8, hit_score=0.5)
+    vectors = rng.standard_normal((3, 8)).tolist()
+    index.insert_documents("qt_document_collection", vectors, {"document_id": "doc1", "document_name": "test1"}, ["one", "two", "three"])
+    logger.info(index.search("qt_document_collection", vectors[1], 2))
+    logger.info(index.reconstruct_document("doc1"))